@@ -0,0 +1,195 @@
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.rate_limiter import RateLimiter
+from app.metrics import Metrics
+from app.retry import TRANSIENT_STATUS_CODES, CircuitBreakers, RetryPolicy
+from app.tracing import Tracer
+
+
+class ApiClient():
+    # Shared HTTP client for the BitBucket and GitHub APIs
+    # Keeps one pooled keep-alive session per host, so API calls reuse TCP+TLS connections instead of
+    # opening a new connection for every request
+    # GET requests made with cache=True are served from http_cache (an HttpCache) when one is given
+    # Requests to each host are scheduled by a RateLimiter, requests refused by a rate limit are paused and retried
+    # up to max_rate_limit_retries times instead of failing
+    # Connection errors and 5xx responses are retried with backoff by retry_policy (a RetryPolicy), requests that may
+    # have reached the host are only retried if their method is idempotent. Each host has a circuit breaker (shared
+    # with the git operations of RepoOps), so a degraded host gets a break instead of a retry storm
+    # Every request (with its retries) is timed as an "api" span of tracer (a Tracer, shared with RepoOps) and counted
+    # in metrics (a Metrics, shared with the tracer and RepoOps) by host, method and status code
+    def __init__(self,
+                 pool_size=10,
+                 timeout=30,
+                 http_cache=None,
+                 requests_per_second=None,
+                 max_rate_limit_retries=5,
+                 max_rate_limit_wait=3600,
+                 retry_policy=None,
+                 circuit_breakers=None,
+                 tracer=None,
+                 metrics=None,
+                 log=None):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.http_cache = http_cache
+        self.requests_per_second = requests_per_second
+        self.max_rate_limit_retries = max_rate_limit_retries
+        self.max_rate_limit_wait = max_rate_limit_wait
+        self.retry_policy = retry_policy if retry_policy else RetryPolicy()
+        self.circuit_breakers = circuit_breakers if circuit_breakers else CircuitBreakers(log=log)
+        self.metrics = metrics if metrics else Metrics()
+        self.tracer = tracer if tracer else Tracer(log, self.metrics)
+        self.log = log
+        self.default_headers = {"Accept": "application/json"}
+        self.sessions = {}
+        self.rate_limiters = {}
+        self.sessions_lock = threading.Lock()
+
+    # Returns the session and the rate limiter for the host of the url, makes them on the first request to a host
+    def get_session(self, url):
+        url_parts = urlsplit(url)
+        host_url = f"{url_parts.scheme}://{url_parts.netloc}"
+        with self.sessions_lock:
+            if (host_url not in self.sessions):
+                session = requests.Session()
+                session.headers.update(self.default_headers)
+                session.mount(host_url, HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size))
+                self.sessions[host_url] = session
+                self.rate_limiters[host_url] = RateLimiter(self.pool_size, self.requests_per_second,
+                                                           self.max_rate_limit_wait)
+            return self.sessions[host_url], self.rate_limiters[host_url]
+
+    def request(self, method, url, access_token=None, **kwargs):
+        host = urlsplit(url).netloc
+        start = time.perf_counter()
+        status = "error"
+        try:
+            with self.tracer.span("api", method=method, host=host):
+                response = self.send_request(method, url, access_token, **kwargs)
+            status = response.status_code
+            remaining = response.headers.get("X-RateLimit-Remaining")
+            if (remaining is not None and remaining.isdigit()):
+                self.metrics.set("git_migration_api_rate_limit_remaining", int(remaining), host=host)
+            return response
+        finally:
+            self.metrics.inc("git_migration_api_requests_total", host=host, method=method, status=status)
+            self.metrics.observe("git_migration_api_request_duration_seconds",
+                                 time.perf_counter() - start,
+                                 host=host,
+                                 method=method)
+
+    def send_request(self, method, url, access_token=None, **kwargs):
+        headers = kwargs.pop("headers", {})
+        if (access_token is not None):
+            headers["Authorization"] = f"Bearer {access_token}"
+        kwargs.setdefault("timeout", self.timeout)
+        session, rate_limiter = self.get_session(url)
+        circuit_breaker = self.circuit_breakers.get(urlsplit(url).hostname)
+        rate_limit_retries = 0
+        retries = 0
+        while (True):
+            circuit_breaker.before_request()
+            rate_limiter.acquire()
+            try:
+                response = session.request(method, url, headers=headers, **kwargs)
+            except requests.exceptions.RequestException as e:
+                circuit_breaker.record_failure()
+                if (retries >= self.retry_policy.max_retries or not RetryPolicy.is_retryable_error(method, e)):
+                    raise
+                response = None
+                error = e
+            except Exception:
+                # Ends a half-open probe too, the breaker would otherwise wait for the probe forever
+                circuit_breaker.record_failure()
+                raise
+            finally:
+                rate_limiter.release()
+            if (response is None):
+                retries += 1
+                self.wait_for_retry(method, url, retries, error=type(error).__name__)
+                continue
+            # Rate limited requests were not processed by the host, so they can be sent again (even POSTs)
+            wait = rate_limiter.update(response)
+            if (wait is not None):
+                circuit_breaker.record_success()
+                self.metrics.inc("git_migration_api_rate_limited_total", host=urlsplit(url).netloc)
+                if (rate_limit_retries >= self.max_rate_limit_retries):
+                    return response
+                rate_limit_retries += 1
+                if (self.log):
+                    self.log.warning("API rate limit reached, pausing requests",
+                                     host=urlsplit(url).netloc,
+                                     status_code=response.status_code,
+                                     wait_seconds=round(wait, 1),
+                                     retry=rate_limit_retries)
+                continue
+            if (response.status_code not in TRANSIENT_STATUS_CODES):
+                circuit_breaker.record_success()
+                return response
+            circuit_breaker.record_failure()
+            if (retries >= self.retry_policy.max_retries or not RetryPolicy.is_retryable_response(method, response)):
+                return response
+            retries += 1
+            self.wait_for_retry(method, url, retries, status_code=response.status_code)
+
+    # Backs off before the retry-th retry of a failed request
+    def wait_for_retry(self, method, url, retry, **details):
+        delay = self.retry_policy.get_delay(retry - 1)
+        self.metrics.inc("git_migration_api_retries_total", host=urlsplit(url).netloc)
+        if (self.log):
+            self.log.warning("API request failed, retrying",
+                             method=method,
+                             host=urlsplit(url).netloc,
+                             retry=retry,
+                             wait_seconds=round(delay, 1),
+                             **details)
+        time.sleep(delay)
+
+    # With cache=True, a cached response younger than cache_ttl seconds (the cache's default TTL if not given) is
+    # returned without a request. Older cached responses are revalidated with If-None-Match/If-Modified-Since
+    def get(self, url, access_token=None, cache=False, cache_ttl=None, **kwargs):
+        if (not (cache and self.http_cache)):
+            return self.request("GET", url, access_token, **kwargs)
+
+        cache_ttl = self.http_cache.default_ttl if (cache_ttl is None) else cache_ttl
+        cache_key = self.http_cache.get_cache_key("GET", url, access_token)
+        cache_entry = self.http_cache.get(cache_key)
+        headers = kwargs.pop("headers", {})
+        if (cache_entry is not None):
+            cached_response = cache_entry["response"]
+            if (time.time() - cache_entry["stored_at"] < cache_ttl):
+                return cached_response
+            # Revalidate the cached response with the server
+            if ("ETag" in cached_response.headers):
+                headers["If-None-Match"] = cached_response.headers["ETag"]
+            if ("Last-Modified" in cached_response.headers):
+                headers["If-Modified-Since"] = cached_response.headers["Last-Modified"]
+
+        response = self.request("GET", url, access_token, headers=headers, **kwargs)
+        if (response.status_code == 304 and cache_entry is not None):
+            self.http_cache.refresh(cache_key)
+            return cache_entry["response"]
+        if (response.status_code == 200):
+            self.http_cache.store(cache_key, response)
+        return response
+
+    def post(self, url, access_token=None, **kwargs):
+        return self.request("POST", url, access_token, **kwargs)
+
+    def put(self, url, access_token=None, **kwargs):
+        return self.request("PUT", url, access_token, **kwargs)
+
+    # Closes the connections of all sessions and the cache
+    def close(self):
+        with self.sessions_lock:
+            for session in self.sessions.values():
+                session.close()
+            self.sessions = {}
+        if (self.http_cache):
+            self.http_cache.close()
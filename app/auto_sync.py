@@ -0,0 +1,341 @@
+# Library imports
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Custom imports
+from app import utils
+from app.pipeline import Pipeline
+
+# Repositories that can wait between two stages of the pipeline of run_once()
+PIPELINE_QUEUE_SIZE = 64
+
+# Repositories assigned to their teams together by the teams stage of run_once()
+TEAM_BATCH_SIZE = 64
+
+
+class AutoSync:
+    # Syncs the repositories selected in the config file
+    # `sync auto` syncs every project once, `sync daemon` keeps the same object (and its caches) between cycles
+    # Up to `project_concurrency` projects are listed and synced at the same time, their repositories share the same
+    # `workers` threads. A project that fails is logged and skipped, the other projects are still synced
+    def __init__(self,
+                 repo_ops,
+                 cred_ops,
+                 push_to_org,
+                 bitbucket_account_id,
+                 bitbucket_access_token,
+                 github_account_id,
+                 github_access_token,
+                 console_log_level,
+                 console_log_normal,
+                 file_log_level,
+                 block_new_migrations=False,
+                 workers=1,
+                 api_concurrency=8,
+                 project_concurrency=1):
+        self.repo_ops = repo_ops
+        self.cred_ops = cred_ops
+        self.push_to_org = push_to_org
+        self.bitbucket_account_id = bitbucket_account_id
+        self.bitbucket_access_token = bitbucket_access_token
+        self.github_account_id = github_account_id
+        self.github_access_token = github_access_token
+        self.block_new_migrations = block_new_migrations
+        self.workers = workers
+        self.api_concurrency = api_concurrency
+        self.project_concurrency = project_concurrency
+        # Times each run, project and repository, shared with repo_ops
+        self.tracer = repo_ops.tracer
+        # Repositories of all projects are synced by this pool, so concurrent projects do not multiply the workers
+        self.sync_executor = ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="sync")
+        # The fetch and push stages of run_once() hold one of these `workers` slots while they run git, so both stages
+        # together sync at most `workers` repositories at once
+        self.git_slots = threading.BoundedSemaphore(max(workers, 1))
+        # Sync directory and results of each project of the current run_once()
+        self.sync_dir_path = None
+        self.project_results = {}
+        self.project_results_lock = threading.Lock()
+        # Synced repositories waiting to be assigned to their teams, as pipeline items
+        self.team_batch = []
+        self.team_batch_lock = threading.Lock()
+        self.log = utils.LogUtils.get_logger(os.path.basename(__file__), console_log_level, console_log_normal,
+                                             file_log_level)
+
+    # Check if credentials are right and can push to the chosen destination
+    def check_github_creds(self):
+        github_push_check = self.cred_ops.check_github_push_creds(self.push_to_org, self.github_account_id,
+                                                                  self.github_access_token)
+        github_pull_check = self.cred_ops.check_github_pull_creds(self.github_access_token)
+        return github_push_check and github_pull_check
+
+    # Returns the keys of the projects to sync from the config file
+    def get_project_keys(self):
+        to_include, _ = utils.ReadUtils.get_sync_config()
+        if (to_include is None):
+            return []
+        include_config = to_include["repo_config"] if ("repo_config" in to_include) else to_include
+        return list(include_config)
+
+    # Returns the repositories to sync from a project with their metadata and links
+    # Returns None if the project can not be accessed with the BitBucket credentials or its repositories not listed
+    def get_project_repos(self, project_key):
+        with self.tracer.span("project", project_key=project_key):
+            return self.list_project_repos(project_key)
+
+    def list_project_repos(self, project_key):
+        to_include, to_exclude = utils.ReadUtils.get_sync_config()
+
+        # Check credentials for given project
+        bitbucket_pull_check = self.cred_ops.check_bitbucket_pull_creds(project_key, self.bitbucket_access_token)
+        if (not bitbucket_pull_check):
+            return None
+
+        repo_names = self.repo_ops.get_bitbucket_repos(project_key, self.bitbucket_access_token)
+        if (repo_names is None):
+            return None
+        repositories = self.repo_ops.populate_team_info(project_key, repo_names, to_include, to_exclude,
+                                                        self.github_access_token)
+        if (not repositories):
+            return []
+        processed_repos, total_repos, new_repos = self.repo_ops.process_repos(
+            project_key, repositories, self.push_to_org, self.bitbucket_access_token, self.github_account_id,
+            self.github_access_token, self.api_concurrency)
+        # Sync only the repos that already exist on GitHub
+        if (self.block_new_migrations):
+            processed_repos = [repo for repo in processed_repos if ('github_link' in repo)]
+        return processed_repos
+
+    # Same as get_project_repos(), but any error of the project is logged and None is returned instead of raising
+    def try_get_project_repos(self, project_key):
+        try:
+            return self.get_project_repos(project_key)
+        except Exception as e:
+            self.log.error("Failed to list repositories of project",
+                           result="FAILED",
+                           project_key=project_key,
+                           error=repr(e))
+            return None
+
+    # Syncs the repositories and returns the sync result of each repository
+    def sync_repos(self, repositories):
+        return self.repo_ops.sync_repos(self.push_to_org,
+                                        repositories,
+                                        self.bitbucket_account_id,
+                                        self.bitbucket_access_token,
+                                        self.github_account_id,
+                                        self.github_access_token,
+                                        self.workers,
+                                        executor=self.sync_executor)
+
+    # Syncs only the changed refs of repositories that already exist on GitHub, in parallel
+    # repo_refs is a list of (repository, changed refs) tuples, returns the sync result of each repository
+    # An error of one repository fails that repository, the others are still synced
+    def sync_changed_refs(self, repo_refs):
+        def sync_repo_refs_task(repo_and_refs):
+            repo, changed_refs = repo_and_refs
+            try:
+                return self.repo_ops.sync_repo_refs(repo, changed_refs, self.bitbucket_account_id,
+                                                    self.bitbucket_access_token, self.github_account_id,
+                                                    self.github_access_token)
+            except Exception as e:
+                self.log.error("Failed to sync changed refs of repository",
+                               result="FAILED",
+                               repo_name=repo["name"],
+                               error=repr(e))
+                sync_result = self.repo_ops.make_sync_result(repo["name"])
+                self.repo_ops.count_sync_result(sync_result)
+                return sync_result
+
+        return list(self.sync_executor.map(sync_repo_refs_task, repo_refs))
+
+    # Syncs all projects once as a pipeline, every repository moves on to the next stage as soon as it is ready:
+    # - discover: lists the projects page by page and selects the repositories (project_concurrency threads)
+    # - metadata: looks the repositories up on GitHub (api_concurrency threads)
+    # - create: makes the new repositories on GitHub (api_concurrency threads)
+    # - fetch, push: fetches the refs from BitBucket and pushes them to GitHub (workers threads each, sharing the
+    #   `workers` git slots)
+    # - teams: assigns the repositories to their teams in batches of TEAM_BATCH_SIZE repositories, the last batch when
+    #   all repositories went through the pipeline (api_concurrency threads per batch)
+    # Returns False if any project failed
+    def run_once(self):
+        project_keys = self.get_project_keys()
+        if (not project_keys):
+            self.log.warning("Nothing to include")
+            return True
+
+        self.sync_dir_path = self.repo_ops.make_sync_dir()
+        self.project_results = {
+            project_key: {
+                "failed": False,
+                "total_repos": 0,
+                "new_repos": 0,
+                "failed_repos": []
+            }
+            for project_key in project_keys
+        }
+        pipeline = Pipeline(PIPELINE_QUEUE_SIZE, on_error=self.on_stage_error)
+        pipeline.add_stage("discover", self.discover_stage, self.project_concurrency)
+        pipeline.add_stage("metadata", self.metadata_stage, self.api_concurrency)
+        pipeline.add_stage("create", self.create_stage, self.api_concurrency)
+        pipeline.add_stage("fetch", self.fetch_stage, self.workers)
+        pipeline.add_stage("push", self.push_stage, self.workers)
+        pipeline.add_stage("teams", self.teams_stage)
+        self.repo_ops.metrics.set_gauge_callback(
+            "git_migration_pipeline_queue_depth", lambda: [({
+                "stage": stage_name
+            }, queue_size) for stage_name, queue_size in pipeline.get_queue_sizes()])
+        with self.tracer.run("auto", projects=len(project_keys)):
+            pipeline.run(project_keys)
+            team_batch, self.team_batch = self.team_batch, []
+            if (team_batch):
+                self.assign_teams(team_batch)
+
+        for project_key, project_result in self.project_results.items():
+            self.log.info("Synced repositories",
+                          project_key=project_key,
+                          total_repos=project_result["total_repos"],
+                          migrated_repos=project_result["new_repos"],
+                          synced_repos=project_result["total_repos"] - len(project_result["failed_repos"]),
+                          failed_repos=project_result["failed_repos"])
+        failed_projects = [project_key for project_key in project_keys if (self.project_results[project_key]["failed"])]
+        if (failed_projects):
+            self.log.error("Failed to sync projects", result="FAILED", failed_projects=failed_projects)
+        return not failed_projects
+
+    # Lists the repositories of a project from BitBucket page by page and passes on the selected ones
+    # The span of the project also counts the time spent waiting for the next stage to take its repositories
+    def discover_stage(self, project_key, emit):
+        with self.tracer.span("project", project_key=project_key):
+            self.discover_project_repos(project_key, emit)
+
+    def discover_project_repos(self, project_key, emit):
+        to_include, to_exclude = utils.ReadUtils.get_sync_config()
+
+        # Check credentials for given project
+        if (not self.cred_ops.check_bitbucket_pull_creds(project_key, self.bitbucket_access_token)):
+            self.project_results[project_key]["failed"] = True
+            return
+        repo_matcher = self.repo_ops.get_repo_matcher(project_key, to_include, to_exclude)
+        if (repo_matcher.is_empty()):
+            self.log.warning("Nothing to include", project_key=project_key)
+            return
+        team_ids = self.repo_ops.get_config_team_ids(project_key, repo_matcher, self.github_access_token)
+
+        self.log.info("Fetching repository list", project_key=project_key)
+        # Rules for repository names that are not on any page
+        not_found = None
+        start = 0
+        while (start is not None):
+            repos_page = self.repo_ops.get_bitbucket_repos_page(project_key, self.bitbucket_access_token, start)
+            if (repos_page is None):
+                self.project_results[project_key]["failed"] = True
+                return
+            project_repos, start = repos_page
+            repo_details = {repo["name"]: self.repo_ops.get_bitbucket_repo_details(repo) for repo in project_repos}
+            repositories, page_not_found = self.repo_ops.select_repos(repo_matcher, list(repo_details), team_ids)
+            if (not_found is None):
+                not_found = page_not_found
+            else:
+                page_not_found_ids = set(id(rule) for rule in page_not_found)
+                not_found = [rule for rule in not_found if (id(rule) in page_not_found_ids)]
+            for repo in repositories:
+                repo.update(repo_details[repo["name"]])
+                emit({"project_key": project_key, "repo": repo})
+        self.repo_ops.log_rules_not_found(project_key, not_found)
+
+    # Adds the metadata and GitHub link of a repository
+    def metadata_stage(self, item, emit):
+        # Existence of repositories on GitHub is looked up in the index, falls back to a request per repository
+        github_repo_index = self.repo_ops.get_github_repo_index(self.push_to_org, self.github_access_token)
+        process_result = self.repo_ops.process_repo(item["project_key"], item["repo"], self.push_to_org,
+                                                    self.bitbucket_access_token, self.github_account_id,
+                                                    self.github_access_token, github_repo_index)
+        if (process_result is None):
+            return
+        repo, is_new_repo = process_result
+        # Sync only the repos that already exist on GitHub
+        if (is_new_repo and self.block_new_migrations):
+            return
+        item["sync_result"] = self.repo_ops.make_sync_result(repo["name"])
+        emit(item)
+
+    # Makes the repository on GitHub if it is new
+    def create_stage(self, item, emit):
+        if (not self.repo_ops.make_github_repo(self.push_to_org, item["repo"], self.github_account_id,
+                                               self.github_access_token)):
+            self.add_sync_result(item)
+            return
+        emit(item)
+
+    # The git slot is released before the repository is passed on, a stage waiting for the next one holds no slot
+    def fetch_stage(self, item, emit):
+        with self.git_slots:
+            item["needs_push"] = self.repo_ops.fetch_repo(item["repo"], item["sync_result"], self.sync_dir_path,
+                                                          self.bitbucket_account_id, self.bitbucket_access_token,
+                                                          self.github_account_id, self.github_access_token)
+        emit(item)
+
+    def push_stage(self, item, emit):
+        if (item["needs_push"]):
+            with self.git_slots:
+                self.repo_ops.push_repo(item["repo"], item["sync_result"], self.bitbucket_account_id,
+                                        self.bitbucket_access_token, self.github_account_id, self.github_access_token)
+        emit(item)
+
+    # Adds the repository to the batch of repositories to assign to their teams, assigns the batch once it is full
+    # Repositories without teams are done
+    def teams_stage(self, item, emit):
+        if (not self.push_to_org or not item["repo"].get("teams")):
+            self.add_sync_result(item)
+            return
+        with self.team_batch_lock:
+            self.team_batch.append(item)
+            if (len(self.team_batch) < TEAM_BATCH_SIZE):
+                return
+            team_batch, self.team_batch = self.team_batch, []
+        self.assign_teams(team_batch)
+
+    # Assigns a batch of repositories to their teams, the team IDs and the repositories of the teams are fetched once
+    # An error fails the team assignments of the batch, the repositories are still done
+    def assign_teams(self, team_batch):
+        try:
+            self.repo_ops.assign_teams([item["repo"] for item in team_batch],
+                                       [item["sync_result"] for item in team_batch], self.github_access_token,
+                                       self.api_concurrency)
+        except Exception as e:
+            self.log.error("Failed to assign repositories to teams",
+                           result="FAILED",
+                           repo_names=[item["repo"]["name"] for item in team_batch],
+                           error=repr(e))
+        for item in team_batch:
+            self.add_sync_result(item)
+
+    # Adds the sync result of a repository that is done to the results of its project
+    def add_sync_result(self, item):
+        with self.project_results_lock:
+            project_result = self.project_results[item["project_key"]]
+            project_result["total_repos"] += 1
+            if (item["repo"].get("new_migration")):
+                project_result["new_repos"] += 1
+            if (item["sync_result"]["result"] == "FAILED"):
+                project_result["failed_repos"].append(item["sync_result"]["name"])
+        self.repo_ops.count_sync_result(item["sync_result"])
+
+    # Errors of a stage fail the project (discover stage) or the repository (any other stage), not the whole run
+    def on_stage_error(self, stage_name, item, error):
+        if (stage_name == "discover"):
+            self.log.error("Failed to list repositories of project",
+                           result="FAILED",
+                           project_key=item,
+                           error=repr(error))
+            self.project_results[item]["failed"] = True
+            return
+        self.log.error("Failed to sync repository",
+                       result="FAILED",
+                       stage=stage_name,
+                       project_key=item["project_key"],
+                       repo_name=item["repo"]["name"],
+                       error=repr(error))
+        item.setdefault("sync_result", self.repo_ops.make_sync_result(item["repo"]["name"]))
+        self.add_sync_result(item)
@@ -2,7 +2,7 @@ import os
 import sys
 import click
 import logging
-from app import utils
+from app import config
 
 # FORMAT = '%(asctime)s %(levelname)s:%(filename)s:%(lineno)d %(message)s'
 # logging.basicConfig(format=FORMAT, level=logging.INFO)
@@ -15,17 +15,26 @@ class Context(object):
     def __init__(self):
         self.verbose = False
         self.home = os.getcwd()
+        self.logger = None
 
-    def log(self, msg, *args):
-        """Logs a message to stderr."""
-        if args:
-            msg %= args
-        # click.echo(msg, file=sys.stderr)
+    # The logger (and the logs directory and files) is only made when a command logs something
+    @property
+    def log(self):
+        if (self.logger is None):
+            from app import utils
+            self.logger = utils.LogUtils.get_logger(os.path.basename(__file__), self.console_log_level,
+                                                    self.console_log_normal, self.file_log_level)
+        return self.logger
 
     def vlog(self, msg, *args):
-        """Logs a message to stderr only if verbose is enabled."""
+        """Logs a message only if verbose is enabled."""
         if self.verbose:
-            self.log(msg, *args)
+            self.log.debug(msg % args if args else msg)
+
+
+# Default value of an option read from config.yml, only when the option is not given on the command line
+def config_default(key):
+    return lambda: getattr(config.ConfigUtils.get_config(), key)
 
 
 pass_context = click.make_pass_decorator(Context, ensure=True)
@@ -53,20 +62,37 @@ class AppCLI(click.MultiCommand):
             return
         return mod.cli
 
+    # Show errors in config.yml as usage errors instead of tracebacks
+    def make_context(self, info_name, args, parent=None, **extra):
+        try:
+            return super(AppCLI, self).make_context(info_name, args, parent=parent, **extra)
+        except config.ConfigError as error:
+            raise click.ClickException(str(error))
+
+    def invoke(self, ctx):
+        try:
+            return super(AppCLI, self).invoke(ctx)
+        except config.ConfigError as error:
+            raise click.ClickException(str(error))
+
 
 @click.command(cls=AppCLI, context_settings=CONTEXT_SETTINGS)
 @click.option('-v', '--verbose', is_flag=True, help='Enables verbose mode.')
 @click.option('--console-log-level',
-              type=click.Choice(['debug', 'info', 'warning', 'error', 'critical'], case_sensitive=False),
-              default=utils.LogUtils.get_console_log_level(),
+              type=click.Choice(config.LOG_LEVELS, case_sensitive=False),
+              default=config_default('console_log_level'),
+              show_default='config.yml console_log_level',
               help="Filter logs to show on STDOUT")
 @click.option('--console-log-normal',
               is_flag=True,
-              default=utils.LogUtils.get_console_log_normal(),
+              flag_value=True,
+              default=config_default('console_log_normal'),
+              show_default='config.yml console_log_normal',
               help="Print normal logs to STDOUT instead of JSON")
 @click.option('--file-log-level',
-              type=click.Choice(['debug', 'info', 'warning', 'error', 'critical'], case_sensitive=False),
-              default=utils.LogUtils.get_file_log_level(),
+              type=click.Choice(config.LOG_LEVELS, case_sensitive=False),
+              default=config_default('file_log_level'),
+              show_default='config.yml file_log_level',
               help="Filter logs to print to file")
 @pass_context
 def app(ctx, verbose, console_log_level, console_log_normal, file_log_level):
@@ -75,5 +101,3 @@ def app(ctx, verbose, console_log_level, console_log_normal, file_log_level):
     ctx.console_log_level = console_log_level
     ctx.console_log_normal = console_log_normal
     ctx.file_log_level = file_log_level
-    ctx.log = utils.LogUtils.get_logger(os.path.basename(__file__), console_log_level, console_log_normal,
-                                        file_log_level)
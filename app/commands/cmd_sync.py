@@ -4,10 +4,8 @@ import os
 import sys
 
 # Custom imports
-from app import utils
-from app import repo_operations
-from app import cred_operations
-from app import interactive_sync
+# The operations modules (and sh, requests, questionary, structlog) are imported by the commands that use them,
+# so that --help and the other commands start fast
 from app import cli as app_cli
 
 
@@ -64,20 +62,83 @@ def is_interactive():
 @click.option('--prefix',
               prompt=not is_help_called() and is_interactive(),
               required=not is_help_called() and not is_interactive(),
-              default=utils.ReadUtils.get_prefix(),
-              show_default=utils.ReadUtils.get_prefix(),
+              default=app_cli.config_default('prefix'),
+              show_default='config.yml prefix',
               type=str,
               help="Prefix to be added to the names of sync'd repositories at destination")
 @click.option('--master-branch-prefix',
               prompt=not is_help_called() and is_interactive(),
               required=not is_help_called() and not is_interactive(),
-              default=utils.ReadUtils.get_master_branch_prefix(),
-              show_default=utils.ReadUtils.get_master_branch_prefix(),
+              default=app_cli.config_default('master_branch_prefix'),
+              show_default='config.yml master_branch_prefix',
               type=str,
               help="Prefix to be added to rename the master branch from BitBucket")
+@click.option('--api-pool-size',
+              default=10,
+              show_default=True,
+              type=click.IntRange(min=1),
+              help="Number of keep-alive connections to keep open to each API host")
+@click.option('--api-timeout',
+              default=30,
+              show_default=True,
+              type=click.FloatRange(min=0),
+              help="Timeout in seconds for API requests")
+@click.option('--api-rate-limit',
+              default=0,
+              show_default=True,
+              type=click.FloatRange(min=0),
+              help="Maximum API requests per second to each host, 0 adapts to the rate limits of the hosts only")
+@click.option('--api-rate-limit-retries',
+              default=5,
+              show_default=True,
+              type=click.IntRange(min=0),
+              help="Number of times an API request refused by a rate limit is retried after pausing")
+@click.option('--api-rate-limit-max-wait',
+              default=3600,
+              show_default=True,
+              type=click.IntRange(min=0),
+              help="Longest pause in seconds after an API rate limit was reached")
+@click.option('--retries',
+              default=3,
+              show_default=True,
+              type=click.IntRange(min=0),
+              help="Retries of API requests and git fetches/pushes that failed with a connection or server error")
+@click.option('--retry-base-delay',
+              default=1.0,
+              show_default=True,
+              type=click.FloatRange(min=0),
+              help="Seconds to back off before the first retry, doubled for every further retry (with jitter)")
+@click.option('--retry-max-delay',
+              default=30.0,
+              show_default=True,
+              type=click.FloatRange(min=0),
+              help="Longest back off in seconds between two retries")
+@click.option('--circuit-breaker-threshold',
+              default=5,
+              show_default=True,
+              type=click.IntRange(min=0),
+              help="Consecutive failures after which requests to a host are paused (0 to never pause)")
+@click.option('--circuit-breaker-reset',
+              default=30,
+              show_default=True,
+              type=click.IntRange(min=1),
+              help="Seconds to pause requests to a failing host before probing it again")
+@click.option('--no-cache', is_flag=True, help="Do not use or update the on-disk cache of API responses")
+@click.option('--cache-ttl',
+              default=300,
+              show_default=True,
+              type=click.IntRange(min=0),
+              help="Seconds for which cached API responses are used without revalidating them")
+@click.option('--cache-max-size',
+              default=64,
+              show_default=True,
+              type=click.IntRange(min=1),
+              help="Maximum size of the API response cache in MB")
 @app_cli.pass_context
 def cli(ctx, bitbucket_url, github_url, bitbucket_account_id, bitbucket_access_token, github_account_id,
-        github_access_token, prefix, master_branch_prefix):
+        github_access_token, prefix, master_branch_prefix, api_pool_size, api_timeout, api_rate_limit,
+        api_rate_limit_retries, api_rate_limit_max_wait, retries, retry_base_delay, retry_max_delay,
+        circuit_breaker_threshold, circuit_breaker_reset, no_cache, cache_ttl, cache_max_size):
     """Sync Bitbucket and GitHub repositories"""
     ctx.bitbucket_api = bitbucket_url
     ctx.github_api = github_url
@@ -87,68 +148,217 @@ def cli(ctx, bitbucket_url, github_url, bitbucket_account_id, bitbucket_access_t
     ctx.github_access_token = github_access_token
     ctx.prefix = prefix
     ctx.master_branch_prefix = master_branch_prefix
+    ctx.api_options = {
+        "pool_size": api_pool_size,
+        "timeout": api_timeout,
+        "rate_limit": api_rate_limit,
+        "rate_limit_retries": api_rate_limit_retries,
+        "rate_limit_max_wait": api_rate_limit_max_wait,
+        "retries": retries,
+        "retry_base_delay": retry_base_delay,
+        "retry_max_delay": retry_max_delay,
+        "circuit_breaker_threshold": circuit_breaker_threshold,
+        "circuit_breaker_reset": circuit_breaker_reset,
+        "no_cache": no_cache,
+        "cache_ttl": cache_ttl,
+        "cache_max_size": cache_max_size
+    }
+    ctx.api_client = None
+    ctx.metrics = None
+
+
+# Make the API client shared by all operations of the command, on first use
+def get_api_client(ctx):
+    if (ctx.api_client is None):
+        from app import api_client, http_cache, retry
+        api_cache = None
+        if (not ctx.api_options["no_cache"]):
+            api_cache = http_cache.HttpCache(os.path.join(os.getcwd(), ".cache",
+                                                          "http_cache.sqlite3"), ctx.api_options["cache_ttl"],
+                                             ctx.api_options["cache_max_size"] * 1024 * 1024)
+        retry_policy = retry.RetryPolicy(ctx.api_options["retries"], ctx.api_options["retry_base_delay"],
+                                         ctx.api_options["retry_max_delay"])
+        circuit_breakers = retry.CircuitBreakers(ctx.api_options["circuit_breaker_threshold"],
+                                                 ctx.api_options["circuit_breaker_reset"],
+                                                 log=ctx.log)
+        ctx.api_client = api_client.ApiClient(ctx.api_options["pool_size"],
+                                              ctx.api_options["timeout"],
+                                              api_cache,
+                                              requests_per_second=ctx.api_options["rate_limit"] or None,
+                                              max_rate_limit_retries=ctx.api_options["rate_limit_retries"],
+                                              max_rate_limit_wait=ctx.api_options["rate_limit_max_wait"],
+                                              retry_policy=retry_policy,
+                                              circuit_breakers=circuit_breakers,
+                                              metrics=ctx.metrics,
+                                              log=ctx.log)
+    return ctx.api_client
+
+
+# Options shared by the commands that sync the repositories selected in the config file
+def auto_sync_options(command):
+    options = [
+        click.option('--personal-account',
+                     is_flag=True,
+                     help="Migrates/Syncs the repositories to personal GitHub account"),
+        click.option('--block-new-migrations',
+                     is_flag=True,
+                     help="Block new migrations and sync only existing repos on GitHub"),
+        click.option('--workers',
+                     default=1,
+                     show_default=True,
+                     type=click.IntRange(min=1),
+                     help="Number of repositories to sync in parallel"),
+        click.option('--push-batch-size',
+                     default=0,
+                     show_default=True,
+                     type=click.IntRange(min=0),
+                     help="Number of tags/branches to push with a single git push, 0 pushes every ref individually"),
+        click.option('--api-concurrency',
+                     default=8,
+                     show_default=True,
+                     type=click.IntRange(min=1),
+                     help="Number of repositories to look up on BitBucket and GitHub in parallel"),
+        click.option('--project-concurrency',
+                     default=4,
+                     show_default=True,
+                     type=click.IntRange(min=1),
+                     help="Number of projects to list and sync in parallel, their repositories share the --workers"),
+        click.option('--metrics-port',
+                     type=click.IntRange(min=0, max=65535),
+                     help="Serve Prometheus metrics at http://<metrics-host>:PORT/metrics"),
+        click.option('--metrics-host',
+                     default='127.0.0.1',
+                     show_default=True,
+                     type=str,
+                     help="Address to serve the Prometheus metrics on"),
+        click.option('--metrics-textfile',
+                     type=click.Path(dir_okay=False, writable=True),
+                     help="Write the Prometheus metrics to this file after every run, for the node exporter textfile "
+                     "collector (use a .prom file in its --collector.textfile.directory)")
+    ]
+    for option in reversed(options):
+        command = option(command)
+    return command
+
+
+# Make the metrics shared by all operations of the command, and serve them on metrics_port if given
+# Must be called before the API client is made
+def start_metrics(ctx, metrics_port, metrics_host, metrics_textfile):
+    from app import metrics
+    ctx.metrics = metrics.Metrics(metrics_textfile)
+    if (metrics_port is not None):
+        metrics.MetricsServer(ctx.metrics, metrics_host, metrics_port, ctx.log).start()
+
+
+# Make the object that syncs the repositories selected in the config file
+def make_auto_sync(ctx, personal_account, block_new_migrations, workers, push_batch_size, api_concurrency,
+                   project_concurrency):
+    from app import auto_sync, cred_operations, repo_operations
+    cred_ops = cred_operations.CredOps(ctx.bitbucket_api, ctx.github_api, ctx.console_log_level, ctx.console_log_normal,
+                                       ctx.file_log_level, get_api_client(ctx))
+    repo_ops = repo_operations.RepoOps(ctx.bitbucket_api, ctx.github_api, ctx.prefix, ctx.master_branch_prefix,
+                                       ctx.console_log_level, ctx.console_log_normal, ctx.file_log_level,
+                                       push_batch_size, get_api_client(ctx))
+    return auto_sync.AutoSync(repo_ops, cred_ops, not personal_account, ctx.bitbucket_account_id,
+                              ctx.bitbucket_access_token, ctx.github_account_id, ctx.github_access_token,
+                              ctx.console_log_level, ctx.console_log_normal, ctx.file_log_level, block_new_migrations,
+                              workers, api_concurrency, project_concurrency)
 
 
 @cli.command()
 @click.option('--run-once', is_flag=True, help="Syncs the repositories once")
-@click.option('--personal-account', is_flag=True, help="Migrates/Syncs the repositories to personal GitHub account")
-@click.option('--block-new-migrations',
-              is_flag=True,
-              help="Block new migrations and sync only existing repos on GitHub")
+@auto_sync_options
 @app_cli.pass_context
-# TODO By default run in a loop after fixed time intervals
-def auto(ctx, run_once, personal_account, block_new_migrations):
+def auto(ctx, run_once, personal_account, block_new_migrations, workers, push_batch_size, api_concurrency,
+         project_concurrency, metrics_port, metrics_host, metrics_textfile):
     """Automatically sync all according to config file"""
     # Use ctx.log.info("message") to log
-    push_to_org = not personal_account
-    cred_ops = cred_operations.CredOps(ctx.bitbucket_api, ctx.github_api, ctx.console_log_level, ctx.console_log_normal,
-                                       ctx.file_log_level)
-    repo_ops = repo_operations.RepoOps(ctx.bitbucket_api, ctx.github_api, ctx.prefix, ctx.master_branch_prefix,
-                                       ctx.console_log_level, ctx.console_log_normal, ctx.file_log_level)
+    # Use `sync daemon` to keep syncing in a loop
+    start_metrics(ctx, metrics_port, metrics_host, metrics_textfile)
+    auto_sync = make_auto_sync(ctx, personal_account, block_new_migrations, workers, push_batch_size, api_concurrency,
+                               project_concurrency)
 
     # Check if credentials are right and can push to the chosen destination
-    github_push_check = cred_ops.check_github_push_creds(push_to_org, ctx.github_account_id, ctx.github_access_token)
-    github_pull_check = cred_ops.check_github_pull_creds(ctx.github_access_token)
-    if (not (github_push_check and github_pull_check)):
+    if (not auto_sync.check_github_creds()):
         exit(0)
 
-    to_include, to_exclude = utils.ReadUtils.get_sync_config()
+    if (not auto_sync.get_project_keys()):
+        ctx.log.warning("Nothing to include")
+        exit(0)
+
+    # Put an exit(0) just before sync_repos() for testing other functionality without syncing
+    if (not auto_sync.run_once()):
+        exit(1)
+
+
+@cli.command()
+@auto_sync_options
+@click.option('--min-interval',
+              default=60,
+              show_default=True,
+              type=click.IntRange(min=1),
+              help="Seconds after which a repository that changed is checked again")
+@click.option('--max-interval',
+              default=3600,
+              show_default=True,
+              type=click.IntRange(min=1),
+              help="Longest time in seconds between two checks of a repository that does not change")
+@click.option('--discovery-interval',
+              default=600,
+              show_default=True,
+              type=click.IntRange(min=1),
+              help="Seconds between listing the projects again for new and deleted repositories")
+@click.option('--webhook-port',
+              type=click.IntRange(min=0, max=65535),
+              help="Listen for BitBucket Server repo:refs_changed webhooks on this port and sync the changed refs")
+@click.option('--webhook-host',
+              default='0.0.0.0',
+              show_default=True,
+              type=str,
+              help="Address to listen for webhooks on")
+@click.option('--webhook-secret',
+              default=lambda: os.environ.get('GIT_MIGRATION_WEBHOOK_SECRET'),
+              show_default='env GIT_MIGRATION_WEBHOOK_SECRET',
+              type=str,
+              help="Secret of the BitBucket webhook, unsigned requests are rejected when set")
+@click.option('--webhook-debounce',
+              default=2,
+              show_default=True,
+              type=click.FloatRange(min=0),
+              help="Seconds to wait for more webhook events of the same repository before syncing it")
+@app_cli.pass_context
+def daemon(ctx, personal_account, block_new_migrations, workers, push_batch_size, api_concurrency, project_concurrency,
+           metrics_port, metrics_host, metrics_textfile, min_interval, max_interval, discovery_interval, webhook_port,
+           webhook_host, webhook_secret, webhook_debounce):
+    """Keep syncing according to config file, checking active repositories more often"""
+    from app import sync_daemon, webhook
+    start_metrics(ctx, metrics_port, metrics_host, metrics_textfile)
+    auto_sync = make_auto_sync(ctx, personal_account, block_new_migrations, workers, push_batch_size, api_concurrency,
+                               project_concurrency)
+
+    # Check if credentials are right and can push to the chosen destination
+    if (not auto_sync.check_github_creds()):
+        exit(0)
 
-    if to_include is None:
+    if (not auto_sync.get_project_keys()):
         ctx.log.warning("Nothing to include")
         exit(0)
-    include_config = to_include["repo_config"] if ("repo_config" in to_include) else to_include
-
-    for project_key in include_config:
-        # Check credentials for given project
-        bitbucket_pull_check = cred_ops.check_bitbucket_pull_creds(project_key, ctx.bitbucket_access_token)
-        if (not bitbucket_pull_check):
-            exit(1)
-
-        repo_names = repo_ops.get_bitbucket_repos(project_key, ctx.bitbucket_access_token)
-        repositories = repo_ops.populate_team_info(project_key, repo_names, to_include, to_exclude,
-                                                   ctx.github_access_token)
-        if not repositories:
-            continue
-        processed_repos, total_repos, new_repos = repo_ops.process_repos(project_key, repositories, push_to_org,
-                                                                         ctx.bitbucket_access_token,
-                                                                         ctx.github_account_id, ctx.github_access_token)
-        # Sync only the repos that already exist on GitHub
-        if (block_new_migrations):
-            processed_repos = [repo for repo in processed_repos if ('github_link' in repo)]
-
-        # Put an exit(0) just before this for testing other functionality without syncing
-        # Sync the filtered repositories repositories
-        repo_ops.sync_repos(push_to_org, processed_repos, ctx.bitbucket_account_id, ctx.bitbucket_access_token,
-                            ctx.github_account_id, ctx.github_access_token)
+
+    webhook_listener = None
+    if (webhook_port is not None):
+        webhook_listener = webhook.WebhookListener(webhook_host, webhook_port, webhook_secret, webhook_debounce,
+                                                   ctx.console_log_level, ctx.console_log_normal, ctx.file_log_level)
+    sync_daemon.SyncDaemon(auto_sync, ctx.console_log_level, ctx.console_log_normal, ctx.file_log_level, min_interval,
+                           max_interval, discovery_interval, webhook_listener).run()
 
 
 @cli.command()
 @app_cli.pass_context
 def interactive(ctx):
     """Select the projects and repositories to migrate/sync"""
+    from app import interactive_sync
     # Use ctx.log.info("message") to log
     interactive_sync.start_session(ctx.bitbucket_account_id, ctx.bitbucket_access_token, ctx.github_account_id,
                                    ctx.github_access_token, ctx.bitbucket_api, ctx.github_api, ctx.prefix,
                                    ctx.master_branch_prefix, ctx.console_log_level, ctx.console_log_normal,
-                                   ctx.file_log_level)
+                                   ctx.file_log_level, get_api_client(ctx))
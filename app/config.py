@@ -0,0 +1,134 @@
+import collections
+import functools
+import os
+import re
+import types
+
+LOG_LEVELS = ("debug", "info", "warning", "error", "critical")
+
+
+class ConfigError(Exception):
+    pass
+
+
+# Settings read from config.yml, nested mappings and lists are read-only (MappingProxyType and tuple)
+Config = collections.namedtuple("Config", [
+    "target_org", "prefix", "master_branch_prefix", "console_log_level", "console_log_normal", "file_log_level",
+    "sync_include", "sync_exclude"
+])
+
+
+class ConfigUtils():
+
+    # Parse and validate config.yml from the current directory once per process and return the cached Config
+    @staticmethod
+    def get_config():
+        return ConfigUtils.load_config(os.path.join(os.getcwd(), "config.yml"))
+
+    # Parse and validate a config file, raises ConfigError if it does not follow the config format
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def load_config(config_path):
+        # yaml is only needed once per process, import it here to keep CLI startup fast
+        import yaml
+        try:
+            with open(config_path) as file:
+                config = yaml.load(file, Loader=yaml.FullLoader)
+        except OSError as error:
+            raise ConfigError(f"Could not read config file {config_path}: {error.strerror}")
+        except yaml.YAMLError as error:
+            raise ConfigError(f"Could not parse config file {config_path}: {error}")
+
+        if (not isinstance(config, dict)):
+            raise ConfigError(f"{config_path}: expected a mapping of settings")
+        if (not isinstance(config.get("target_org"), str) or not config["target_org"]):
+            raise ConfigError(f"{config_path}: target_org must be the name of an organization")
+        for key in ["prefix", "master_branch_prefix"]:
+            if (config.get(key) is not None and not isinstance(config[key], str)):
+                raise ConfigError(f"{config_path}: {key} must be a string")
+        for key in ["console_log_level", "file_log_level"]:
+            if (str(config.get(key)).lower() not in LOG_LEVELS):
+                raise ConfigError(f"{config_path}: {key} must be one of {', '.join(LOG_LEVELS)}")
+        if (not isinstance(config.get("console_log_normal"), bool)):
+            raise ConfigError(f"{config_path}: console_log_normal must be true or false")
+
+        sync_config = config.get("sync_config")
+        if (not isinstance(sync_config, dict)):
+            raise ConfigError(f"{config_path}: sync_config must be a mapping with include and/or exclude")
+        if ("regex" in sync_config):
+            raise ConfigError(f"{config_path}: sync_config.regex is not supported, set regex in include or exclude")
+        try:
+            ConfigUtils.validate_sync_config(sync_config.get("include"), "sync_config.include", False, True)
+            ConfigUtils.validate_sync_config(sync_config.get("exclude"), "sync_config.exclude", False, False)
+        except ConfigError as error:
+            raise ConfigError(f"{config_path}: {error}")
+
+        return Config(target_org=config["target_org"],
+                      prefix=config.get("prefix") or "",
+                      master_branch_prefix=config.get("master_branch_prefix") or "",
+                      console_log_level=config["console_log_level"],
+                      console_log_normal=config["console_log_normal"],
+                      file_log_level=config["file_log_level"],
+                      sync_include=ConfigUtils.freeze(sync_config.get("include")),
+                      sync_exclude=ConfigUtils.freeze(sync_config.get("exclude")))
+
+    # Unwrap a level of sync_config that uses the regex/repo_config format, returns (regex, repo_config)
+    @staticmethod
+    def unwrap_regex_config(node, path, parent_regex):
+        if (not (isinstance(node, dict) and ("regex" in node or "repo_config" in node))):
+            return parent_regex, node
+        if (set(node) - {"regex", "repo_config"}):
+            raise ConfigError(f"{path}: when regex is mentioned, the rest of the config must be under repo_config")
+        if ("regex" in node and not isinstance(node["regex"], bool)):
+            raise ConfigError(f"{path}.regex must be true or false")
+        return node.get("regex", parent_regex), node.get("repo_config")
+
+    # Check a repository name or pattern of sync_config, patterns must compile when regex matching is on
+    @staticmethod
+    def validate_repo_pattern(pattern, path, regex):
+        if (not isinstance(pattern, str)):
+            raise ConfigError(f"{path}: expected a repository name, got {pattern!r}")
+        if (regex):
+            try:
+                re.compile(pattern)
+            except re.error as error:
+                raise ConfigError(f"{path}: invalid regex {pattern!r}: {error}")
+
+    # Check the include or exclude tree of sync_config: project keys, then repository names (and teams for include)
+    @staticmethod
+    def validate_sync_config(node, path, regex, allow_teams):
+        if (node is None):
+            return
+        regex, projects = ConfigUtils.unwrap_regex_config(node, path, regex)
+        if (not isinstance(projects, dict)):
+            raise ConfigError(f"{path}: expected a mapping of project keys")
+        for project_key, project_node in projects.items():
+            project_path = f"{path}.{project_key}"
+            project_regex, entries = ConfigUtils.unwrap_regex_config(project_node, project_path, regex)
+            if (entries is None):
+                continue
+            if (not isinstance(entries, list)):
+                raise ConfigError(f"{project_path}: expected a list of repositories")
+            for index, entry in enumerate(entries):
+                entry_path = f"{project_path}[{index}]"
+                if (not isinstance(entry, dict)):
+                    ConfigUtils.validate_repo_pattern(entry, entry_path, project_regex)
+                    continue
+                if (not allow_teams):
+                    raise ConfigError(f"{entry_path}: team assignments are only supported under include")
+                for team_name, team_node in entry.items():
+                    team_path = f"{entry_path}.{team_name}"
+                    team_regex, repo_names = ConfigUtils.unwrap_regex_config(team_node, team_path, project_regex)
+                    if (not isinstance(repo_names, list)):
+                        raise ConfigError(f"{team_path}: expected a list of repositories")
+                    for repo_index, repo_name in enumerate(repo_names):
+                        ConfigUtils.validate_repo_pattern(repo_name, f"{team_path}[{repo_index}]", team_regex)
+
+    # Make a read-only copy of parsed YAML, mappings become MappingProxyType and lists become tuples
+    @staticmethod
+    def freeze(value):
+        if (isinstance(value, dict)):
+            return types.MappingProxyType({key: ConfigUtils.freeze(item) for key, item in value.items()})
+        if (isinstance(value, list)):
+            return tuple(ConfigUtils.freeze(item) for item in value)
+        return value
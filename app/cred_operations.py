@@ -1,13 +1,20 @@
-import requests
 import os
 
 from app import utils
+from app.api_client import ApiClient
 
 
 class CredOps:
-    def __init__(self, bitbucket_api, github_api, console_log_level, console_log_normal, file_log_level):
+    def __init__(self,
+                 bitbucket_api,
+                 github_api,
+                 console_log_level,
+                 console_log_normal,
+                 file_log_level,
+                 api_client=None):
         self.bitbucket_api = bitbucket_api
         self.github_api = github_api
+        self.api_client = api_client if api_client else ApiClient()
         self.log = utils.LogUtils.get_logger(os.path.basename(__file__), console_log_level, console_log_normal,
                                              file_log_level)
         self.target_org = utils.ReadUtils.get_target_org()
@@ -16,8 +23,7 @@ class CredOps:
     def check_bitbucket_pull_creds(self, project_key, bitbucket_access_token):
         # Check BitBucket Access Token
         bitbucket_access_check_link = self.bitbucket_api + f"/projects/{project_key}/repos"
-        bitbucket_access_check = requests.get(bitbucket_access_check_link,
-                                              headers={"Authorization": f"Bearer {bitbucket_access_token}"})
+        bitbucket_access_check = self.api_client.get(bitbucket_access_check_link, access_token=bitbucket_access_token)
         if (bitbucket_access_check.status_code == 200):
             self.log.debug("BitBucket credentials check", result="PASSED")
             return True
@@ -41,8 +47,8 @@ class CredOps:
     def check_github_pull_creds(self, github_access_token):
         # Check GitHub Access Token
         github_access_token_check_link = self.github_api + "/user/repos"
-        github_access_token_check = requests.get(github_access_token_check_link,
-                                                 headers={"Authorization": f"Bearer {github_access_token}"})
+        github_access_token_check = self.api_client.get(github_access_token_check_link,
+                                                        access_token=github_access_token)
         if (github_access_token_check.status_code == 200):
             self.log.debug("GitHub credentials check", result="PASSED")
             return True
@@ -62,8 +68,8 @@ class CredOps:
         if (push_to_org):
             self.log.info("Checking credentials for push to organization", target_org=self.target_org)
 
-            is_member = requests.get(self.github_api + f"/orgs/{self.target_org}/members/{github_account_id}",
-                                     headers={"Authorization": f"Bearer {github_access_token}"})
+            is_member = self.api_client.get(self.github_api + f"/orgs/{self.target_org}/members/{github_account_id}",
+                                            access_token=github_access_token)
             # API returns 401 if the user's access token is incorrect
             if (is_member.status_code == 401):
                 self.log.error("GitHub Access Token check: Unauthorized",
@@ -88,8 +94,8 @@ class CredOps:
             self.log.info("Checking credentials for push", push_destination=github_account_id)
             # Check GitHub Access Token
             github_access_token_check_link = self.github_api + f"/users/{github_account_id}/repos"
-            github_access_token_check = requests.get(github_access_token_check_link,
-                                                     headers={"Authorization": f"Bearer {github_access_token}"})
+            github_access_token_check = self.api_client.get(github_access_token_check_link,
+                                                            access_token=github_access_token)
             if (github_access_token_check.status_code == 401):
                 self.log.error("GitHub Access Token check: Unauthorized",
                                result="FAILED",
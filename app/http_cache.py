@@ -0,0 +1,97 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+
+class HttpCache():
+    # On-disk (SQLite) cache of API responses, shared by runs in the same working directory
+    # Entries younger than their TTL are served locally, older entries are revalidated with conditional requests
+    # Least recently used entries are evicted once the cache grows beyond max_size bytes
+    def __init__(self, cache_path, default_ttl=300, max_size=64 * 1024 * 1024):
+        self.default_ttl = default_ttl
+        self.max_size = max_size
+        cache_dir = os.path.dirname(cache_path)
+        if (cache_dir and not os.path.isdir(cache_dir)):
+            os.makedirs(cache_dir, exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(cache_path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS responses ("
+                                    "cache_key TEXT PRIMARY KEY, "
+                                    "url TEXT, "
+                                    "status_code INTEGER, "
+                                    "headers TEXT, "
+                                    "content BLOB, "
+                                    "size INTEGER, "
+                                    "stored_at REAL, "
+                                    "accessed_at REAL)")
+
+    # Key of a cached response, the access token is hashed so responses are never shared between tokens
+    @staticmethod
+    def get_cache_key(method, url, access_token):
+        return hashlib.sha256(f"{method} {url} {access_token}".encode("utf-8")).hexdigest()
+
+    # Returns the cached entry for the key or None, entries are dicts with the response and the time it was stored
+    def get(self, cache_key):
+        with self.lock, self.connection:
+            row = self.connection.execute(
+                "SELECT url, status_code, headers, content, stored_at FROM responses WHERE cache_key = ?",
+                (cache_key, )).fetchone()
+            if (row is None):
+                return None
+            self.connection.execute("UPDATE responses SET accessed_at = ? WHERE cache_key = ?",
+                                    (time.time(), cache_key))
+        url, status_code, headers, content, stored_at = row
+        return {"response": self.make_response(url, status_code, json.loads(headers), content), "stored_at": stored_at}
+
+    # Stores a response, evicts the least recently used entries if the cache grows too big
+    def store(self, cache_key, response):
+        now = time.time()
+        headers = json.dumps(dict(response.headers))
+        size = len(response.content) + len(headers)
+        if (size > self.max_size):
+            return
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (cache_key, response.url, response.status_code, headers, response.content, size, now, now))
+            self.evict()
+
+    # Marks a cached response as fresh again after the server confirmed it did not change (304 Not Modified)
+    def refresh(self, cache_key):
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.execute("UPDATE responses SET stored_at = ?, accessed_at = ? WHERE cache_key = ?",
+                                    (now, now, cache_key))
+
+    # Deletes the least recently used entries until the cache fits in max_size, the lock must be held
+    def evict(self):
+        total_size = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if (total_size <= self.max_size):
+            return
+        rows = self.connection.execute("SELECT cache_key, size FROM responses ORDER BY accessed_at").fetchall()
+        for cache_key, size in rows:
+            if (total_size <= self.max_size):
+                break
+            self.connection.execute("DELETE FROM responses WHERE cache_key = ?", (cache_key, ))
+            total_size -= size
+
+    @staticmethod
+    def make_response(url, status_code, headers, content):
+        response = requests.Response()
+        response.url = url
+        response.status_code = status_code
+        response.headers = CaseInsensitiveDict(headers)
+        response._content = content
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        return response
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -6,12 +6,33 @@ import os
 from app import utils, cred_operations, repo_operations
 
 
-def start_session(bitbucket_account_id, bitbucket_access_token, github_account_id, github_access_token, bitbucket_api,
-                  github_api, prefix, master_branch_prefix, console_log_level, console_log_normal, file_log_level):
+def start_session(bitbucket_account_id,
+                  bitbucket_access_token,
+                  github_account_id,
+                  github_access_token,
+                  bitbucket_api,
+                  github_api,
+                  prefix,
+                  master_branch_prefix,
+                  console_log_level,
+                  console_log_normal,
+                  file_log_level,
+                  api_client=None):
     # Objects for operations related to credentials and repository actions
-    cred_ops = cred_operations.CredOps(bitbucket_api, github_api, console_log_level, console_log_normal, file_log_level)
-    repo_ops = repo_operations.RepoOps(bitbucket_api, github_api, prefix, master_branch_prefix, console_log_level,
-                                       console_log_normal, file_log_level)
+    cred_ops = cred_operations.CredOps(bitbucket_api,
+                                       github_api,
+                                       console_log_level,
+                                       console_log_normal,
+                                       file_log_level,
+                                       api_client=api_client)
+    repo_ops = repo_operations.RepoOps(bitbucket_api,
+                                       github_api,
+                                       prefix,
+                                       master_branch_prefix,
+                                       console_log_level,
+                                       console_log_normal,
+                                       file_log_level,
+                                       api_client=api_client)
     log = utils.LogUtils.get_logger(os.path.basename(__file__), console_log_level, console_log_normal, file_log_level)
     target_org = utils.ReadUtils.get_target_org()
     # Ask for migration destination
@@ -39,6 +60,8 @@ def start_session(bitbucket_account_id, bitbucket_access_token, github_account_i
 
     # Get list of all repos
     repo_names = repo_ops.get_bitbucket_repos(project_key, bitbucket_access_token)
+    if (repo_names is None):
+        exit(1)
     repo_list = [{'name': repo} for repo in repo_names]
 
     # Ask which repos to migrate
@@ -82,8 +105,10 @@ def start_session(bitbucket_account_id, bitbucket_access_token, github_account_i
         exit(0)
 
     # Fetch list of existing teams on github
-    teams_info_list = repo_ops.get_teams_info(github_access_token)
-    teams_checklist = [{'name': team['slug']} for team in teams_info_list]
+    team_ids = repo_ops.get_team_ids(github_access_token)
+    if (team_ids is None):
+        exit(1)
+    teams_checklist = [{'name': team_slug} for team_slug in team_ids]
 
     # Ask which teams to assign repos to
     selected_teams = questionary.checkbox('Select the teams to which you want to assign the repos',
@@ -0,0 +1,167 @@
+# Library imports
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Type and help text of every metric, by name
+METRICS = {
+    "git_migration_api_requests_total": ("counter", "API requests by host, method and status code (error when none)"),
+    "git_migration_api_request_duration_seconds": ("histogram", "Duration of API requests, with their retries"),
+    "git_migration_api_retries_total": ("counter", "API requests retried after a connection error or 5xx response"),
+    "git_migration_api_rate_limited_total": ("counter", "API requests refused by a rate limit of the host"),
+    "git_migration_api_rate_limit_remaining": ("gauge", "Requests left in the host's rate limit window"),
+    "git_migration_git_operations_total": ("counter", "Git operations with a remote by operation and result"),
+    "git_migration_git_operation_duration_seconds": ("histogram", "Duration of git operations, with their retries"),
+    "git_migration_git_retries_total": ("counter", "Git operations retried after a network or server error"),
+    "git_migration_git_bytes_total": ("counter", "Bytes of git objects fetched from BitBucket and pushed to GitHub"),
+    "git_migration_repos_total": ("counter", "Synced repositories by result (synced, skipped when up-to-date, failed)"),
+    "git_migration_pipeline_queue_depth": ("gauge", "Repositories waiting for each stage of the `sync auto` pipeline"),
+    "git_migration_phase_duration_seconds": ("histogram", "Duration of the traced phases of the sync"),
+    "git_migration_last_run_duration_seconds": ("gauge", "Duration of the last run"),
+    "git_migration_last_run_timestamp_seconds": ("gauge", "Time the last run ended, in seconds since the epoch")
+}
+
+# Upper bounds of the histogram buckets, in seconds
+HISTOGRAM_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900)
+
+
+class Metrics():
+    # Counters, gauges and histograms of the sync, rendered in the Prometheus text format
+    # Values are kept by metric name and labels. Gauges can also be read from a callback when the metrics are rendered
+    # With textfile_path, the metrics are written to that file after every run (for the node exporter textfile
+    # collector), the file is replaced at once so the exporter never reads a partly written file
+    def __init__(self, textfile_path=None):
+        self.textfile_path = textfile_path
+        self.values = {name: {} for name in METRICS}
+        self.gauge_callbacks = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def get_label_key(labels):
+        return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        label_key = Metrics.get_label_key(labels)
+        with self.lock:
+            self.values[name][label_key] = self.values[name].get(label_key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.values[name][Metrics.get_label_key(labels)] = value
+
+    def observe(self, name, value, **labels):
+        label_key = Metrics.get_label_key(labels)
+        with self.lock:
+            histogram = self.values[name].get(label_key)
+            if (histogram is None):
+                histogram = {"buckets": [0] * len(HISTOGRAM_BUCKETS), "sum": 0.0, "count": 0}
+                self.values[name][label_key] = histogram
+            for index, bucket in enumerate(HISTOGRAM_BUCKETS):
+                if (value <= bucket):
+                    histogram["buckets"][index] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    # Reads the values of a gauge from callback() when the metrics are rendered, callback returns a list of
+    # (labels, value) tuples
+    def set_gauge_callback(self, name, callback):
+        with self.lock:
+            self.gauge_callbacks[name] = callback
+
+    # Records the duration of a traced span (tracing.Tracer), by the name of its phase
+    def observe_span(self, name, duration):
+        self.observe("git_migration_phase_duration_seconds", duration, phase=name)
+
+    # Records a run that ended and writes the metrics to the textfile
+    def observe_run(self, name, duration, end_time):
+        self.set("git_migration_last_run_duration_seconds", duration, run=name)
+        self.set("git_migration_last_run_timestamp_seconds", end_time, run=name)
+        if (self.textfile_path):
+            self.write_textfile()
+
+    @staticmethod
+    def format_labels(label_key, extra_labels=()):
+        labels = list(label_key) + list(extra_labels)
+        if (not labels):
+            return ""
+        escaped_labels = [(name, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+                          for name, value in labels]
+        return "{" + ",".join(f'{name}="{value}"' for name, value in escaped_labels) + "}"
+
+    @staticmethod
+    def format_value(value):
+        return repr(float(value)) if (isinstance(value, float)) else str(value)
+
+    # Returns the metrics in the Prometheus text exposition format
+    def render(self):
+        with self.lock:
+            values = {name: dict(metric_values) for name, metric_values in self.values.items()}
+            gauge_callbacks = dict(self.gauge_callbacks)
+        for name, callback in gauge_callbacks.items():
+            values[name].update((Metrics.get_label_key(labels), value) for labels, value in callback())
+
+        lines = []
+        for name, (metric_type, help_text) in METRICS.items():
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+            for label_key, value in sorted(values[name].items()):
+                if (metric_type != "histogram"):
+                    lines.append(f"{name}{Metrics.format_labels(label_key)} {Metrics.format_value(value)}")
+                    continue
+                for bucket, bucket_count in zip(HISTOGRAM_BUCKETS, value["buckets"]):
+                    bucket_labels = Metrics.format_labels(label_key, [("le", str(float(bucket)))])
+                    lines.append(f"{name}_bucket{bucket_labels} {bucket_count}")
+                lines.append(f"{name}_bucket{Metrics.format_labels(label_key, [('le', '+Inf')])} {value['count']}")
+                lines.append(f"{name}_sum{Metrics.format_labels(label_key)} {Metrics.format_value(value['sum'])}")
+                lines.append(f"{name}_count{Metrics.format_labels(label_key)} {value['count']}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self):
+        temporary_path = f"{self.textfile_path}.{os.getpid()}.tmp"
+        with open(temporary_path, "w") as textfile:
+            textfile.write(self.render())
+        os.replace(temporary_path, self.textfile_path)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    # Serves the metrics of server.metrics at /metrics
+    def do_GET(self):  # noqa: N802
+        if (self.path.split("?")[0] != "/metrics"):
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        data = self.server.metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    # Scrapes are not logged
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsServer():
+    # HTTP server for Prometheus to scrape the metrics from, at http://<host>:<port>/metrics
+    def __init__(self, metrics, host, port, log=None):
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self.log = log
+        self.server = None
+
+    def start(self):
+        self.server = ThreadingHTTPServer((self.host, self.port), MetricsHandler)
+        self.server.daemon_threads = True
+        self.server.metrics = self.metrics
+        threading.Thread(target=self.server.serve_forever, name="metrics-server", daemon=True).start()
+        if (self.log):
+            self.log.info("Serving metrics", host=self.host, port=self.server.server_address[1])
+        return self
+
+    def stop(self):
+        if (self.server is not None):
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
@@ -0,0 +1,86 @@
+# Library imports
+import queue
+import threading
+import traceback
+
+# Marks the end of the items in a stage's input queue
+END_OF_ITEMS = object()
+
+
+class Pipeline():
+    # Runs items through a chain of stages, every stage has its own pool of threads
+    # Stages are connected by queues of at most queue_size items, a stage that is ahead of the next one blocks until
+    # that stage caught up, so the number of items in flight stays the same no matter how many items there are
+    # A stage function is called as function(item, emit) and passes on any number of items to the next stage by
+    # calling emit(next_item), the items emitted by the last stage are dropped
+    # Exceptions of a stage function are passed to on_error(stage_name, item, exception) and the item is dropped
+    def __init__(self, queue_size=100, on_error=None):
+        self.queue_size = queue_size
+        self.on_error = on_error
+        self.stages = []
+        self.queues = []
+
+    def add_stage(self, name, function, workers=1):
+        self.stages.append({"name": name, "function": function, "workers": max(workers, 1)})
+        return self
+
+    # Feeds the items to the first stage and blocks until every stage is done with all of them
+    def run(self, items):
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        self.queues = queues
+        threads = []
+        for stage_index, stage in enumerate(self.stages):
+            input_queue = queues[stage_index]
+            output_queue = queues[stage_index + 1] if (stage_index + 1 < len(queues)) else None
+            next_workers = self.stages[stage_index + 1]["workers"] if (output_queue is not None) else 0
+            # The last worker of a stage to finish ends the items of the next stage
+            remaining_workers = [stage["workers"]]
+            lock = threading.Lock()
+            for worker_index in range(stage["workers"]):
+                thread = threading.Thread(target=self.run_worker,
+                                          args=(stage, input_queue, output_queue, next_workers, remaining_workers,
+                                                lock),
+                                          name=f"{stage['name']}-{worker_index}",
+                                          daemon=True)
+                thread.start()
+                threads.append(thread)
+
+        for item in items:
+            queues[0].put(item)
+        for _ in range(self.stages[0]["workers"]):
+            queues[0].put(END_OF_ITEMS)
+        for thread in threads:
+            thread.join()
+
+    # The worker always counts itself out when it ends, so the next stage gets its END_OF_ITEMS and run() returns
+    def run_worker(self, stage, input_queue, output_queue, next_workers, remaining_workers, lock):
+        emit = output_queue.put if (output_queue is not None) else (lambda next_item: None)
+        try:
+            while (True):
+                item = input_queue.get()
+                if (item is END_OF_ITEMS):
+                    break
+                try:
+                    stage["function"](item, emit)
+                except Exception as e:
+                    self.handle_error(stage["name"], item, e)
+        finally:
+            with lock:
+                remaining_workers[0] -= 1
+                if (remaining_workers[0] == 0):
+                    for _ in range(next_workers):
+                        output_queue.put(END_OF_ITEMS)
+
+    # Passes the exception of a stage function to on_error, an exception of on_error itself is printed to stderr and
+    # the worker goes on with the next item
+    def handle_error(self, stage_name, item, error):
+        if (not self.on_error):
+            return
+        try:
+            self.on_error(stage_name, item, error)
+        except Exception:
+            traceback.print_exc()
+
+    # Returns the name of each stage with the number of items waiting in its input queue
+    def get_queue_sizes(self):
+        return [(stage["name"], stage_queue.qsize()) for stage, stage_queue in zip(self.stages, self.queues)]
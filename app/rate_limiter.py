@@ -0,0 +1,130 @@
+# Library imports
+import email.utils
+import threading
+import time
+
+
+class RateLimiter():
+    # Schedules the requests to one API host
+    # - A token bucket allows up to `requests_per_second` requests per second (no limit when not set). When less than
+    #   a tenth of the host's rate limit is left (X-RateLimit-Remaining/X-RateLimit-Reset), the remaining requests are
+    #   spread evenly until the limit resets instead of being spent at once
+    # - Up to `concurrency_limit` requests run at the same time. The limit is halved whenever the host rate limits a
+    #   request and grows by one again after every `concurrency_limit` successful requests, up to `max_concurrency`
+    # - Requests are paused (instead of failing) until Retry-After or X-RateLimit-Reset when the host rate limits
+    def __init__(self, max_concurrency, requests_per_second=None, max_wait=3600):
+        self.max_concurrency = max_concurrency
+        self.concurrency_limit = max_concurrency
+        self.requests_per_second = requests_per_second
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self.successes = 0
+        # Rate to spread the remaining requests of the host's rate limit window over, None if there is no need to
+        self.paced_rate = None
+        self.tokens = 1
+        self.last_refill = time.monotonic()
+        self.paused_until = 0
+        # Consecutive rate limited responses without a Retry-After, to back off for longer each time
+        self.rate_limited_count = 0
+        self.condition = threading.Condition()
+
+    # Requests per second currently allowed, None if there is no limit
+    def get_rate(self):
+        rates = [rate for rate in [self.requests_per_second, self.paced_rate] if (rate)]
+        return min(rates) if (rates) else None
+
+    # Blocks until a request may be sent, release() must be called once the response arrived
+    def acquire(self):
+        with self.condition:
+            while (True):
+                now = time.monotonic()
+                if (self.paused_until > now):
+                    self.condition.wait(self.paused_until - now)
+                    continue
+                if (self.in_flight >= self.concurrency_limit):
+                    self.condition.wait()
+                    continue
+                rate = self.get_rate()
+                if (rate):
+                    self.tokens = min(self.tokens + (now - self.last_refill) * rate, max(rate, 1))
+                    self.last_refill = now
+                    if (self.tokens < 1):
+                        self.condition.wait((1 - self.tokens) / rate)
+                        continue
+                    self.tokens -= 1
+                self.in_flight += 1
+                return
+
+    def release(self):
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    # Seconds to wait from a Retry-After header (seconds or an HTTP date), None if there is none
+    @staticmethod
+    def get_retry_after(response):
+        retry_after = response.headers.get("Retry-After")
+        if (retry_after is None):
+            return None
+        try:
+            return max(float(retry_after), 0)
+        except ValueError:
+            pass
+        try:
+            return max(email.utils.parsedate_to_datetime(retry_after).timestamp() - time.time(), 0)
+        except (TypeError, ValueError):
+            return None
+
+    # Whether the host refused the request because of a rate limit
+    # GitHub answers 403 for both rate limits and missing permissions, only a 403 with rate limit details counts
+    @staticmethod
+    def is_rate_limited(response):
+        if (response.status_code == 429):
+            return True
+        if (response.status_code not in (403, 503)):
+            return False
+        if (response.headers.get("Retry-After") is not None or response.headers.get("X-RateLimit-Remaining") == "0"):
+            return True
+        return response.status_code == 403 and "rate limit" in response.text.lower()
+
+    # Updates the schedule from the rate limit headers of a response
+    # Returns the seconds requests are paused for if the request was rate limited and should be retried, else None
+    def update(self, response):
+        now = time.time()
+        remaining = response.headers.get("X-RateLimit-Remaining")
+        reset = response.headers.get("X-RateLimit-Reset")
+        rate_limited = RateLimiter.is_rate_limited(response)
+        with self.condition:
+            # Once less than a tenth of the rate limit is left, spread the remaining requests until the limit resets
+            if (remaining is not None and reset is not None and remaining.isdigit() and reset.isdigit()):
+                limit = response.headers.get("X-RateLimit-Limit")
+                low_remaining = int(limit) // 10 if (limit is not None and limit.isdigit()) else 100
+                if (int(remaining) < low_remaining):
+                    self.paced_rate = max(int(remaining), 1) / max(int(reset) - now, 1)
+                else:
+                    self.paced_rate = None
+
+            if (not rate_limited):
+                self.rate_limited_count = 0
+                self.successes += 1
+                if (self.successes >= self.concurrency_limit and self.concurrency_limit < self.max_concurrency):
+                    self.concurrency_limit += 1
+                    self.successes = 0
+                return None
+
+            # Back off: pause the host and halve the number of concurrent requests
+            # Requests that were already sent before the pause started do not halve the limit again
+            self.rate_limited_count += 1
+            if (self.paused_until <= time.monotonic()):
+                self.concurrency_limit = max(self.concurrency_limit // 2, 1)
+            self.successes = 0
+            wait = RateLimiter.get_retry_after(response)
+            if (wait is None and remaining == "0" and reset is not None and reset.isdigit()):
+                wait = max(int(reset) - now, 0) + 1
+            if (wait is None):
+                # GitHub asks to wait at least a minute after a secondary rate limit without a Retry-After
+                wait = 60 * 2**(self.rate_limited_count - 1)
+            wait = min(wait, self.max_wait)
+            self.paused_until = max(self.paused_until, time.monotonic() + wait)
+            self.condition.notify_all()
+            return wait
@@ -2,24 +2,80 @@
 import json
 import os
 import re
-import requests
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from sh.contrib import git
 from sh import ErrorReturnCode
+from urllib.parse import urlsplit
 
 # Custom imports
 from app import utils
+from app.api_client import ApiClient
+from app.retry import CircuitOpenError, RetryPolicy
+
+# Number of repositories to request per page from BitBucket (the server may cap it lower)
+BITBUCKET_PAGE_LIMIT = 1000
+
+# Refspecs to fetch the branches and tags from BitBucket into the local bare repositories
+BITBUCKET_FETCH_REFSPECS = ["+refs/heads/*:refs/remotes/origin/*", "+refs/tags/*:refs/tags/*"]
+
+# Size of the objects transferred by a git fetch or push, from its --progress output
+# (eg: "Receiving objects: 100% (30/30), 2.50 KiB | 2.50 MiB/s, done.")
+GIT_TRANSFER_SIZE = re.compile(
+    r"(?:Receiving|Unpacking|Writing) objects: 100% \(\d+/\d+\), ([\d.]+) (bytes|KiB|MiB|GiB)")
+GIT_SIZE_UNITS = {"bytes": 1, "KiB": 1024, "MiB": 1024**2, "GiB": 1024**3}
+
+# Fetches keep the received pack as it is (fetch.unpackLimit=1) instead of unpacking small packs into loose objects,
+# so the size of every fetch shows up in its --progress output
+GIT_FETCH_OPTIONS = ["-c", "fetch.unpackLimit=1", "fetch", "--progress"]
+
+# Errors of git commands with a remote: the command failed, or the circuit breaker of the remote's host is open
+GIT_REMOTE_ERRORS = (ErrorReturnCode, CircuitOpenError)
+
+# Direction of the bytes transferred by each git operation, in the metrics
+GIT_TRANSFER_DIRECTIONS = {"fetch": "fetched", "push": "pushed"}
 
 
 class RepoOps:
-    def __init__(self, bitbucket_api, github_api, prefix, master_branch_prefix, console_log_level, console_log_normal,
-                 file_log_level):
+    def __init__(self,
+                 bitbucket_api,
+                 github_api,
+                 prefix,
+                 master_branch_prefix,
+                 console_log_level,
+                 console_log_normal,
+                 file_log_level,
+                 push_batch_size=0,
+                 api_client=None):
         self.bitbucket_api = bitbucket_api
         self.github_api = github_api
+        self.api_client = api_client if api_client else ApiClient()
+        # Times the listings, lookups, fetches and pushes of each repository (a tracing.Tracer, shared with api_client)
+        self.tracer = self.api_client.tracer
+        # Counts git operations, transferred bytes and synced repositories (a metrics.Metrics, shared with api_client)
+        self.metrics = self.api_client.metrics
         self.prefix = prefix
         self.log = utils.LogUtils.get_logger(os.path.basename(__file__), console_log_level, console_log_normal,
                                              file_log_level)
         self.target_org = utils.ReadUtils.get_target_org()
         self.master_branch_prefix = master_branch_prefix
+        # Number of refs to push with a single `git push`, refs are pushed individually when not more than 1
+        self.push_batch_size = push_batch_size
+        # Details of the repositories listed from each BitBucket project, by project key and repository name
+        self.bitbucket_repos = {}
+        # Compiled include/exclude rules of each project (utils.RepoMatcher), by project key
+        self.repo_matchers = {}
+        # Index of the repositories on GitHub, for pushes to the target org (True) and to the personal account (False)
+        self.github_repo_indexes = {}
+        self.github_repo_index_lock = threading.Lock()
+        # IDs of the teams on the target org by slug, and the repositories each team has admin permission on by ID
+        self.team_ids = None
+        self.team_repos = {}
+        self.team_index_lock = threading.Lock()
+        # Held while the bare repositories are made, so two projects do not convert the same old clone at once
+        self.local_repo_lock = threading.Lock()
 
     # Returns list of all projects on BitBucket
     def get_bitbucket_projects(self, bitbucket_access_token):
@@ -30,7 +86,7 @@ class RepoOps:
         self.log.info("Fetching project list")
         while (not is_last_page):
             projects_url = self.bitbucket_api + f"/projects/?start={start}"
-            projects = requests.get(projects_url, headers={"Authorization": f"Bearer {bitbucket_access_token}"})
+            projects = self.api_client.get(projects_url, access_token=bitbucket_access_token, cache=True)
             if (projects.status_code == 200):
                 self.log.debug("Fetched project list", result="SUCCESS")
                 projects = json.loads(projects.text)
@@ -47,265 +103,162 @@ class RepoOps:
             project_names += ["{}:{}".format(project["name"], project["key"]) for project in projects["values"]]
         return project_names
 
-    # Return all repositories from a given project on BitBucket
+    # Return all repositories from a given project on BitBucket, None if they could not be listed
+    # Keeps the details of each repository from the listing, so process_repos() does not need to fetch them again
     def get_bitbucket_repos(self, project_key, bitbucket_access_token):
         repo_names = []
-        is_last_page = False
+        project_bitbucket_repos = {}
         start = 0
         # Get list of all repos
         self.log.info("Fetching repository list", project_key=project_key)
-        while (not is_last_page):
-            # Get list of repos under the mentioned project on BitBucket
-            project_repos_link = self.bitbucket_api + f"/projects/{project_key}/repos?start={start}"
-            project_repos = requests.get(project_repos_link,
-                                         headers={"Authorization": f"Bearer {bitbucket_access_token}"})
-            # Error while fetching repos
-            if (project_repos.status_code != 200):
-                self.log.error("Failed to fetch repository list",
-                               result="FAILED",
-                               project_key=project_key,
-                               status_code=project_repos.status_code)
-                exit(1)
-
-            project_repos = json.loads(project_repos.text)
-
-            # Check if last page
-            is_last_page = project_repos["isLastPage"]
-            if (not is_last_page):
-                start = project_repos["nextPageStart"]
+        while (start is not None):
+            repos_page = self.get_bitbucket_repos_page(project_key, bitbucket_access_token, start)
+            if (repos_page is None):
+                return None
+            project_repos, start = repos_page
 
             # Populate the project names
-            repo_names += [repo["name"] for repo in project_repos["values"]]
+            repo_names += [repo["name"] for repo in project_repos]
+            for repo in project_repos:
+                project_bitbucket_repos[repo["name"]] = self.get_bitbucket_repo_details(repo)
+        self.bitbucket_repos[project_key] = project_bitbucket_repos
         return repo_names
 
+    # Return one page of repositories from a given project on BitBucket and the start of the next page
+    # The start of the next page is None on the last page, returns None if the page could not be fetched
+    def get_bitbucket_repos_page(self, project_key, bitbucket_access_token, start=0):
+        # Get list of repos under the mentioned project on BitBucket
+        project_repos_link = self.bitbucket_api + f"/projects/{project_key}/repos"
+        project_repos_link += f"?start={start}&limit={BITBUCKET_PAGE_LIMIT}"
+        with self.tracer.span("bitbucket_listing", project_key=project_key, start=start):
+            project_repos = self.api_client.get(project_repos_link, access_token=bitbucket_access_token, cache=True)
+        # Error while fetching repos
+        if (project_repos.status_code != 200):
+            self.log.error("Failed to fetch repository list",
+                           result="FAILED",
+                           project_key=project_key,
+                           status_code=project_repos.status_code)
+            return None
+
+        project_repos = json.loads(project_repos.text)
+
+        # Check if last page
+        next_start = None if (project_repos["isLastPage"]) else project_repos["nextPageStart"]
+        return project_repos["values"], next_start
+
+    # Return the compact details of a repository from its BitBucket API representation
+    def get_bitbucket_repo_details(self, bitbucket_repo):
+        link = list(filter(utils.MiscUtils.is_http, bitbucket_repo["links"]["clone"]))
+        repo_details = {
+            "name": bitbucket_repo["name"],
+            "slug": bitbucket_repo["slug"],
+            "bitbucket_link": link[0]["href"]
+        }
+        if ("description" in bitbucket_repo):
+            repo_details["description"] = bitbucket_repo["description"]
+        return repo_details
+
     # Returns a list of repo objects with information regarding which teams they need to be assigned to
     def populate_team_info(self, project_key, bitbucket_repo_names, to_include, to_exclude, github_access_token):
-        repositories = []
-
-        # First make a mapping of which repos are assigned to which teams (can be multiple teams)
-        # Then transform to a list of repos and return
-        repository_team_mapping = {}
-
-        # To verify if the teams mentioned in the config files actually exist on the org
-        teams_list = self.get_teams_info(github_access_token)
-        teams_list = [team['slug'] for team in teams_list]
+        repo_matcher = self.get_repo_matcher(project_key, to_include, to_exclude)
 
-        # If include is not mentioned in config file
-        if to_include is None:
+        # If include is not mentioned in config file or nothing is included from this project
+        if (repo_matcher.is_empty()):
             self.log.warning("Nothing to include", project_key=project_key)
-            return repositories
+            return []
 
-        # Boolean to use/not-use regex matching for repository names
-        include_regex = to_include["regex"] if ("regex" in to_include) else False
-        include_config = to_include["repo_config"] if ("repo_config" in to_include) else to_include
+        team_ids = self.get_config_team_ids(project_key, repo_matcher, github_access_token)
+        repositories, not_found = self.select_repos(repo_matcher, bitbucket_repo_names, team_ids)
+        self.log_rules_not_found(project_key, not_found)
+        if (not repo_matcher.has_excludes()):
+            self.log.debug("Nothing to exclude", project_key=project_key)
+        return repositories
+
+    # Returns the include/exclude rules of a project, compiled once and reused by later calls
+    def get_repo_matcher(self, project_key, to_include, to_exclude):
+        if (project_key not in self.repo_matchers):
+            self.repo_matchers[project_key] = utils.RepoMatcher(project_key, to_include, to_exclude)
+        return self.repo_matchers[project_key]
+
+    # Returns the IDs of the teams on the org by slug, to verify the teams mentioned in the config file for a project
+    # Returns an empty mapping (no team is assigned) if the teams could not be fetched
+    def get_config_team_ids(self, project_key, repo_matcher, github_access_token):
+        if (not repo_matcher.teams):
+            return {}
+        team_ids = self.get_team_ids(github_access_token)
+        if (team_ids is None):
+            self.log.warning("Skipping team assignment, teams could not be verified", project_key=project_key)
+            return {}
+        for team_name in repo_matcher.teams:
+            if (team_name not in team_ids):
+                self.log.error("Could not find team mentioned in config file", team_name=team_name)
+        return team_ids
+
+    # Returns the repositories selected by the include/exclude rules, as repo objects with the teams to assign them to
+    # (only teams in team_ids), and the rules for repository names that are not in repo_names
+    def select_repos(self, repo_matcher, repo_names, team_ids):
+        # Make a mapping of which repos are assigned to which teams (can be multiple teams)
+        repository_team_mapping, not_found = repo_matcher.match(repo_names)
 
-        # config for repositories to include from the current project
-        project_include_config = include_config[project_key] if (project_key in include_config) else []
-        if not project_include_config:
-            self.log.warning("Nothing to include", project_key=project_key)
-            return repositories
-
-        # Boolean to use/not-use regex matching for repository names in this project
-        project_regex = project_include_config["regex"] if ("regex" in project_include_config) else include_regex
-        project_include_config = project_include_config["repo_config"] if (
-            "repo_config" in project_include_config) else project_include_config
-        for repo_or_team in project_include_config:
-            if isinstance(repo_or_team, str):  # Repository name
-                if (not project_regex):
-                    # No regex matching for repository names, exact match
-                    # Add START (^) and END ($) regex symbols and use regex itself instead of string matching
-                    repo_name_regex = f"^{repo_or_team}$"
-                    filtered_repo_list = utils.RegexUtils.filter_repos(bitbucket_repo_names, [repo_name_regex])
-                    if (filtered_repo_list and (repo_or_team not in repository_team_mapping)):
-                        repository_team_mapping[repo_or_team] = []
-                    # If there are duplicate repository names in the config file without any team assignments
-                    elif (repo_or_team in repository_team_mapping):
-                        # Repo already exists in the mapping, ignore without raising an error or warning
-                        pass
-                    else:
-                        self.log.error("Could not find the repository mentioned in config file",
-                                       repo_name=repo_or_team,
-                                       project_key=project_key)
-                        self.log.warning("Skipping repository. Recheck name and project",
-                                         repo_name=repo_or_team,
-                                         project_key=project_key)
-                else:
-                    # Regex matching of repository names
-                    repo_names = utils.RegexUtils.filter_repos(bitbucket_repo_names, [repo_or_team])
-                    for repo_name in repo_names:
-                        if (repo_name not in repository_team_mapping):
-                            repository_team_mapping[repo_name] = []
-            elif isinstance(repo_or_team, dict):  # Team assignment
-                # Create a mapping of repo_names and their assigned teams (can be multiple teams)
-                for team_name, team_config in repo_or_team.items():
-
-                    # Boolean to use/not-use regex matching for repository names in this team
-                    team_regex = team_config["regex"] if ("regex" in team_config) else project_regex
-                    team_config = team_config["repo_config"] if ("repo_config" in team_config) else team_config
-
-                    repo_names = team_config
-
-                    # Assign to the mentioned team only if the team with the name exists on the org
-                    team_found = True
-                    if (team_name not in teams_list):
-                        self.log.error("Could not find team mentioned in config file", team_name=team_name)
-                        team_found = False
-
-                    if (not team_regex):
-                        # No regex matching for repository names, exact match
-                        for repo_name in repo_names:
-                            # Add START (^) and END ($) regex symbols and use regex itself instead of string matching
-                            repo_name_regex = f"^{repo_name}$"
-                            filtered_repo_list = utils.RegexUtils.filter_repos(bitbucket_repo_names, [repo_name_regex])
-                            if (filtered_repo_list and (repo_name not in repository_team_mapping)):
-                                repository_team_mapping[repo_name] = [team_name] if team_found else []
-                            elif (filtered_repo_list):
-                                repository_team_mapping[repo_name] += [team_name] if team_found else []
-                            else:
-                                self.log.error("Could not find the repository mentioned in config file",
-                                               repo_name=repo_or_team,
-                                               project_key=project_key)
-                                self.log.warning("Skipping repository. Recheck name and project",
-                                                 repo_name=repo_or_team,
-                                                 project_key=project_key)
-                    else:
-                        # Regex matching of repository names
-                        repos_to_assign = utils.RegexUtils.filter_repos(bitbucket_repo_names, repo_names)
-                        for repo_name in repos_to_assign:
-                            if (repo_name not in repository_team_mapping):
-                                repository_team_mapping[repo_name] = [team_name] if team_found else []
-                            else:
-                                repository_team_mapping[repo_name] += [team_name] if team_found else []
-            else:
-                continue
         # Convert mapping to objects containing info about each repo
+        # Assign to the mentioned teams only if the team with the name exists on the org
+        repositories = []
         for repo_name, team_names in repository_team_mapping.items():
+            team_names = [team_name for team_name in team_names if (team_name in team_ids)]
             if (team_names):
                 repositories.append({"name": repo_name, "teams": team_names})
             else:
                 repositories.append({"name": repo_name})
+        return repositories, not_found
 
-        # If exclude is not mentioned in config file
-        if (to_exclude is None):
-            self.log.debug("Nothing to exclude", project_key=project_key)
-            return repositories
-
-        # Boolean to use/not-use regex matching for repository names
-        exclude_regex = to_exclude["regex"] if ("regex" in to_exclude) else False
-        exclude_config = to_exclude["repo_config"] if ("repo_config" in to_exclude) else to_exclude
-        project_exclude_config = exclude_config[project_key] if (project_key in exclude_config) else []
-
-        if not project_exclude_config:
-            self.log.debug("Nothing to exclude", project_key=project_key)
-            return repositories
-
-        # Boolean to use/not-use regex matching for repository names for this project
-        project_exclude_regex = project_exclude_config["regex"] if ("regex"
-                                                                    in project_exclude_config) else exclude_regex
-        project_exclude_config = project_exclude_config["repo_config"] if (
-            "repo_config" in project_exclude_config) else project_exclude_config
-
-        if (not project_exclude_regex):  # No regex matching for excluding repo names
-            # Add START (^) and END ($) regex symbols and use regex itself instead of string matching
-            project_exclude_config = [f"^{repo_name}$" for repo_name in project_exclude_config]
-        repositories = utils.RegexUtils.filter_repo_dicts(repositories, project_exclude_config, exclude_matches=True)
-        return repositories
+    def log_rules_not_found(self, project_key, not_found):
+        for rule in not_found:
+            self.log.error("Could not find the repository mentioned in config file",
+                           repo_name=rule["name"],
+                           project_key=project_key)
+            self.log.warning("Skipping repository. Recheck name and project",
+                             repo_name=rule["name"],
+                             project_key=project_key)
 
     # Process the list of repositories for a project and return metadata and repository links
-    def process_repos(self, project_key, repositories, push_to_org, bitbucket_access_token, github_account_id,
-                      github_access_token):
+    # Repositories are processed concurrently by up to `concurrency` threads, the order of repositories is kept
+    def process_repos(self,
+                      project_key,
+                      repositories,
+                      push_to_org,
+                      bitbucket_access_token,
+                      github_account_id,
+                      github_access_token,
+                      concurrency=1):
         processed_repos = []
         new_repos = 0
         self.log.info("Processing repos from project", project_key=project_key)
 
-        for repo in repositories:
+        # Existence of repositories on GitHub is looked up in the index, falls back to a request per repository
+        github_repo_index = self.get_github_repo_index(push_to_org, github_access_token)
 
-            if isinstance(repo, str):  # repositories is a list of repository names
-                # Add name
-                repo_name = repo
-                repo_info = {"name": repo_name}
-            else:  # repositories is a list of repository dicts
-                repo_name = repo["name"]
-                repo_info = repo
+        # An error of one repository skips that repository, the others are still processed
+        def process_repo_task(repo):
+            try:
+                return self.process_repo(project_key, repo, push_to_org, bitbucket_access_token, github_account_id,
+                                         github_access_token, github_repo_index)
+            except Exception as e:
+                self.log.error("Failed to process repository",
+                               result="FAILED",
+                               project_key=project_key,
+                               repo_name=repo if (isinstance(repo, str)) else repo["name"],
+                               error=repr(e))
+                return None
 
-            bitbucket_repo_response = requests.get(self.bitbucket_api + f"/projects/{project_key}/repos/{repo_name}",
-                                                   headers={"Authorization": f"Bearer {bitbucket_access_token}"})
+        with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+            process_results = list(executor.map(process_repo_task, repositories))
 
-            if (bitbucket_repo_response.status_code == 404):
-                self.log.error("Repository not found on BitBucket", repo_name=repo_name)
-                continue
-            elif (bitbucket_repo_response.status_code != 200):
-                self.log.error("Failed to process repository", result="FAILED", repo_name=repo_name)
+        for process_result in process_results:
+            if (process_result is None):
                 continue
-            else:  # Success: 200 OK
-                bitbucket_repo_response = json.loads(bitbucket_repo_response.text)
-
-            # Add description
-            if ("description" in bitbucket_repo_response):
-                repo_info["description"] = bitbucket_repo_response["description"]
-            # Add BitBucket Link
-            link = list(filter(utils.MiscUtils.is_http, bitbucket_repo_response["links"]["clone"]))
-            repo_info["bitbucket_link"] = link[0]["href"]
-            self.log.debug("Added repository details from BitBucket", repo_name=repo_name)
-
-            # Use prefixed repo names while checking for anything on GitHub
-            prefixed_repo_name = self.prefix + repo_name
-            # Add GitHub Link
-            if (push_to_org):
-                # Check if same repository already exists on GitHub target org
-                github_org_repo_check_link = self.github_api + f"/repos/{self.target_org}/{prefixed_repo_name}"
-                github_org_repo_check = requests.get(github_org_repo_check_link,
-                                                     headers={"Authorization": f"Bearer {github_access_token}"})
-                # Repository with a similar name already exists on GitHub
-                if (github_org_repo_check.status_code == 200):  # Existing repository
-                    github_org_repo_check = json.loads(github_org_repo_check.text)
-                    self.log.debug("Repository exists on organization",
-                                   exists="YES",
-                                   repo_name=prefixed_repo_name,
-                                   repo_prefix=self.prefix,
-                                   target_org=self.target_org)
-                    repo_info["github_link"] = github_org_repo_check["clone_url"]
-                elif (github_org_repo_check.status_code != 404):  # Error
-                    self.log.error("Failed to check for repository on github",
-                                   result="FAILED",
-                                   repo_name=prefixed_repo_name,
-                                   repo_prefix=self.prefix,
-                                   status_code=github_org_repo_check.status_code)
-                    continue
-                else:  # 404 Not Found
-                    new_repos += 1
-                    self.log.debug("Repository does not exist on organization",
-                                   exists="NO",
-                                   repo_name=prefixed_repo_name,
-                                   repo_prefix=self.prefix,
-                                   target_org=self.target_org)
-            else:
-                # Check if same repository already exists on GitHub
-                github_repo_check_link = self.github_api + f"/repos/{github_account_id}/{prefixed_repo_name}"
-                github_repo_check = requests.get(github_repo_check_link,
-                                                 headers={"Authorization": f"Bearer {github_access_token}"})
-                # Repository with a similar name already exists on GitHub
-                if (github_repo_check.status_code == 200):  # Existing repository
-                    github_repo_check = json.loads(github_repo_check.text)
-                    self.log.debug("Repository exists on GHE account",
-                                   exists="YES",
-                                   repo_name=prefixed_repo_name,
-                                   repo_prefix=self.prefix,
-                                   github_account_id=github_account_id)
-                    repo_info["github_link"] = github_repo_check["clone_url"]
-                elif (github_repo_check.status_code != 404):  # Error
-                    self.log.error("Failed to check for repository on github",
-                                   result="FAILED",
-                                   repo_name=prefixed_repo_name,
-                                   repo_prefix=self.prefix,
-                                   status_code=github_repo_check.status_code)
-                else:  # 404 Not Found
-                    new_repos += 1
-                    self.log.debug("Repository does no exist on GHE account",
-                                   exists="NO",
-                                   repo_name=prefixed_repo_name,
-                                   repo_prefix=self.prefix,
-                                   github_account_id=github_account_id)
+            repo_info, is_new_repo = process_result
+            if (is_new_repo):
+                new_repos += 1
             processed_repos.append(repo_info)
         total_repos = len(processed_repos)
         self.log.info("Syncing/Migrating repositories to GitHub",
@@ -314,6 +267,135 @@ class RepoOps:
                       to_migrate=new_repos)
         return processed_repos, total_repos, new_repos
 
+    # Process a single repository, returns its metadata and repository links and whether it is new to GitHub
+    # Returns None if the repository could not be processed
+    def process_repo(self,
+                     project_key,
+                     repo,
+                     push_to_org,
+                     bitbucket_access_token,
+                     github_account_id,
+                     github_access_token,
+                     github_repo_index=None):
+        repo_name = repo if (isinstance(repo, str)) else repo["name"]
+        with self.tracer.span("metadata", project_key=project_key, repo_name=repo_name):
+            return self.get_repo_info(project_key, repo, push_to_org, bitbucket_access_token, github_account_id,
+                                      github_access_token, github_repo_index)
+
+    def get_repo_info(self, project_key, repo, push_to_org, bitbucket_access_token, github_account_id,
+                      github_access_token, github_repo_index):
+        is_new_repo = False
+        if isinstance(repo, str):  # repositories is a list of repository names
+            # Add name
+            repo_name = repo
+            repo_info = {"name": repo_name}
+        else:  # repositories is a list of repository dicts
+            repo_name = repo["name"]
+            repo_info = repo
+
+        # Use the details from the repository listing of get_bitbucket_repos() (or already in repo), fetch them if
+        # not listed
+        if ("bitbucket_link" in repo_info):
+            repo_details = repo_info
+        else:
+            repo_details = self.bitbucket_repos.get(project_key, {}).get(repo_name)
+        if (repo_details is None):
+            bitbucket_repo_response = self.api_client.get(self.bitbucket_api +
+                                                          f"/projects/{project_key}/repos/{repo_name}",
+                                                          access_token=bitbucket_access_token,
+                                                          cache=True)
+
+            if (bitbucket_repo_response.status_code == 404):
+                self.log.error("Repository not found on BitBucket", repo_name=repo_name)
+                return None
+            elif (bitbucket_repo_response.status_code != 200):
+                self.log.error("Failed to process repository", result="FAILED", repo_name=repo_name)
+                return None
+            else:  # Success: 200 OK
+                repo_details = self.get_bitbucket_repo_details(json.loads(bitbucket_repo_response.text))
+
+        # Add description
+        if ("description" in repo_details):
+            repo_info["description"] = repo_details["description"]
+        # Add BitBucket Link
+        repo_info["bitbucket_link"] = repo_details["bitbucket_link"]
+        # Add project key, repositories with the same name in two projects are cached in different directories
+        repo_info["project_key"] = project_key
+        self.log.debug("Added repository details from BitBucket", repo_name=repo_name)
+
+        # Use prefixed repo names while checking for anything on GitHub
+        prefixed_repo_name = self.prefix + repo_name
+        # Add GitHub Link
+        if (github_repo_index is not None):
+            # Look up the repository in the index of repositories on GitHub
+            github_link = github_repo_index.get(utils.StringUtils.normalize_repo_name(prefixed_repo_name))
+            if (github_link):  # Existing repository
+                self.log.debug("Repository exists on GitHub",
+                               exists="YES",
+                               repo_name=prefixed_repo_name,
+                               repo_prefix=self.prefix)
+                repo_info["github_link"] = github_link
+            else:
+                is_new_repo = True
+                self.log.debug("Repository does not exist on GitHub",
+                               exists="NO",
+                               repo_name=prefixed_repo_name,
+                               repo_prefix=self.prefix)
+        elif (push_to_org):
+            # Check if same repository already exists on GitHub target org
+            github_org_repo_check_link = self.github_api + f"/repos/{self.target_org}/{prefixed_repo_name}"
+            github_org_repo_check = self.api_client.get(github_org_repo_check_link, access_token=github_access_token)
+            # Repository with a similar name already exists on GitHub
+            if (github_org_repo_check.status_code == 200):  # Existing repository
+                github_org_repo_check = json.loads(github_org_repo_check.text)
+                self.log.debug("Repository exists on organization",
+                               exists="YES",
+                               repo_name=prefixed_repo_name,
+                               repo_prefix=self.prefix,
+                               target_org=self.target_org)
+                repo_info["github_link"] = github_org_repo_check["clone_url"]
+            elif (github_org_repo_check.status_code != 404):  # Error
+                self.log.error("Failed to check for repository on github",
+                               result="FAILED",
+                               repo_name=prefixed_repo_name,
+                               repo_prefix=self.prefix,
+                               status_code=github_org_repo_check.status_code)
+                return None
+            else:  # 404 Not Found
+                is_new_repo = True
+                self.log.debug("Repository does not exist on organization",
+                               exists="NO",
+                               repo_name=prefixed_repo_name,
+                               repo_prefix=self.prefix,
+                               target_org=self.target_org)
+        else:
+            # Check if same repository already exists on GitHub
+            github_repo_check_link = self.github_api + f"/repos/{github_account_id}/{prefixed_repo_name}"
+            github_repo_check = self.api_client.get(github_repo_check_link, access_token=github_access_token)
+            # Repository with a similar name already exists on GitHub
+            if (github_repo_check.status_code == 200):  # Existing repository
+                github_repo_check = json.loads(github_repo_check.text)
+                self.log.debug("Repository exists on GHE account",
+                               exists="YES",
+                               repo_name=prefixed_repo_name,
+                               repo_prefix=self.prefix,
+                               github_account_id=github_account_id)
+                repo_info["github_link"] = github_repo_check["clone_url"]
+            elif (github_repo_check.status_code != 404):  # Error
+                self.log.error("Failed to check for repository on github",
+                               result="FAILED",
+                               repo_name=prefixed_repo_name,
+                               repo_prefix=self.prefix,
+                               status_code=github_repo_check.status_code)
+            else:  # 404 Not Found
+                is_new_repo = True
+                self.log.debug("Repository does no exist on GHE account",
+                               exists="NO",
+                               repo_name=prefixed_repo_name,
+                               repo_prefix=self.prefix,
+                               github_account_id=github_account_id)
+        return repo_info, is_new_repo
+
     # Makes a new repo through API calls on either target org or GHE personal account and returns repo link
     def make_new_repo(self, push_to_org, repo, github_account_id, github_access_token):
         # API call to make new remote repo on GitHub
@@ -326,9 +408,9 @@ class RepoOps:
 
         if (push_to_org):
             # Create new repo of same name on GitHub target org
-            git_response = requests.post(self.github_api + f"/orgs/{self.target_org}/repos",
-                                         data=json.dumps(request_payload),
-                                         headers={"Authorization": f"Bearer {github_access_token}"})
+            git_response = self.api_client.post(self.github_api + f"/orgs/{self.target_org}/repos",
+                                                data=json.dumps(request_payload),
+                                                access_token=github_access_token)
             if (git_response.status_code != 201):
                 self.log.error("Failed to create new repository on organization",
                                result="FAILED",
@@ -343,9 +425,9 @@ class RepoOps:
                            target_org=self.target_org)
         else:
             # Create new repo of same name on GitHub Account
-            git_response = requests.post(self.github_api + "/user/repos",
-                                         data=json.dumps(request_payload),
-                                         headers={"Authorization": f"Bearer {github_access_token}"})
+            git_response = self.api_client.post(self.github_api + "/user/repos",
+                                                data=json.dumps(request_payload),
+                                                access_token=github_access_token)
             if (git_response.status_code != 201):
                 self.log.error("Failed to create new repository on personal account",
                                result="FAILED",
@@ -361,116 +443,308 @@ class RepoOps:
 
         github_repo_data = json.loads(git_response.text)
         github_link = github_repo_data["clone_url"]
+        with self.github_repo_index_lock:
+            if (push_to_org in self.github_repo_indexes):
+                repo_index_name = utils.StringUtils.normalize_repo_name(github_repo_data["name"])
+                self.github_repo_indexes[push_to_org][repo_index_name] = github_link
         return github_link
 
-    # Recieves list of repos with metadata, BitBucker and GitHub repo links
-    # Syncs the repos that already exist on GitHub, Migrates over repos that don't exist on GitHub
-    def sync_repos(self, push_to_org, repositories, bitbucket_account_id, bitbucket_access_token, github_account_id,
-                   github_access_token):
-        # Make a folder to clone repos from BitBucket
-        cur_dir_path = os.getcwd()
-        os.chdir(cur_dir_path)
-        is_dir = os.path.isdir("syncDirectory")
-        if (not is_dir):
-            self.log.debug("Created directory syncDirectory")
-            os.mkdir("syncDirectory")
-        os.chdir("syncDirectory")
+    # Returns a mapping of the (normalized) names of all repositories on the GitHub target org, or on the personal
+    # account, to their clone links. The repositories are listed once per run with the maximum page size
+    # Returns None if the repositories could not be listed
+    def get_github_repo_index(self, push_to_org, github_access_token):
+        with self.github_repo_index_lock:
+            if (push_to_org in self.github_repo_indexes):
+                return self.github_repo_indexes[push_to_org]
 
-        for repo in repositories:
-            repo_name = repo['name']
-            prefixed_repo_name = self.prefix + repo_name
-            teams_to_assign = repo["teams"] if ("teams" in repo) else []
-            if ('github_link' in repo):
-                github_link = repo['github_link']
-                repo['new_migration'] = False
-                pass
+            if (push_to_org):
+                self.log.info("Fetching repository list from GitHub organization", target_org=self.target_org)
+                github_repos_link = self.github_api + f"/orgs/{self.target_org}/repos?per_page=100"
             else:
-                github_link = self.make_new_repo(push_to_org, repo, github_account_id, github_access_token)
-                if (github_link is None):
-                    self.log.error("Failed to make new repository", result="FAILED", repo_name=prefixed_repo_name)
-                    continue
-                repo['github_link'] = github_link
-                repo['new_migration'] = True
-
-            # Use this instead of setting the authenticated link as a new remote.
-            # Remote links get stored in git config
-            bitbucket_link = repo['bitbucket_link']
-            bitbucket_link_domain = bitbucket_link.split("//")[1]
-            authenticated_bitbucket_link = f"https://{bitbucket_account_id}:{bitbucket_access_token}@{bitbucket_link_domain}"
+                self.log.info("Fetching repository list from GitHub account")
+                github_repos_link = self.github_api + "/user/repos?affiliation=owner&per_page=100"
+
+            github_repo_index = {}
+            while (github_repos_link):
+                # Always revalidated, repositories made on GitHub since the last run must show up
+                with self.tracer.span("github_index", push_to_org=push_to_org):
+                    github_repos = self.api_client.get(github_repos_link,
+                                                       access_token=github_access_token,
+                                                       cache=True,
+                                                       cache_ttl=0)
+                if (github_repos.status_code != 200):
+                    self.log.warning("Failed to fetch repository list from GitHub",
+                                     result="FAILED",
+                                     status_code=github_repos.status_code)
+                    return None
+                for github_repo in json.loads(github_repos.text):
+                    repo_index_name = utils.StringUtils.normalize_repo_name(github_repo["name"])
+                    github_repo_index[repo_index_name] = github_repo["clone_url"]
+                # Link to the next page, if any
+                github_repos_link = github_repos.links.get("next", {}).get("url")
+
+            self.log.debug("Fetched repository list from GitHub", result="SUCCESS", total_repos=len(github_repo_index))
+            self.github_repo_indexes[push_to_org] = github_repo_index
+            return github_repo_index
+
+    # Drops the cached indexes of repositories on GitHub, they are fetched again on the next lookup
+    def reset_github_repo_index(self):
+        with self.github_repo_index_lock:
+            self.github_repo_indexes = {}
 
-            self.log.info("Syncing repository", repo_name=repo_name)
+    # Recieves list of repos with metadata, BitBucker and GitHub repo links
+    # Syncs the repos that already exist on GitHub, Migrates over repos that don't exist on GitHub
+    # Repositories are synced concurrently by a pool of `workers`, returns the sync result of each repository
+    # With an executor given, its threads (shared with other callers) are used instead of a pool of its own
+    def sync_repos(self,
+                   push_to_org,
+                   repositories,
+                   bitbucket_account_id,
+                   bitbucket_access_token,
+                   github_account_id,
+                   github_access_token,
+                   workers=1,
+                   executor=None):
+        sync_dir_path = self.make_sync_dir()
+
+        # An error of one repository fails that repository, the others are still synced
+        def sync_repo_task(repo):
+            try:
+                return self.sync_repo(push_to_org, repo, sync_dir_path, bitbucket_account_id, bitbucket_access_token,
+                                      github_account_id, github_access_token)
+            except Exception as e:
+                self.log.error("Failed to sync repository", result="FAILED", repo_name=repo['name'], error=repr(e))
+                return RepoOps.make_sync_result(repo['name'])
+
+        self.log.info("Syncing repositories", total_repos=len(repositories), workers=workers)
+        if (executor is not None):
+            sync_results = list(executor.map(sync_repo_task, repositories))
+        else:
+            with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+                sync_results = list(executor.map(sync_repo_task, repositories))
 
-            # Clone the repository from BitBucket
-            if (not os.path.isdir(repo_name)):
-                self.log.info("Cloning repository", repo_name=repo_name)
-                try:
-                    git.clone(authenticated_bitbucket_link)
-                    self.log.debug("Cloned repository", result="SUCCESS", repo_name=repo_name)
-                except ErrorReturnCode as e:
-                    self.log.error("Failed to clone repository",
-                                   result="FAILED",
-                                   repo_name=repo_name,
-                                   exit_code=e.exit_code)
-                    continue
+        # Assign the repositories on GitHub to their teams, with one batch for all repositories
+        if (push_to_org):
+            self.assign_teams(repositories, sync_results, github_access_token, workers)
+
+        for sync_result in sync_results:
+            self.count_sync_result(sync_result)
+        failed_repos = [result["name"] for result in sync_results if result["result"] == "FAILED"]
+        self.log.info("Synced repositories",
+                      total_repos=len(sync_results),
+                      synced_repos=len(sync_results) - len(failed_repos),
+                      failed_repos=failed_repos)
+        return sync_results
+
+    # Make a folder to clone repos from BitBucket, returns its path
+    def make_sync_dir(self):
+        sync_dir_path = os.path.join(os.getcwd(), "syncDirectory")
+        if (not os.path.isdir(sync_dir_path)):
+            self.log.debug("Created directory syncDirectory")
+            os.makedirs(sync_dir_path, exist_ok=True)
+        return sync_dir_path
+
+    # Counts a repository in the metrics as synced, skipped (already up-to-date) or failed
+    def count_sync_result(self, sync_result):
+        if (sync_result["result"] != "SUCCESS"):
+            result = "failed"
+        elif (sync_result["up_to_date"]):
+            result = "skipped"
+        else:
+            result = "synced"
+        self.metrics.inc("git_migration_repos_total", result=result)
+
+    # Returns the initial sync result of a repository, sync_repo() and sync_repo_refs() fill it in
+    @staticmethod
+    def make_sync_result(repo_name):
+        return {
+            "name": repo_name,
+            "result": "FAILED",
+            "synced_tags": [],
+            "failed_tags": [],
+            "synced_branches": [],
+            "failed_branches": [],
+            "teams": {},
+            "up_to_date": False
+        }
+
+    # Syncs a single repository inside its own directory under sync_dir_path and returns the sync result
+    # Git commands are run with the repository directory as their working directory, never with os.chdir
+    # The steps (make_github_repo(), fetch_repo() and push_repo()) can also be run on their own, as by AutoSync
+    def sync_repo(self, push_to_org, repo, sync_dir_path, bitbucket_account_id, bitbucket_access_token,
+                  github_account_id, github_access_token):
+        sync_result = RepoOps.make_sync_result(repo['name'])
+        with self.tracer.span("repo", repo_name=repo['name']):
+            if (not self.make_github_repo(push_to_org, repo, github_account_id, github_access_token)):
+                return sync_result
+            if (self.fetch_repo(repo, sync_result, sync_dir_path, bitbucket_account_id, bitbucket_access_token,
+                                github_account_id, github_access_token)):
+                self.push_repo(repo, sync_result, bitbucket_account_id, bitbucket_access_token, github_account_id,
+                               github_access_token)
+        return sync_result
+
+    # Makes the repository on GitHub unless it already exists there, returns False if it could not be made
+    def make_github_repo(self, push_to_org, repo, github_account_id, github_access_token):
+        if ('github_link' in repo):
+            repo['new_migration'] = False
+            return True
+        with self.tracer.span("create", repo_name=repo['name']):
+            github_link = self.make_new_repo(push_to_org, repo, github_account_id, github_access_token)
+        if (github_link is None):
+            self.log.error("Failed to make new repository", result="FAILED", repo_name=self.prefix + repo['name'])
+            return False
+        repo['github_link'] = github_link
+        repo['new_migration'] = True
+        return True
+
+    # Fetches the branches and tags of a repository from BitBucket into its bare repository under sync_dir_path
+    # Returns whether the fetched refs need to be pushed, an up-to-date repository is marked synced in sync_result
+    def fetch_repo(self, repo, sync_result, sync_dir_path, bitbucket_account_id, bitbucket_access_token,
+                   github_account_id, github_access_token):
+        repo_name = repo['name']
+        with self.tracer.span("fetch", repo_name=repo_name):
+            try:
+                # Use this instead of setting the authenticated link as a new remote.
+                # Remote links get stored in git config
+                authenticated_bitbucket_link = utils.StringUtils.get_authenticated_link(
+                    repo['bitbucket_link'], bitbucket_account_id, bitbucket_access_token)
+
+                self.log.info("Syncing repository", repo_name=repo_name)
+
+                # Compare the refs on BitBucket with the refs on GitHub, nothing needs to be pushed if none changed
+                repo['github_refs'] = {}
+                if (not repo['new_migration']):
+                    authenticated_github_link = utils.StringUtils.get_authenticated_link(
+                        repo['github_link'], github_account_id, github_access_token)
+                    bitbucket_refs = self.get_remote_refs(authenticated_bitbucket_link, bitbucket_access_token)
+                    repo['github_refs'] = self.get_remote_refs(authenticated_github_link, github_access_token)
+                    if (bitbucket_refs and self.is_repo_up_to_date(bitbucket_refs, repo['github_refs'])):
+                        self.log.info("Repository up-to-date", repo_name=repo_name)
+                        sync_result["result"] = "SUCCESS"
+                        sync_result["up_to_date"] = True
+                        return False
+
+                # Local bare repository to fetch the refs from BitBucket into
+                repo['local_path'] = RepoOps.get_local_repo_path(repo, sync_dir_path)
+                if (not self.prepare_local_repo(repo, sync_dir_path)):
+                    return False
+
+                # Fetch the branches and tags from BitBucket once, both are synced from the fetched refs
+                return self.fetch_refs(repo, authenticated_bitbucket_link, bitbucket_access_token)
+            except GIT_REMOTE_ERRORS as e:
+                self.log_sync_error(repo_name, e, bitbucket_access_token, github_access_token)
+                return False
+
+    # Pushes the refs fetched by fetch_repo() to GitHub and fills in the sync result
+    def push_repo(self, repo, sync_result, bitbucket_account_id, bitbucket_access_token, github_account_id,
+                  github_access_token):
+        with self.tracer.span("push", repo_name=repo['name']):
+            try:
+                self.push_fetched_refs(repo, sync_result, bitbucket_account_id, bitbucket_access_token,
+                                       github_account_id, github_access_token)
+            except GIT_REMOTE_ERRORS as e:
+                self.log_sync_error(repo['name'], e, bitbucket_access_token, github_access_token)
+
+    def log_sync_error(self, repo_name, error, bitbucket_access_token, github_access_token):
+        self.log.error("Failed to sync repository",
+                       result="FAILED",
+                       repo_name=repo_name,
+                       **RepoOps.get_git_error_details(error, bitbucket_access_token, github_access_token))
+
+    # Returns the details of a failed git command to log: the exit code and stderr with the access tokens redacted,
+    # or the error when the command was not run (circuit breaker open)
+    @staticmethod
+    def get_git_error_details(error, *access_tokens):
+        if (not isinstance(error, ErrorReturnCode)):
+            return {"error": str(error)}
+        # Redact or remove the access tokens before logging
+        stderr = error.stderr
+        for access_token in access_tokens:
+            stderr = utils.StringUtils.redact_error(stderr, access_token, "<ACCESS-TOKEN>")
+        return {"exit_code": error.exit_code, "stderr": stderr}
+
+    # Pushes the tags and branches fetched by fetch_refs() to GitHub and fills in the sync result
+    def push_fetched_refs(self, repo, sync_result, bitbucket_account_id, bitbucket_access_token, github_account_id,
+                          github_access_token):
+        repo_name = repo['name']
+        # Sync all tags individually
+        tags_sync_success, all_tags, failed_tags = self.sync_tags(repo, bitbucket_account_id, bitbucket_access_token,
+                                                                  github_account_id, github_access_token)
+        if (not tags_sync_success):
+            self.log.warning("Failed to sync tags for repository",
+                             result="FAILED",
+                             repo_name=repo_name,
+                             failed_tags=failed_tags)
+        # Sync all branches individually
+        branches_sync_success, all_branches, failed_branches = self.sync_branches(repo, bitbucket_account_id,
+                                                                                  bitbucket_access_token,
+                                                                                  github_account_id,
+                                                                                  github_access_token)
+        if (not branches_sync_success):
+            self.log.warning("Failed to sync branches for repository",
+                             result="FAILED",
+                             repo_name=repo_name,
+                             failed_branches=failed_branches)
+
+        failed_tag_set = set(failed_tags)
+        failed_branch_set = set(failed_branches)
+        sync_result["synced_tags"] = [tag for tag in all_tags if tag not in failed_tag_set]
+        sync_result["failed_tags"] = failed_tags
+        sync_result["synced_branches"] = [branch for branch in all_branches if branch not in failed_branch_set]
+        sync_result["failed_branches"] = failed_branches
+        if (tags_sync_success and branches_sync_success):
+            sync_result["result"] = "SUCCESS"
+            self.log.debug("Successfully synced all tags and branches for repository",
+                           result="SUCCESS",
+                           repo_name=repo_name)
 
-            os.chdir(repo_name)  # IMPORTANT DO NOT DELETE
-            # Sync all tags individually
-            tags_sync_success, all_tags, failed_tags = self.sync_tags(repo, bitbucket_account_id,
-                                                                      bitbucket_access_token, github_account_id,
-                                                                      github_access_token)
-            if (not tags_sync_success):
-                self.log.warning("Failed to sync tags for repository",
-                                 result="FAILED",
-                                 repo_name=repo_name,
-                                 failed_tags=failed_tags)
-            # Sync all branches individually
-            branches_sync_success, all_branches, failed_branches = self.sync_branches(
-                repo, bitbucket_account_id, bitbucket_access_token, github_account_id, github_access_token)
-            if (not branches_sync_success):
-                self.log.warning("Failed to sync branches for repository",
-                                 result="FAILED",
-                                 repo_name=repo_name,
-                                 failed_branches=failed_branches)
+    # Syncs only the given refs of a repository that already exists on GitHub and returns the sync result
+    # changed_refs is a list of BitBucket refs (refs/heads/<branch> or refs/tags/<tag>) that were added or updated,
+    # they are fetched and pushed without listing or comparing the other refs of the repository
+    def sync_repo_refs(self, repo, changed_refs, bitbucket_account_id, bitbucket_access_token, github_account_id,
+                       github_access_token):
+        repo_name = repo['name']
+        sync_result = RepoOps.make_sync_result(repo_name)
+        sync_dir_path = self.make_sync_dir()
+        with self.tracer.span("repo", repo_name=repo_name, changed_refs=len(changed_refs)):
+            try:
+                authenticated_bitbucket_link = utils.StringUtils.get_authenticated_link(
+                    repo['bitbucket_link'], bitbucket_account_id, bitbucket_access_token)
 
-            if (tags_sync_success and branches_sync_success):
-                self.log.debug("Successfully synced all tags and branches for repository",
-                               result="SUCCESS",
-                               repo_name=repo_name)
-            # Assign repo to teams, reuse existing function assign_repos_to_teams()
-            if (push_to_org and github_link and teams_to_assign):
-                repo_assignment = {}
-                for team_name in teams_to_assign:
-                    repo_assignment[team_name] = [prefixed_repo_name]
-                self.assign_repos_to_teams(repo_assignment, github_access_token)
-            os.chdir("..")  # IMPORTANT DO NOT DELETE
+                self.log.info("Syncing changed refs of repository", repo_name=repo_name, changed_refs=changed_refs)
+                repo['new_migration'] = False
+                repo['github_refs'] = {}
+                repo['local_path'] = RepoOps.get_local_repo_path(repo, sync_dir_path)
+                if (not self.prepare_local_repo(repo, sync_dir_path)):
+                    return sync_result
+                if (not self.fetch_refs(repo, authenticated_bitbucket_link, bitbucket_access_token, changed_refs)):
+                    return sync_result
+                self.push_fetched_refs(repo, sync_result, bitbucket_account_id, bitbucket_access_token,
+                                       github_account_id, github_access_token)
+            except GIT_REMOTE_ERRORS as e:
+                self.log.error("Failed to sync changed refs of repository",
+                               result="FAILED",
+                               repo_name=repo_name,
+                               **RepoOps.get_git_error_details(e, bitbucket_access_token, github_access_token))
+        self.count_sync_result(sync_result)
+        return sync_result
 
     def sync_tags(self, repo, bitbucket_account_id, bitbucket_access_token, github_account_id, github_access_token):
-        # Everytime, tags are fetched from remote (bitbucket) and then pushed to github
+        # Everytime, tags are pushed to github from the refs fetched from remote (bitbucket) by fetch_refs()
         repo_name = repo['name']
         prefixed_repo_name = self.prefix + repo_name
         github_link = repo['github_link']
-        bitbucket_link = repo['bitbucket_link']
 
         # Use this instead of setting the authenticated link as a new remote.
         # Remote links get stored in git config
-        github_link_domain = github_link.split("//")[1]
-        authenticated_github_link = f"https://{github_account_id}:{github_access_token}@{github_link_domain}"
+        authenticated_github_link = utils.StringUtils.get_authenticated_link(github_link, github_account_id,
+                                                                             github_access_token)
 
-        bitbucket_link_domain = bitbucket_link.split("//")[1]
-        authenticated_bitbucket_link = f"https://{bitbucket_account_id}:{bitbucket_access_token}@{bitbucket_link_domain}"
+        repo_git = git.bake(_cwd=repo['local_path'])
 
-        git.remote('set-url', 'origin', bitbucket_link)
-        self.log.debug("Syncing Tags. Set origin to BitBucket", repo_name=repo_name, bitbucket_link=bitbucket_link)
-
-        # Fetch tags from origin (bitbucket)
-        self.log.info("Fetching refs (tags) from origin", repo_name=repo_name)
-        # git.fetch('origin')
-        git.fetch(authenticated_bitbucket_link)
-        self.log.debug("Fetched refs (tags) from BitBucket", result="SUCCESS", repo_name=repo_name)
-
-        # List all tags
-        tags = git.tag().split('\n')
-        tags = [tag.lstrip().rstrip() for tag in tags if tag]
+        # List all tags with the objects they point to
+        tag_refs = {ref: sha for ref, sha in repo['local_refs'].items() if ref.startswith("refs/tags/")}
+        tags = [tag_ref[len("refs/tags/"):] for tag_ref in tag_refs]
 
         success_tags = []
         failed_tags = []
@@ -482,30 +756,42 @@ class RepoOps:
                        repo_prefix=self.prefix,
                        github_link=github_link)
 
-        # Push each tag individually, log error if any fails and continue to next tag
-        for tag_name in tags:
+        # Tags which already point to the same object on GitHub do not need to be pushed again
+        github_refs = repo['github_refs']
+        unchanged_tags = {
+            tag_name
+            for tag_name in tags if github_refs.get(f"refs/tags/{tag_name}") == tag_refs[f"refs/tags/{tag_name}"]
+        }
+        success_tags += unchanged_tags
+        if (unchanged_tags):
+            self.log.debug("Skipping tags up-to-date on GitHub",
+                           repo_name=repo_name,
+                           unchanged_tags=len(unchanged_tags))
+
+        # Push the tags (individually or in batches), log error if any fails and continue to next tag
+        tag_refspecs = {
+            f"refs/tags/{tag_name}:refs/tags/{tag_name}": tag_name
+            for tag_name in tags if (tag_name not in unchanged_tags)
+        }
+        for tag_name in tag_refspecs.values():
             self.log.info("Syncing tag for repository", repo_name=repo_name, tag_name=tag_name)
-            try:
-                tag_refspec = f"refs/tags/{tag_name}:refs/tags/{tag_name}"
-                git.push(authenticated_github_link, tag_refspec)
-                self.log.debug("Pushed tag for repository",
-                               result="SUCCESS",
-                               repo_name=prefixed_repo_name,
-                               repo_prefix=self.prefix,
-                               tag_name=tag_name)
-                success_tags.append(tag_name)
-            except ErrorReturnCode as e:
-                # Redact or remove the access token before logging
-                stderr = utils.StringUtils.redact_error(e.stderr, github_access_token, "<ACCESS-TOKEN>")
+        push_errors = self.push_refspecs(repo_git, authenticated_github_link, list(tag_refspecs))
+        for tag_refspec, tag_name in tag_refspecs.items():
+            if (tag_refspec in push_errors):
                 self.log.error("Failed to push tag to github",
                                result="FAILED",
                                repo_name=prefixed_repo_name,
                                repo_prefix=self.prefix,
                                tag_name=tag_name,
-                               exit_code=e.exit_code,
-                               stderr=stderr)
+                               **RepoOps.get_git_error_details(push_errors[tag_refspec], github_access_token))
                 failed_tags.append(tag_name)
-                continue
+            else:
+                self.log.debug("Pushed tag for repository",
+                               result="SUCCESS",
+                               repo_name=prefixed_repo_name,
+                               repo_prefix=self.prefix,
+                               tag_name=tag_name)
+                success_tags.append(tag_name)
 
         tags_sync_success = set(tags) == set(success_tags)
         return tags_sync_success, tags, failed_tags
@@ -514,34 +800,24 @@ class RepoOps:
         repo_name = repo['name']
         prefixed_repo_name = self.prefix + repo_name
         github_link = repo['github_link']
-        bitbucket_link = repo['bitbucket_link']
 
         # Boolean: whether the repo is a new migration to GitHub
         new_migration = repo['new_migration']
 
         # Use this instead of setting the authenticated link as a new remote.
         # Remote links get stored in git config
-        github_link_domain = github_link.split("//")[1]
-        authenticated_github_link = f"https://{github_account_id}:{github_access_token}@{github_link_domain}"
+        authenticated_github_link = utils.StringUtils.get_authenticated_link(github_link, github_account_id,
+                                                                             github_access_token)
 
-        bitbucket_link_domain = bitbucket_link.split("//")[1]
-        authenticated_bitbucket_link = f"https://{bitbucket_account_id}:{bitbucket_access_token}@{bitbucket_link_domain}"
+        repo_git = git.bake(_cwd=repo['local_path'])
 
-        # Set remote to bitbucket
-        git.remote('set-url', 'origin', bitbucket_link)
-        self.log.debug("Syncing branches. Set origin to Bitbucket", repo_name=repo_name, bitbucket_link=bitbucket_link)
-
-        # Fetch branches from origin (bitbucket)
-        self.log.info("Fetching refs (branches) from origin", repo_name=repo_name)
-        # git.fetch('origin')
-        git.fetch(authenticated_bitbucket_link)
-        self.log.debug("Fetched refs (branches) from BitBucket", result="SUCCESS", repo_name=repo_name)
+        # Commits the remote branches fetched by fetch_refs() point to
+        branch_refs = {ref: sha for ref, sha in repo['local_refs'].items() if ref.startswith("refs/remotes/origin/")}
 
         # List remote branches
-        remote_branches = git.branch("-r").split("\n")
         remote_branches = [
-            remote.lstrip().rstrip() for remote in remote_branches
-            if (remote and not re.match("^.*/HEAD -> .*$", remote))
+            "origin/" + branch_ref[len("refs/remotes/origin/"):] for branch_ref in branch_refs
+            if (branch_ref != "refs/remotes/origin/HEAD")
         ]
 
         try:
@@ -556,149 +832,449 @@ class RepoOps:
         success_branches = []
         failed_branches = []
 
-        # Push changes to each branch individually, log error if any fails and continue to next branch
+        # Collect the refspecs of every branch to push, the branch name and target branch name of each refspec
+        branch_refspecs = []
         for remote in remote_branches:
             [remote_name, branch_name] = remote.split('/', 1)
 
             self.log.info("Syncing branch for repository", repo_name=repo_name, branch_name=branch_name)
 
-            if (remote_name == 'origin'):
-
-                # Different way to handle master branches, support prefixing.
-                if (branch_name == "master"):
-                    master_branch_refspecs = []
-                    prefix_exists = self.master_branch_prefix != ""
-                    if (prefix_exists):
-                        # Order is IMPORTANT, 'master' should be added before prefixed_master.
-                        # Default branch is the first branch that is pushed to GitHub
-                        if (new_migration):
-                            master_branch_refspecs.append(f"refs/remotes/origin/{branch_name}:refs/heads/{branch_name}")
-                        prefixed_master_branch_name = self.master_branch_prefix + branch_name
-                        master_branch_refspecs.append(
-                            f"refs/remotes/origin/{branch_name}:refs/heads/{prefixed_master_branch_name}")
-                    else:
-                        master_branch_refspecs.append(f"refs/remotes/origin/{branch_name}:refs/heads/{branch_name}")
-                    for branch_refspec in master_branch_refspecs:
-                        target_branch_name = branch_refspec.split('/')[-1]
-                        try:
-                            self.log.info("Pushing branch for repository",
-                                          repo_name=prefixed_repo_name,
-                                          repo_prefix=self.prefix,
-                                          branch_name=branch_name,
-                                          target_branch_name=target_branch_name)
-                            git.push(authenticated_github_link, branch_refspec)
-                            # Success on syncing current branch
-                            self.log.debug("Successfully synced branch for repository",
-                                           result="SUCCESS",
-                                           repo_name=prefixed_repo_name,
-                                           repo_prefix=self.prefix,
-                                           branch_name=branch_name,
-                                           target_branch_name=target_branch_name)
-                            success_branches.append(branch_name)
-                        except ErrorReturnCode as e:
-                            # Redact or remove the access token before logging
-                            stderr = utils.StringUtils.redact_error(e.stderr, github_access_token, "<ACCESS-TOKEN>")
-                            self.log.error("Failed to push changes to origin branch",
-                                           result="FAILED",
-                                           repo_name=prefixed_repo_name,
-                                           repo_prefix=self.prefix,
-                                           branch_name=branch_name,
-                                           target_branch_name=target_branch_name,
-                                           exit_code=e.exit_code,
-                                           stderr=stderr)
-                            failed_branches.append(branch_name)
-                            continue  # Continue to the next master_branch_refspec
-                    continue  # Continue to the next branch
-
-                branch_refspec = f"refs/remotes/origin/{branch_name}:refs/heads/{branch_name}"
-                try:
-                    self.log.info("Pushing branch for repository",
-                                  repo_name=prefixed_repo_name,
-                                  repo_prefix=self.prefix,
-                                  branch_name=branch_name,
-                                  target_branch_name=branch_name)
-                    git.push(authenticated_github_link, branch_refspec)
-                    # Success on syncing current branch
-                    self.log.debug("Successfully synced branch for repository",
-                                   result="SUCCESS",
-                                   repo_name=prefixed_repo_name,
-                                   repo_prefix=self.prefix,
-                                   branch_name=branch_name,
-                                   target_branch_name=branch_name)
-                    success_branches.append(branch_name)
-                except ErrorReturnCode as e:
-                    # Redact or remove the access token before logging
-                    stderr = utils.StringUtils.redact_error(e.stderr, github_access_token, "<ACCESS-TOKEN>")
-                    self.log.error("Failed to push changes to origin branch",
-                                   result="FAILED",
-                                   repo_name=prefixed_repo_name,
-                                   repo_prefix=self.prefix,
-                                   branch_name=branch_name,
-                                   target_branch_name=branch_name,
-                                   exit_code=e.exit_code,
-                                   stderr=stderr)
-                    failed_branches.append(branch_name)
-                    continue
-            else:
+            if (remote_name != 'origin'):
                 continue
 
+            # Different way to handle master branches, support prefixing.
+            if (branch_name == "master"):
+                prefix_exists = self.master_branch_prefix != ""
+                if (prefix_exists):
+                    # Order is IMPORTANT, 'master' should be added before prefixed_master.
+                    # Default branch is the first branch that is pushed to GitHub
+                    if (new_migration):
+                        branch_refspecs.append(
+                            (f"refs/remotes/origin/{branch_name}:refs/heads/{branch_name}", branch_name, branch_name))
+                    prefixed_master_branch_name = self.master_branch_prefix + branch_name
+                    branch_refspecs.append(
+                        (f"refs/remotes/origin/{branch_name}:refs/heads/{prefixed_master_branch_name}", branch_name,
+                         prefixed_master_branch_name))
+                else:
+                    branch_refspecs.append(
+                        (f"refs/remotes/origin/{branch_name}:refs/heads/{branch_name}", branch_name, branch_name))
+                continue  # Continue to the next branch
+
+            branch_refspecs.append(
+                (f"refs/remotes/origin/{branch_name}:refs/heads/{branch_name}", branch_name, branch_name))
+
+        # Branches which already point to the same commit on GitHub do not need to be pushed again
+        github_refs = repo['github_refs']
+        unchanged_branch_refspecs = {(branch_refspec, branch_name, target_branch_name)
+                                     for branch_refspec, branch_name, target_branch_name in branch_refspecs
+                                     if github_refs.get(f"refs/heads/{target_branch_name}") == branch_refs.get(
+                                         f"refs/remotes/origin/{branch_name}")}
+        success_branches += [branch_name for _, branch_name, _ in unchanged_branch_refspecs]
+        branch_refspecs = [
+            branch_refspec for branch_refspec in branch_refspecs if (branch_refspec not in unchanged_branch_refspecs)
+        ]
+        if (unchanged_branch_refspecs):
+            self.log.debug("Skipping branches up-to-date on GitHub",
+                           repo_name=repo_name,
+                           unchanged_branches=len(unchanged_branch_refspecs))
+
+        for branch_refspec, branch_name, target_branch_name in branch_refspecs:
+            self.log.info("Pushing branch for repository",
+                          repo_name=prefixed_repo_name,
+                          repo_prefix=self.prefix,
+                          branch_name=branch_name,
+                          target_branch_name=target_branch_name)
+        refspecs = [branch_refspec for branch_refspec, _, _ in branch_refspecs]
+        if (new_migration and refspecs):
+            # The first branch pushed becomes the default branch on GitHub, never batch it with other branches
+            push_errors = self.push_refspecs(repo_git, authenticated_github_link, refspecs[:1])
+            push_errors.update(self.push_refspecs(repo_git, authenticated_github_link, refspecs[1:]))
+        else:
+            push_errors = self.push_refspecs(repo_git, authenticated_github_link, refspecs)
+
+        # Log error for every branch that failed to push and continue to the next branch
+        for branch_refspec, branch_name, target_branch_name in branch_refspecs:
+            if (branch_refspec in push_errors):
+                self.log.error("Failed to push changes to origin branch",
+                               result="FAILED",
+                               repo_name=prefixed_repo_name,
+                               repo_prefix=self.prefix,
+                               branch_name=branch_name,
+                               target_branch_name=target_branch_name,
+                               **RepoOps.get_git_error_details(push_errors[branch_refspec], github_access_token))
+                failed_branches.append(branch_name)
+            else:
+                # Success on syncing current branch
+                self.log.debug("Successfully synced branch for repository",
+                               result="SUCCESS",
+                               repo_name=prefixed_repo_name,
+                               repo_prefix=self.prefix,
+                               branch_name=branch_name,
+                               target_branch_name=target_branch_name)
+                success_branches.append(branch_name)
+
         all_remote_branches = [branch_name.split('origin/')[1] for branch_name in remote_branches]
         branches_sync_success = set(all_remote_branches) == set(success_branches)
         return branches_sync_success, all_remote_branches, failed_branches
 
-    # Get list of all teams from GHE target org
+    # Path of the bare repository of a repository, in the directory of its project (syncDirectory/<project>/<repo>.git)
+    @staticmethod
+    def get_local_repo_path(repo, sync_dir_path):
+        return os.path.join(sync_dir_path, repo['project_key'], f"{repo['name']}.git")
+
+    # Makes sure the bare repository at repo['local_path'] exists, returns False if it could not be made
+    # Repositories left by earlier versions without the project directory are moved to it: a working-tree clone at
+    # syncDirectory/<repo> is converted to a bare repository, a bare repository at syncDirectory/<repo>.git is moved
+    def prepare_local_repo(self, repo, sync_dir_path):
+        repo_name = repo['name']
+        local_path = repo['local_path']
+        if (os.path.isdir(local_path)):
+            return True
+
+        working_tree_path = os.path.join(sync_dir_path, repo_name)
+        old_bare_path = os.path.join(sync_dir_path, f"{repo_name}.git")
+        try:
+            with self.tracer.span("prepare_local_repo"), self.local_repo_lock:
+                # Made by another project's worker while waiting for the lock
+                if (os.path.isdir(local_path)):
+                    return True
+                os.makedirs(os.path.dirname(local_path), exist_ok=True)
+                if (os.path.isdir(old_bare_path)):
+                    self.log.info("Moving bare repository to project directory", repo_name=repo_name)
+                    os.rename(old_bare_path, local_path)
+                    repo_git = git.bake(_cwd=local_path)
+                    # The old repository may have been fetched from a repository of the same name in another project
+                    repo_git.config("remote.origin.url", repo['bitbucket_link'])
+                elif (os.path.isdir(os.path.join(working_tree_path, ".git"))):
+                    self.log.info("Converting repository clone to bare repository", repo_name=repo_name)
+                    os.rename(os.path.join(working_tree_path, ".git"), local_path)
+                    shutil.rmtree(working_tree_path, onerror=utils.FileUtils.remove_readonly)
+                    repo_git = git.bake(_cwd=local_path)
+                    repo_git.config("--bool", "core.bare", "true")
+                    repo_git.config("remote.origin.url", repo['bitbucket_link'])
+                else:
+                    self.log.info("Initializing bare repository", repo_name=repo_name)
+                    git.init("--bare", local_path, _cwd=sync_dir_path)
+                    repo_git = git.bake(_cwd=local_path)
+                    repo_git.remote("add", "origin", repo['bitbucket_link'])
+                repo_git.config("remote.origin.fetch", BITBUCKET_FETCH_REFSPECS[0])
+            self.log.debug("Prepared bare repository", result="SUCCESS", repo_name=repo_name)
+            return True
+        except (ErrorReturnCode, OSError) as e:
+            self.log.error("Failed to prepare bare repository", result="FAILED", repo_name=repo_name, error=str(e))
+            return False
+
+    # Runs a git command that talks to the remote at link, retrying it when it fails because of the network or the
+    # server (with the API client's retry policy and the circuit breaker of the remote's host)
+    # Fetches, ls-remotes and pushes of explicit refspecs give the same result when run again, so all are retried
+    # The operation ("fetch", "ls-remote" or "push") is counted in the metrics, with the bytes fetched or pushed
+    # Raises CircuitOpenError when the host stays unavailable, callers catch it with the git errors (GIT_REMOTE_ERRORS)
+    def run_remote_git(self, operation, link, git_command, *args):
+        start = time.perf_counter()
+        result = "failed"
+        try:
+            output = self.retry_remote_git(operation, link, git_command, *args)
+            result = "success"
+        finally:
+            self.metrics.inc("git_migration_git_operations_total", operation=operation, result=result)
+            self.metrics.observe("git_migration_git_operation_duration_seconds",
+                                 time.perf_counter() - start,
+                                 operation=operation)
+        if (operation in GIT_TRANSFER_DIRECTIONS):
+            self.metrics.inc("git_migration_git_bytes_total",
+                             RepoOps.get_transferred_bytes(output.stderr),
+                             direction=GIT_TRANSFER_DIRECTIONS[operation])
+        return output
+
+    def retry_remote_git(self, operation, link, git_command, *args):
+        host = urlsplit(link).hostname
+        circuit_breaker = self.api_client.circuit_breakers.get(host)
+        retry_policy = self.api_client.retry_policy
+        retries = 0
+        while (True):
+            circuit_breaker.before_request()
+            try:
+                result = git_command(*args)
+            except ErrorReturnCode as e:
+                if (not RetryPolicy.is_transient_git_error(e)):
+                    # The host answered, the command failed for another reason (auth, rejected refs...)
+                    circuit_breaker.record_success()
+                    raise
+                circuit_breaker.record_failure()
+                if (retries >= retry_policy.max_retries):
+                    raise
+                retries += 1
+                delay = retry_policy.get_delay(retries - 1)
+                self.metrics.inc("git_migration_git_retries_total", operation=operation)
+                self.log.warning("Git command failed, retrying",
+                                 host=host,
+                                 exit_code=e.exit_code,
+                                 retry=retries,
+                                 wait_seconds=round(delay, 1))
+                time.sleep(delay)
+                continue
+            except Exception:
+                # Ends a half-open probe too, the breaker would otherwise wait for the probe forever
+                circuit_breaker.record_failure()
+                raise
+            circuit_breaker.record_success()
+            return result
+
+    # Fetches all branches and tags from BitBucket with a single fetch, pruning the refs deleted on BitBucket
+    # With refs given, only those BitBucket refs (refs/heads/<branch> or refs/tags/<tag>) are fetched, nothing is pruned
+    # Stores the fetched refs in repo['local_refs'] for sync_tags() and sync_branches(), returns False on failure
+    def fetch_refs(self, repo, authenticated_bitbucket_link, bitbucket_access_token, refs=None):
+        repo_name = repo['name']
+        bitbucket_link = repo['bitbucket_link']
+        repo_git = git.bake(_cwd=repo['local_path'])
+        repo_git.remote('set-url', 'origin', bitbucket_link)
+        self.log.debug("Set origin to BitBucket", repo_name=repo_name, bitbucket_link=bitbucket_link)
+
+        # Fetch branches and tags from origin (bitbucket)
+        self.log.info("Fetching refs (branches and tags) from origin", repo_name=repo_name)
+        if (refs is None):
+            fetch_args = ["--prune", "--no-tags", authenticated_bitbucket_link] + BITBUCKET_FETCH_REFSPECS
+            local_ref_patterns = ["refs/tags/", "refs/remotes/origin/"]
+        else:
+            local_ref_patterns = [
+                ref if (ref.startswith("refs/tags/")) else "refs/remotes/origin/" + ref[len("refs/heads/"):]
+                for ref in refs
+            ]
+            fetch_args = ["--no-tags", authenticated_bitbucket_link
+                          ] + [f"+{ref}:{local_ref}" for ref, local_ref in zip(refs, local_ref_patterns)]
+        try:
+            with self.tracer.span("git_fetch", refs=len(refs) if (refs is not None) else "all"):
+                self.run_remote_git("fetch", authenticated_bitbucket_link, repo_git, *GIT_FETCH_OPTIONS, *fetch_args)
+        except GIT_REMOTE_ERRORS as e:
+            self.log.error("Failed to fetch refs from BitBucket",
+                           result="FAILED",
+                           repo_name=repo_name,
+                           **RepoOps.get_git_error_details(e, bitbucket_access_token))
+            return False
+        self.log.debug("Fetched refs (branches and tags) from BitBucket", result="SUCCESS", repo_name=repo_name)
+
+        repo['local_refs'] = self.get_local_refs(repo_git, *local_ref_patterns)
+        return True
+
+    # Returns a mapping of the branch and tag refs on a remote repository to the objects they point to
+    # Returns an empty mapping if the refs could not be listed
+    def get_remote_refs(self, authenticated_link, access_token):
+        try:
+            with self.tracer.span("git_ls_remote", host=urlsplit(authenticated_link).hostname):
+                ls_remote_output = self.run_remote_git("ls-remote", authenticated_link, git, "ls-remote", "--heads",
+                                                       "--tags", authenticated_link)
+        except GIT_REMOTE_ERRORS as e:
+            self.log.debug("Failed to list remote refs",
+                           result="FAILED",
+                           **RepoOps.get_git_error_details(e, access_token))
+            return {}
+        remote_refs = {}
+        for line in str(ls_remote_output).split("\n"):
+            if (not line or line.endswith("^{}")):
+                continue
+            [sha, ref] = line.split("\t", 1)
+            remote_refs[ref] = sha
+        return remote_refs
+
+    # Returns a mapping of the local refs matching the patterns (ref names or prefixes) to the objects they point to
+    def get_local_refs(self, repo_git, *ref_patterns):
+        for_each_ref_output = repo_git("for-each-ref", "--format=%(objectname) %(refname)", *ref_patterns)
+        local_refs = {}
+        for line in str(for_each_ref_output).split("\n"):
+            if (not line):
+                continue
+            [sha, ref] = line.split(" ", 1)
+            local_refs[ref] = sha
+        return local_refs
+
+    # Returns the number of bytes a git fetch or push transferred, from the stderr of its --progress output
+    @staticmethod
+    def get_transferred_bytes(stderr):
+        transfer_sizes = GIT_TRANSFER_SIZE.findall(stderr.decode("utf-8", errors="replace"))
+        if (not transfer_sizes):
+            return 0
+        size, unit = transfer_sizes[-1]
+        return int(float(size) * GIT_SIZE_UNITS[unit])
+
+    # Whether every branch and tag on BitBucket already points to the same object on GitHub
+    # BitBucket's master branch is compared against the prefixed master branch on GitHub
+    def is_repo_up_to_date(self, bitbucket_refs, github_refs):
+        for ref, sha in bitbucket_refs.items():
+            target_ref = ref
+            if (ref == "refs/heads/master" and self.master_branch_prefix != ""):
+                target_ref = f"refs/heads/{self.master_branch_prefix}master"
+            if (github_refs.get(target_ref) != sha):
+                return False
+        return True
+
+    # Pushes the refspecs to GitHub and returns a mapping of the refspecs that failed to push to their errors
+    # With push_batch_size set, refspecs are pushed in chunks of push_batch_size with a single `git push` each
+    # When a chunk is rejected, its refspecs are pushed one at a time to find out which of them failed
+    # When GitHub is unavailable (circuit breaker open), the remaining refspecs fail without being pushed
+    def push_refspecs(self, repo_git, authenticated_github_link, refspecs):
+        push_errors = {}
+        batch_size = self.push_batch_size if (self.push_batch_size > 1) else 1
+        try:
+            for start in range(0, len(refspecs), batch_size):
+                refspec_batch = refspecs[start:start + batch_size]
+                try:
+                    with self.tracer.span("git_push", refs=len(refspec_batch)):
+                        self.run_remote_git("push", authenticated_github_link, repo_git.push, "--progress",
+                                            authenticated_github_link, *refspec_batch)
+                    continue
+                except ErrorReturnCode as e:
+                    if (len(refspec_batch) == 1):
+                        push_errors[refspec_batch[0]] = e
+                        continue
+                    self.log.debug("Batched push rejected, pushing refs individually", refs=len(refspec_batch))
+                for refspec in refspec_batch:
+                    try:
+                        with self.tracer.span("git_push", refs=1):
+                            self.run_remote_git("push", authenticated_github_link, repo_git.push, "--progress",
+                                                authenticated_github_link, refspec)
+                    except ErrorReturnCode as e:
+                        push_errors[refspec] = e
+        except CircuitOpenError as e:
+            for refspec in refspecs:
+                push_errors.setdefault(refspec, e)
+        return push_errors
+
+    # Get list of all teams from GHE target org (all pages), None if it could not be fetched
+    # Use get_team_ids() for lookups, it fetches the teams once per run
     def get_teams_info(self, github_access_token):
         self.log.info("Fetching teams list from GitHub")
-        teams_info_list = requests.get(self.github_api + f"/orgs/{self.target_org}/teams",
-                                       headers={"Authorization": f"Bearer {github_access_token}"})
-        if (teams_info_list.status_code != 200):
-            self.log.error("Failed to fetch teams list", result="FAILED", target_org=self.target_org)
-            exit(1)
-        teams_info_list = json.loads(teams_info_list.text)
+        teams_info_list = []
+        teams_link = self.github_api + f"/orgs/{self.target_org}/teams?per_page=100"
+        while (teams_link):
+            teams_response = self.api_client.get(teams_link, access_token=github_access_token, cache=True)
+            if (teams_response.status_code != 200):
+                self.log.error("Failed to fetch teams list",
+                               result="FAILED",
+                               target_org=self.target_org,
+                               status_code=teams_response.status_code)
+                return None
+            teams_info_list += json.loads(teams_response.text)
+            # Link to the next page, if any
+            teams_link = teams_response.links.get("next", {}).get("url")
+        self.log.debug("Fetched teams list", result="SUCCESS", total_teams=len(teams_info_list))
         return teams_info_list
 
+    # Returns a mapping of the slugs of the teams on the target org to their IDs, the teams are fetched once
+    # Returns None if the teams could not be fetched
+    def get_team_ids(self, github_access_token):
+        with self.team_index_lock:
+            if (self.team_ids is None):
+                teams_info_list = self.get_teams_info(github_access_token)
+                if (teams_info_list is None):
+                    return None
+                self.team_ids = {team['slug']: team['id'] for team in teams_info_list}
+            return self.team_ids
+
+    # Returns the names of the repositories a team has admin permission on, they are listed once per team
+    # Returns None if they could not be listed
+    def get_team_repos(self, team_id, github_access_token):
+        with self.team_index_lock:
+            if (team_id in self.team_repos):
+                return self.team_repos[team_id]
+
+            team_repos = set()
+            team_repos_link = self.github_api + f"/teams/{team_id}/repos?per_page=100"
+            while (team_repos_link):
+                team_repos_response = self.api_client.get(team_repos_link,
+                                                          access_token=github_access_token,
+                                                          cache=True,
+                                                          cache_ttl=0)
+                if (team_repos_response.status_code != 200):
+                    self.log.error("Failed to fetch repository list of team",
+                                   result="FAILED",
+                                   team_id=team_id,
+                                   status_code=team_repos_response.status_code)
+                    return None
+                for team_repo in json.loads(team_repos_response.text):
+                    if (team_repo.get("permissions", {}).get("admin")):
+                        team_repos.add(team_repo["name"])
+                # Link to the next page, if any
+                team_repos_link = team_repos_response.links.get("next", {}).get("url")
+            self.team_repos[team_id] = team_repos
+            return team_repos
+
+    # Drops the cached team IDs and team repositories, they are fetched again on the next lookup
+    def reset_team_index(self):
+        with self.team_index_lock:
+            self.team_ids = None
+            self.team_repos = {}
+
+    # Assigns the repositories that are on GitHub to their teams, with one batch for all of them
+    # Fills in the teams of the sync result of each repository (sync_results are in the same order as repositories)
+    def assign_teams(self, repositories, sync_results, github_access_token, concurrency=8):
+        repo_assignment = {}
+        for repo in repositories:
+            if ('github_link' in repo):
+                for team_name in repo.get("teams", []):
+                    repo_assignment.setdefault(team_name, []).append(self.prefix + repo['name'])
+        if (not repo_assignment):
+            return
+        with self.tracer.span("teams", repos=len(repositories)):
+            assign_result = self.assign_repos_to_teams(repo_assignment, github_access_token, concurrency)
+        for repo, sync_result in zip(repositories, sync_results):
+            if ('github_link' not in repo):
+                continue
+            for team_name in repo.get("teams", []):
+                failed = self.prefix + repo['name'] in assign_result[team_name]["failed_repos"]
+                sync_result["teams"][team_name] = {'success': int(not failed), 'failure': int(failed)}
+
     # Assign the selected repos to selected teams in the organization
-    def assign_repos_to_teams(self, repo_assignment, github_access_token):
+    # Only the repositories a team does not have admin permission on yet are assigned, by up to `concurrency` threads
+    # Returns the number of assigned (or already assigned) and failed repositories and the failed repositories by team
+    def assign_repos_to_teams(self, repo_assignment, github_access_token, concurrency=8):
         admin_permissions = {'permission': 'admin'}
         assign_result = {}
+        team_ids = self.get_team_ids(github_access_token)
         for team, prefixed_repos in repo_assignment.items():  # key, value :: team, repos
             self.log.info("Assigning repos to team", teamName=team)
-
-            # Get Team's ID
-            self.log.info("Fetching Team ID", teamName=team)
-            team_info = requests.get(self.github_api + f"/orgs/{self.target_org}/teams/{team}",
-                                     headers={"Authorization": f"Bearer {github_access_token}"})
-            if (team_info.status_code != 200):
+            team_id = team_ids.get(team) if (team_ids is not None) else None
+            team_repos = self.get_team_repos(team_id, github_access_token) if (team_id is not None) else None
+            if (team_repos is None):
                 self.log.error("Failed to fetch team information", result="FAILED", team_name=team)
                 self.log.error("No repositories assigned to team", result="FAILED", team_name=team)
+                assign_result[team] = {'success': 0, 'failure': len(prefixed_repos), 'failed_repos': prefixed_repos}
                 continue
-            team_info = json.loads(team_info.text)
-            team_id = team_info['id']
 
-            success_count = 0
-            failure_count = 0
-            for prefixed_repo_name in prefixed_repos:
+            missing_repos = [repo_name for repo_name in dict.fromkeys(prefixed_repos) if (repo_name not in team_repos)]
+            self.log.debug("Found repositories already assigned to team",
+                           teamName=team,
+                           assigned_repos=len(prefixed_repos) - len(missing_repos))
+
+            def assign_repo_task(prefixed_repo_name):
                 # Assign repo to team
-                assign_response = requests.put(self.github_api +
-                                               f"/teams/{team_id}/repos/{self.target_org}/{prefixed_repo_name}",
-                                               data=json.dumps(admin_permissions),
-                                               headers={"Authorization": f"Bearer {github_access_token}"})
+                assign_response = self.api_client.put(self.github_api +
+                                                      f"/teams/{team_id}/repos/{self.target_org}/{prefixed_repo_name}",
+                                                      data=json.dumps(admin_permissions),
+                                                      access_token=github_access_token)
                 if (assign_response.status_code != 204):
-                    failure_count += 1
                     self.log.error("Failed to assign repository to team",
                                    result="FAILED",
                                    repo_name=prefixed_repo_name,
                                    repo_prefix=self.prefix,
                                    teamName=team,
                                    status_code=assign_response.status_code)
-                else:
-                    success_count += 1
-                    self.log.debug("Assigned repository to team",
-                                   result="SUCCESS",
-                                   repo_name=prefixed_repo_name,
-                                   repo_prefix=self.prefix,
-                                   teamName=team)
-            assign_result[team] = {'success': success_count, 'failure': failure_count}
+                    return False
+                self.log.debug("Assigned repository to team",
+                               result="SUCCESS",
+                               repo_name=prefixed_repo_name,
+                               repo_prefix=self.prefix,
+                               teamName=team)
+                return True
+
+            with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+                assigned = list(executor.map(assign_repo_task, missing_repos))
+            failed_repos = [repo_name for repo_name, success in zip(missing_repos, assigned) if (not success)]
+            with self.team_index_lock:
+                team_repos.update(repo_name for repo_name, success in zip(missing_repos, assigned) if (success))
+
+            success_count = len(prefixed_repos) - len(failed_repos)
+            failure_count = len(failed_repos)
+            assign_result[team] = {'success': success_count, 'failure': failure_count, 'failed_repos': failed_repos}
             self.log.debug("Assigned repositories to team", teamName=team, success_count=success_count)
             if (failure_count != 0):
                 self.log.warning("Failed to assign repositories to team",
@@ -0,0 +1,146 @@
+# Library imports
+import random
+import re
+import threading
+import time
+
+import requests
+
+# Response status codes of API requests that are worth retrying
+TRANSIENT_STATUS_CODES = (500, 502, 503, 504)
+
+# HTTP methods that can be sent again without side effects if the first attempt may have reached the server
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+
+# stderr of git commands that failed because of the network or the server, not because of the repository or the refs
+TRANSIENT_GIT_ERRORS = re.compile(
+    r"Could not resolve host|Failed to connect|Connection (timed out|reset|refused)|Operation timed out|"
+    r"The requested URL returned error: 5\d\d|RPC failed|early EOF|unexpected disconnect|"
+    r"remote end hung up unexpectedly|gnutls_handshake|SSL_(read|write|connect)|TLS connection", re.IGNORECASE)
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    pass
+
+
+class RetryPolicy():
+    # Exponential backoff with full jitter: the n-th retry waits a random time between 0 and
+    # min(max_delay, base_delay * 2^n) seconds, so clients that failed together do not retry together
+    def __init__(self, max_retries=3, base_delay=1.0, max_delay=30.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def get_delay(self, attempt):
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    # Whether a request that raised an exception can be sent again
+    # Requests that never reached the server (connection refused or timed out) are always safe to send again
+    @staticmethod
+    def is_retryable_error(method, error):
+        if (isinstance(error, CircuitOpenError)):
+            return False
+        if (isinstance(error, requests.exceptions.ConnectTimeout)):
+            return True
+        if (isinstance(error, requests.exceptions.ConnectionError)
+                and "NewConnectionError" in repr(error.args[0] if (error.args) else error)):
+            return True
+        return method.upper() in IDEMPOTENT_METHODS and isinstance(
+            error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+    # Whether a response is a server error that can be retried with the same request
+    @staticmethod
+    def is_retryable_response(method, response):
+        return response.status_code in TRANSIENT_STATUS_CODES and method.upper() in IDEMPOTENT_METHODS
+
+    @staticmethod
+    def is_transient_git_error(error):
+        stderr = error.stderr.decode("utf-8", "replace") if (isinstance(error.stderr, bytes)) else str(error.stderr)
+        return TRANSIENT_GIT_ERRORS.search(stderr) is not None
+
+
+class CircuitBreaker():
+    # Stops sending requests to a host after failure_threshold consecutive transient failures
+    # While open, requests wait for reset_timeout seconds, then a single request probes the host (half-open)
+    # The breaker closes again when the probe succeeds, a failed probe opens it for twice as long (up to max_timeout)
+    # Requests that would wait longer than max_wait seconds in total fail with CircuitOpenError instead
+    def __init__(self, host, failure_threshold=5, reset_timeout=30, max_timeout=600, max_wait=1800, log=None):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_timeout = max_timeout
+        self.max_wait = max_wait
+        self.log = log
+        self.state = "closed"
+        self.failures = 0
+        self.open_timeout = reset_timeout
+        self.opened_at = 0
+        self.probing = False
+        self.condition = threading.Condition()
+
+    # Blocks while the breaker is open, raises CircuitOpenError if the host stays unavailable for too long
+    def before_request(self):
+        if (self.failure_threshold <= 0):
+            return
+        wait_until = time.monotonic() + self.max_wait
+        with self.condition:
+            while (True):
+                now = time.monotonic()
+                if (self.state == "closed"):
+                    return
+                if (self.state == "open" and now >= self.opened_at + self.open_timeout):
+                    self.state = "half-open"
+                if (self.state == "half-open" and not self.probing):
+                    self.probing = True
+                    return
+                if (now >= wait_until):
+                    raise CircuitOpenError(f"{self.host} is unavailable, circuit breaker open")
+                next_check = self.opened_at + self.open_timeout if (self.state == "open") else now + 1
+                self.condition.wait(max(min(next_check, wait_until) - now, 0.01))
+
+    def record_success(self):
+        with self.condition:
+            if (self.state != "closed" and self.log):
+                self.log.info("Host available again, closed circuit breaker", host=self.host)
+            self.state = "closed"
+            self.failures = 0
+            self.probing = False
+            self.open_timeout = self.reset_timeout
+            self.condition.notify_all()
+
+    def record_failure(self):
+        with self.condition:
+            self.failures += 1
+            if (self.state == "half-open"):
+                self.open_timeout = min(self.open_timeout * 2, self.max_timeout)
+            elif (self.state == "open" or self.failures < self.failure_threshold or self.failure_threshold <= 0):
+                return
+            self.state = "open"
+            self.probing = False
+            self.opened_at = time.monotonic()
+            if (self.log):
+                self.log.warning("Host unavailable, opened circuit breaker",
+                                 host=self.host,
+                                 failures=self.failures,
+                                 retry_in_seconds=self.open_timeout)
+            self.condition.notify_all()
+
+
+class CircuitBreakers():
+    # The circuit breakers of all hosts, made on the first request to a host
+    def __init__(self, failure_threshold=5, reset_timeout=30, log=None):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.log = log
+        self.breakers = {}
+        self.lock = threading.Lock()
+
+    def get(self, host):
+        with self.lock:
+            if (host not in self.breakers):
+                self.breakers[host] = CircuitBreaker(host,
+                                                     self.failure_threshold,
+                                                     self.reset_timeout,
+                                                     max_timeout=max(self.reset_timeout * 20, self.reset_timeout),
+                                                     log=self.log)
+            return self.breakers[host]
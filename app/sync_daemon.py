@@ -0,0 +1,192 @@
+# Library imports
+import os
+import random
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Custom imports
+from app import utils
+
+
+class SyncDaemon:
+    # Runs the auto sync in a loop, every repository is synced on its own schedule
+    # A repository that changed is checked again after min_interval seconds, the interval of a repository that did not
+    # change (or failed to sync) is doubled after every check, up to max_interval seconds
+    # The projects are listed again every discovery_interval seconds to pick up new and deleted repositories
+    # With a webhook_listener (webhook.WebhookListener), refs changed on BitBucket are synced as soon as their events
+    # are due, without waiting for the next scheduled sync of the repository
+    def __init__(self,
+                 auto_sync,
+                 console_log_level,
+                 console_log_normal,
+                 file_log_level,
+                 min_interval=60,
+                 max_interval=3600,
+                 discovery_interval=600,
+                 webhook_listener=None):
+        self.auto_sync = auto_sync
+        self.webhook_listener = webhook_listener
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, min_interval)
+        self.discovery_interval = discovery_interval
+        self.log = utils.LogUtils.get_logger(os.path.basename(__file__), console_log_level, console_log_normal,
+                                             file_log_level)
+        # Schedule of each repository by (project key, repository name)
+        # Entries are dicts with the repository, its current interval and the time it is due next (time.monotonic)
+        self.schedule = {}
+        self.next_discovery = 0
+        self.stop_event = threading.Event()
+        # Set to wake the loop up early, when stopping or when a webhook event arrives
+        self.wake_event = threading.Event()
+
+    # Stops the daemon once the current cycle is done
+    def stop(self, signal_number=None, frame=None):
+        self.log.info("Stopping sync daemon after the current cycle", signal=signal_number)
+        self.stop_event.set()
+        self.wake_event.set()
+
+    # Intervals are spread by +-10%, so repositories discovered together do not stay due at the same time
+    @staticmethod
+    def jitter(interval):
+        return interval * random.uniform(0.9, 1.1)
+
+    # Lists the repositories of all projects and updates the schedule
+    # New repositories are due immediately, repositories that are no longer selected are removed
+    def discover_repos(self):
+        self.log.info("Discovering repositories")
+        # Repositories and teams changed on GitHub outside of the daemon must show up in the indexes
+        self.auto_sync.repo_ops.reset_github_repo_index()
+        self.auto_sync.repo_ops.reset_team_index()
+        discovered_keys = set()
+        now = time.monotonic()
+        # Projects are listed concurrently, a project that fails to be listed does not stop the others
+        project_keys = self.auto_sync.get_project_keys()
+        with self.auto_sync.tracer.run("discovery", projects=len(project_keys)):
+            with ThreadPoolExecutor(max_workers=max(self.auto_sync.project_concurrency, 1)) as executor:
+                project_repos = list(executor.map(self.auto_sync.try_get_project_repos, project_keys))
+        for project_key, processed_repos in zip(project_keys, project_repos):
+            if (processed_repos is None):
+                # Keep the schedule of the project until it can be listed again
+                self.log.error("Failed to list repositories of project, keeping the last known repositories",
+                               result="FAILED",
+                               project_key=project_key)
+                discovered_keys.update(key for key in self.schedule if (key[0] == project_key))
+                continue
+            for repo in processed_repos:
+                schedule_key = (project_key, repo["name"])
+                discovered_keys.add(schedule_key)
+                if (schedule_key in self.schedule):
+                    self.schedule[schedule_key]["repo"] = repo
+                else:
+                    self.schedule[schedule_key] = {"repo": repo, "interval": self.min_interval, "next_sync": now}
+
+        removed_keys = [key for key in self.schedule if (key not in discovered_keys)]
+        for schedule_key in removed_keys:
+            del self.schedule[schedule_key]
+        self.log.info("Discovered repositories",
+                      total_repos=len(self.schedule),
+                      removed_repos=[f"{project_key}/{repo_name}" for project_key, repo_name in removed_keys])
+        self.next_discovery = time.monotonic() + self.discovery_interval
+
+    # Syncs the repositories that are due and reschedules them
+    def sync_due_repos(self):
+        now = time.monotonic()
+        due_entries = sorted((entry for entry in self.schedule.values() if (entry["next_sync"] <= now)),
+                             key=lambda entry: entry["next_sync"])
+        if (not due_entries):
+            return
+
+        with self.auto_sync.tracer.run("sync cycle", repos=len(due_entries)):
+            sync_results = self.auto_sync.sync_repos([entry["repo"] for entry in due_entries])
+        changed_repos = []
+        for entry, sync_result in zip(due_entries, sync_results):
+            if (sync_result["result"] == "SUCCESS" and not sync_result["up_to_date"]):
+                changed_repos.append(sync_result["name"])
+                entry["interval"] = self.min_interval
+            else:
+                entry["interval"] = min(entry["interval"] * 2, self.max_interval)
+            entry["next_sync"] = time.monotonic() + SyncDaemon.jitter(entry["interval"])
+        self.log.info("Finished sync cycle",
+                      synced_repos=len(due_entries),
+                      changed_repos=changed_repos,
+                      scheduled_repos=len(self.schedule))
+
+    # Syncs the refs changed by the webhook events that are due
+    # Repositories that are not on GitHub yet, or whose changed refs fail to sync, are fully synced in the next cycle
+    def sync_webhook_events(self):
+        if (self.webhook_listener is None):
+            return
+        now = time.monotonic()
+        repo_refs = []
+        for project_key, repo_name, changed_refs in self.webhook_listener.pop_due_events():
+            entry = self.schedule.get((project_key, repo_name))
+            if (entry is None):
+                self.log.info("Ignoring webhook event for repository not selected in config file",
+                              project_key=project_key,
+                              repo_name=repo_name)
+            elif ('github_link' not in entry["repo"]):
+                entry["next_sync"] = now
+            elif (changed_refs):
+                repo_refs.append((entry, changed_refs))
+        if (not repo_refs):
+            return
+
+        with self.auto_sync.tracer.run("webhook sync", repos=len(repo_refs)):
+            sync_results = self.auto_sync.sync_changed_refs([(entry["repo"], changed_refs)
+                                                             for entry, changed_refs in repo_refs])
+        for (entry, changed_refs), sync_result in zip(repo_refs, sync_results):
+            if (sync_result["result"] == "SUCCESS"):
+                entry["interval"] = self.min_interval
+                entry["next_sync"] = time.monotonic() + SyncDaemon.jitter(entry["interval"])
+            else:
+                entry["next_sync"] = now
+        self.log.info("Synced changed refs from webhook events",
+                      synced_repos=[sync_result["name"] for sync_result in sync_results])
+
+    # Seconds until the next repository or webhook event is due or the next discovery, whichever comes first
+    def get_wait_time(self):
+        next_times = [entry["next_sync"] for entry in self.schedule.values()] + [self.next_discovery]
+        if (self.webhook_listener is not None and self.webhook_listener.get_next_due() is not None):
+            next_times.append(self.webhook_listener.get_next_due())
+        return max(min(next_times) - time.monotonic(), 0.1)
+
+    # Discovers the repositories when due and syncs the due webhook events and repositories
+    # Returns the seconds to wait before the next cycle
+    def run_cycle(self):
+        if (time.monotonic() >= self.next_discovery):
+            self.discover_repos()
+        if (self.stop_event.is_set()):
+            return 0
+        self.sync_webhook_events()
+        self.sync_due_repos()
+        return self.get_wait_time()
+
+    # Syncs until stopped with SIGINT/SIGTERM
+    def run(self):
+        if (threading.current_thread() is threading.main_thread()):
+            signal.signal(signal.SIGINT, self.stop)
+            signal.signal(signal.SIGTERM, self.stop)
+
+        self.log.info("Started sync daemon",
+                      min_interval=self.min_interval,
+                      max_interval=self.max_interval,
+                      discovery_interval=self.discovery_interval)
+        if (self.webhook_listener is not None):
+            self.webhook_listener.on_event = self.wake_event.set
+            self.webhook_listener.start()
+        try:
+            while (not self.stop_event.is_set()):
+                try:
+                    wait_time = self.run_cycle()
+                except Exception as e:
+                    # A failed cycle does not stop the daemon, what failed is tried again after min_interval
+                    self.log.error("Sync cycle failed", result="FAILED", error=repr(e))
+                    wait_time = self.min_interval
+                self.wake_event.wait(wait_time)
+                self.wake_event.clear()
+        finally:
+            if (self.webhook_listener is not None):
+                self.webhook_listener.stop()
+        self.log.info("Stopped sync daemon")
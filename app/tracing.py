@@ -0,0 +1,187 @@
+# Library imports
+import datetime
+import itertools
+import json
+import os
+import threading
+import time
+import uuid
+
+# Spans inherit these attributes from the span they are nested in
+INHERITED_ATTRIBUTES = ("project_key", "repo_name")
+
+# Number of slowest repositories listed in the summary of a run
+SLOWEST_REPOS = 10
+
+# The summary of every run is appended to this file, one JSON object per line
+RUN_SUMMARY_PATH = os.path.join("logs", "run-summary.jsonl")
+
+
+class Span():
+    # A timed operation, made by Tracer.span() and used as a context manager
+    def __init__(self, tracer, name, span_id, parent, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.span_id = span_id
+        self.parent_id = parent.span_id if (parent is not None) else None
+        self.attributes = {}
+        if (parent is not None):
+            self.attributes = {
+                key: parent.attributes[key]
+                for key in INHERITED_ATTRIBUTES if (key in parent.attributes)
+            }
+        self.attributes.update(attributes)
+        # The outermost spans of a repository make up the time spent on the repository
+        self.is_repo_root = ("repo_name" in self.attributes
+                             and (parent is None or parent.attributes.get("repo_name") != self.attributes["repo_name"]))
+        self.start = None
+        self.duration = None
+
+    def __enter__(self):
+        self.tracer.get_stack().append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.duration = time.perf_counter() - self.start
+        self.tracer.get_stack().pop()
+        self.tracer.finish(self, exc_type)
+        return False
+
+
+class RunSpan(Span):
+    # The span of a whole run, the summary of the run is written when it ends
+    def __enter__(self):
+        self.tracer.start_run(self)
+        return super().__enter__()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        super().__exit__(exc_type, exc_value, traceback)
+        self.tracer.end_run(self)
+        return False
+
+
+class Tracer():
+    # Times the nested spans of a run: projects, repositories and their phases (API calls, fetches, pushes...)
+    # Every span is logged at debug level when it ends, with its duration, attributes and the ID of its parent span
+    # Spans are nested in the span open on the same thread, spans opened on other threads (worker pools) are nested
+    # in the current run. When a run ends, the total time of each phase and the slowest repositories are logged and
+    # appended to summary_path. Nested spans are also counted in the total of their parents' phases
+    # With metrics (a metrics.Metrics), the duration of every span and run is also recorded there
+    def __init__(self, log=None, metrics=None, slowest_repos=SLOWEST_REPOS, summary_path=RUN_SUMMARY_PATH):
+        self.log = log
+        self.metrics = metrics
+        self.slowest_repos = slowest_repos
+        self.summary_path = summary_path
+        self.span_ids = itertools.count(1)
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.run_span = None
+        self.run_id = None
+        self.run_started_at = None
+        # Count and durations of the spans of the current run by name, and the time spent on each repository
+        self.phases = {}
+        self.repos = {}
+
+    # Returns the spans open on the current thread
+    def get_stack(self):
+        if (not hasattr(self.local, "stack")):
+            self.local.stack = []
+        return self.local.stack
+
+    # Returns a span to time a block with: `with tracer.span("fetch", repo_name=repo_name):`
+    def span(self, name, **attributes):
+        stack = self.get_stack()
+        parent = stack[-1] if (stack) else self.run_span
+        return Span(self, name, next(self.span_ids), parent, attributes)
+
+    # Returns the span of a run (a `sync auto`, a daemon cycle...), which writes the summary of the run when it ends
+    def run(self, name, **attributes):
+        return RunSpan(self, "run", next(self.span_ids), None, dict(attributes, run=name))
+
+    def start_run(self, run_span):
+        with self.lock:
+            self.run_span = run_span
+            self.run_id = uuid.uuid4().hex[:12]
+            self.run_started_at = datetime.datetime.now(datetime.timezone.utc)
+            self.phases = {}
+            self.repos = {}
+
+    def end_run(self, run_span):
+        with self.lock:
+            summary = self.get_summary(run_span)
+            self.run_span = None
+        if (self.log):
+            self.log.info("Run summary",
+                          run=summary["run"],
+                          run_id=summary["run_id"],
+                          duration_seconds=summary["duration_seconds"],
+                          phases={name: phase["total_seconds"]
+                                  for name, phase in summary["phases"].items()},
+                          slowest_repos={repo["repo_name"]: repo["seconds"]
+                                         for repo in summary["slowest_repos"]})
+        try:
+            os.makedirs(os.path.dirname(self.summary_path) or ".", exist_ok=True)
+            with open(self.summary_path, "a") as summary_file:
+                summary_file.write(json.dumps(summary) + "\n")
+        except OSError as e:
+            if (self.log):
+                self.log.warning("Failed to write run summary", summary_path=self.summary_path, error=str(e))
+        if (self.metrics):
+            try:
+                self.metrics.observe_run(summary["run"], run_span.duration, time.time())
+            except OSError as e:
+                if (self.log):
+                    self.log.warning("Failed to write metrics textfile", error=str(e))
+
+    # Logs a span that ended and adds it to the phases and repositories of the current run
+    def finish(self, span, exc_type):
+        if (self.log):
+            details = dict(span.attributes)
+            if (exc_type is not None):
+                details["error"] = exc_type.__name__
+            self.log.debug("Finished span",
+                           span=span.name,
+                           span_id=span.span_id,
+                           parent_span_id=span.parent_id,
+                           run_id=self.run_id,
+                           duration_ms=round(span.duration * 1000, 1),
+                           **details)
+        if (isinstance(span, RunSpan)):
+            return
+        if (self.metrics):
+            self.metrics.observe_span(span.name, span.duration)
+        with self.lock:
+            if (self.run_span is None):
+                return
+            phase = self.phases.setdefault(span.name, {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+            phase["count"] += 1
+            phase["total_seconds"] += span.duration
+            phase["max_seconds"] = max(phase["max_seconds"], span.duration)
+            repo_name = span.attributes.get("repo_name")
+            if (repo_name is not None):
+                repo = self.repos.setdefault(repo_name, {"repo_name": repo_name, "seconds": 0.0, "phases": {}})
+                if ("project_key" in span.attributes):
+                    repo["project_key"] = span.attributes["project_key"]
+                if (span.is_repo_root):
+                    repo["seconds"] += span.duration
+                repo["phases"][span.name] = repo["phases"].get(span.name, 0.0) + span.duration
+
+    # Returns the summary of the current run: total time of each phase (slowest first) and the slowest repositories
+    def get_summary(self, run_span):
+        phases = {}
+        for name, phase in sorted(self.phases.items(), key=lambda item: item[1]["total_seconds"], reverse=True):
+            phases[name] = {key: round(value, 3) for key, value in phase.items()}
+        slowest_repos = []
+        for repo in sorted(self.repos.values(), key=lambda repo: repo["seconds"], reverse=True)[:self.slowest_repos]:
+            repo_phases = {name: round(seconds, 3) for name, seconds in repo["phases"].items()}
+            slowest_repos.append(dict(repo, seconds=round(repo["seconds"], 3), phases=repo_phases))
+        return {
+            "run": run_span.attributes["run"],
+            "run_id": self.run_id,
+            "started_at": self.run_started_at.isoformat(),
+            "duration_seconds": round(run_span.duration, 3),
+            "total_repos": len(self.repos),
+            "phases": phases,
+            "slowest_repos": slowest_repos
+        }
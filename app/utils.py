@@ -1,54 +1,48 @@
-import inspect
-import yaml
+import atexit
 import unicodedata
 import logging
+import logging.handlers
 import datetime
 import pythonjsonlogger.jsonlogger as jsonlogger
 import os
+import queue
 import re
 import stat
+import threading
 import colorama as color
 import structlog
-from structlog._frames import _find_first_app_frame_and_name
+from collections.abc import Mapping
+
+from app import config
 
 
 class ReadUtils():
 
+    # Return the parsed and validated config.yml of the current directory
+    @staticmethod
+    def get_config():
+        return config.ConfigUtils.get_config()
+
     # Read and return projects to sync and repos to exculde from sync
     @staticmethod
     def get_sync_config():
-        cur_dir_path = os.getcwd()
-        with open(cur_dir_path + "/config.yml") as file:
-            sync_config = yaml.load(file, Loader=yaml.FullLoader)['sync_config']
-        to_include = sync_config['include'] if ('include' in sync_config) else None
-        to_exclude = sync_config['exclude'] if ('exclude' in sync_config) else None
-        return to_include, to_exclude
+        app_config = ReadUtils.get_config()
+        return app_config.sync_include, app_config.sync_exclude
 
     # Read and return the target organization to sync repositories to
     @staticmethod
     def get_target_org():
-        cur_dir_path = os.getcwd()
-        with open(cur_dir_path + "/config.yml") as file:
-            target_org = yaml.load(file, Loader=yaml.FullLoader)['target_org']
-        return target_org
+        return ReadUtils.get_config().target_org
 
     # Read and return the prefix to be used for repo migrations and sync
     @staticmethod
     def get_prefix():
-        cur_dir_path = os.getcwd()
-        with open(cur_dir_path + "/config.yml") as file:
-            config = yaml.load(file, Loader=yaml.FullLoader)
-        prefix = config["prefix"] if ("prefix" in config) else ""
-        return prefix
+        return ReadUtils.get_config().prefix
 
     # Read and return the prefis to be used for renaming the master branch
     @staticmethod
     def get_master_branch_prefix():
-        cur_dir_path = os.getcwd()
-        with open(cur_dir_path + "/config.yml") as file:
-            config = yaml.load(file, Loader=yaml.FullLoader)
-        master_branch_prefix = config["master_branch_prefix"] if ("master_branch_prefix" in config) else ""
-        return master_branch_prefix
+        return ReadUtils.get_config().master_branch_prefix
 
 
 class RegexUtils():
@@ -89,6 +83,140 @@ class RegexUtils():
         return non_duplicate_repos
 
 
+class RepoMatcher():
+    # Matches repository names against the include and exclude config of a project, the config is compiled once
+    # Exact names are looked up in a dict, the regex patterns of each list in the config are combined into one regex
+    # that rejects most names before the patterns are tried one by one
+    # Patterns are matched at the start of the name (re.match), exact names must be equal to the repository name
+
+    # Patterns with backreferences, conditionals or inline flags change meaning when combined with other patterns, and
+    # patterns with named groups do not compile when combined with another pattern using the same group name
+    NOT_COMBINABLE = re.compile(r"\\[1-9]|\(\?P=|\(\?P<|\(\?\(|\(\?[aiLmsux]+\)")
+
+    def __init__(self, project_key, to_include, to_exclude):
+        self.project_key = project_key
+        # Include rules in config order: {"name": exact name} or {"patterns": [...]}, with the team or None
+        self.rules = []
+        self.exact_rules = {}
+        self.regex_levels = []
+        self.teams = []
+        self.exclude_names = set()
+        self.exclude_regex = None
+
+        include_regex, include_config = RepoMatcher.unwrap_regex_config(to_include, False)
+        project_regex, project_config = RepoMatcher.unwrap_regex_config(
+            include_config.get(project_key) if (isinstance(include_config, Mapping)) else None, include_regex)
+        project_patterns = []
+        for repo_or_team in project_config or []:
+            if (isinstance(repo_or_team, str)):  # Repository name
+                if (project_regex):
+                    project_patterns.append(self.add_rule({"patterns": [repo_or_team], "team": None}))
+                else:
+                    self.add_rule({"name": repo_or_team, "team": None})
+            elif (isinstance(repo_or_team, Mapping)):  # Team assignment
+                for team_name, team_config in repo_or_team.items():
+                    self.teams.append(team_name)
+                    team_regex, repo_names = RepoMatcher.unwrap_regex_config(team_config, project_regex)
+                    if (team_regex):
+                        rule_index = self.add_rule({"patterns": list(repo_names or []), "team": team_name})
+                        self.regex_levels.append(RepoMatcher.compile_level([rule_index], self.rules))
+                    else:
+                        for repo_name in repo_names or []:
+                            self.add_rule({"name": repo_name, "team": team_name})
+        if (project_patterns):
+            self.regex_levels.append(RepoMatcher.compile_level(project_patterns, self.rules))
+
+        exclude_regex, exclude_config = RepoMatcher.unwrap_regex_config(to_exclude, False)
+        project_exclude_regex, project_exclude_config = RepoMatcher.unwrap_regex_config(
+            exclude_config.get(project_key) if (isinstance(exclude_config, Mapping)) else None, exclude_regex)
+        if (project_exclude_regex and project_exclude_config):
+            self.exclude_regex = RepoMatcher.compile_patterns(project_exclude_config)
+        elif (project_exclude_config):
+            self.exclude_names = set(project_exclude_config)
+
+    # Returns the regex setting and the config of a level of sync_config, with the regex setting of the parent level
+    @staticmethod
+    def unwrap_regex_config(config, parent_regex):
+        if (isinstance(config, Mapping) and ("regex" in config or "repo_config" in config)):
+            return config.get("regex", parent_regex), config.get("repo_config")
+        return parent_regex, config
+
+    def add_rule(self, rule):
+        self.rules.append(rule)
+        rule_index = len(self.rules) - 1
+        if ("name" in rule):
+            self.exact_rules.setdefault(rule["name"], []).append(rule_index)
+        return rule_index
+
+    # Compiles a list of patterns into a function that returns True if any of the patterns matches
+    # An empty list matches nothing
+    @staticmethod
+    def compile_patterns(patterns):
+        if (not patterns):
+            return lambda repo_name: False
+        combinable = [pattern for pattern in patterns if (not RepoMatcher.NOT_COMBINABLE.search(pattern))]
+        separate = [re.compile(pattern) for pattern in patterns if (RepoMatcher.NOT_COMBINABLE.search(pattern))]
+        combined = re.compile("|".join(f"(?:{pattern})" for pattern in combinable)) if (combinable) else None
+        if (not separate):
+            return lambda repo_name: combined.match(repo_name) is not None
+        return lambda repo_name: ((combined is not None and combined.match(repo_name) is not None) or any(
+            regex.match(repo_name) for regex in separate))
+
+    # A level is the regex rules of one list in the config, with one combined regex for all of their patterns
+    @staticmethod
+    def compile_level(rule_indexes, rules):
+        level_patterns = [pattern for rule_index in rule_indexes for pattern in rules[rule_index]["patterns"]]
+        level_rules = [(rule_index, RepoMatcher.compile_patterns(rules[rule_index]["patterns"]))
+                       for rule_index in rule_indexes]
+        if (len(level_rules) == 1):
+            return level_rules[0][1], level_rules
+        return RepoMatcher.compile_patterns(level_patterns), level_rules
+
+    # True if nothing is included from the project
+    def is_empty(self):
+        return not self.rules
+
+    def has_excludes(self):
+        return bool(self.exclude_names) or self.exclude_regex is not None
+
+    def is_excluded(self, repo_name):
+        return repo_name in self.exclude_names or (self.exclude_regex is not None and self.exclude_regex(repo_name))
+
+    # Matches the repository names against the rules in a single pass
+    # Returns a mapping of the included repository names (in the order of the config, names matched by the same
+    # pattern are sorted) to the teams they are assigned to, and the exact rules that did not match any repository
+    def match(self, repo_names):
+        rule_matches = [[] for _ in self.rules]
+        for repo_name in repo_names:
+            for rule_index in self.exact_rules.get(repo_name, ()):
+                rule_matches[rule_index].append(repo_name)
+            for level_match, level_rules in self.regex_levels:
+                if (not level_match(repo_name)):
+                    continue
+                for rule_index, rule_match in level_rules:
+                    if (len(level_rules) == 1 or rule_match(repo_name)):
+                        rule_matches[rule_index].append(repo_name)
+
+        repository_team_mapping = {}
+        not_found = []
+        for rule, matched_names in zip(self.rules, rule_matches):
+            if ("name" in rule):
+                if (not matched_names and rule["name"] not in repository_team_mapping):
+                    not_found.append(rule)
+                matched_names = matched_names[:1]
+            else:
+                matched_names = sorted(set(matched_names))
+            for repo_name in matched_names:
+                repo_teams = repository_team_mapping.setdefault(repo_name, [])
+                if (rule["team"] is not None):
+                    repo_teams.append(rule["team"])
+
+        for repo_name in list(repository_team_mapping):
+            if (self.is_excluded(repo_name)):
+                del repository_team_mapping[repo_name]
+        return repository_team_mapping, not_found
+
+
 class MiscUtils():
     # Filter function to get http links to clone repo
     @staticmethod
@@ -113,6 +241,20 @@ class StringUtils():
     def remove_control_characters(s):
         return "".join(ch for ch in s if unicodedata.category(ch)[0] != "C")
 
+    # Normalize a repository name the way GitHub does, to compare repository names
+    # GitHub replaces every substring of characters other than alphabets, numbers, hyphen, underscore and fullstop with
+    # a single hyphen, and repository names are case-insensitive
+    @staticmethod
+    def normalize_repo_name(repo_name):
+        repo_name = StringUtils.remove_control_characters(repo_name)
+        return re.sub(r"[^A-Za-z0-9_.-]+", "-", repo_name).lower()
+
+    # Add the account ID and access token to a clone link, keeping its scheme (https://, or http:// for local servers)
+    @staticmethod
+    def get_authenticated_link(link, account_id, access_token):
+        [scheme, link_domain] = link.split("//", 1)
+        return f"{scheme}//{account_id}:{access_token}@{link_domain}"
+
     # Redact an error message (which is in bytes format)
     @staticmethod
     def redact_error(error_message, to_redact, after_redact):
@@ -123,9 +265,13 @@ class CustomJsonFormatter(jsonlogger.JsonFormatter):
     def add_fields(self, log_record, record, message_dict):
         super(CustomJsonFormatter, self).add_fields(log_record, record, message_dict)
         if not log_record.get('timestamp'):
-            now = datetime.datetime.now().strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+            # Time of the log call, records are formatted later by the writer thread
+            now = datetime.datetime.fromtimestamp(record.created).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
             log_record['timestamp'] = now
         log_record['level'] = record.levelname
+        # structlog's stdlib logger already found the calling frame of the record, no need to look it up again
+        if not log_record.get('loc'):
+            log_record['loc'] = '{}:{}'.format(record.filename, record.lineno)
         keep_keys = ["timestamp", "level", "loc", "name", "message"]
         params = {}
         param_keys = [key for key in log_record if (key not in keep_keys)]
@@ -136,7 +282,27 @@ class CustomJsonFormatter(jsonlogger.JsonFormatter):
             log_record.update(params)
 
 
+# Formatters of the log handlers
+LOG_FORMATTER = logging.Formatter("%(asctime)s [%(levelname)s] [%(name)s] - %(funcName)s: %(message)s")
+JSON_FORMATTER = CustomJsonFormatter('(timestamp) (level) (loc) (message)')
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    # Queues the records as they are, they are formatted by the handlers of the QueueListener in its thread
+    # structlog already merged the arguments of the log call into the message (PositionalArgumentsFormatter)
+    def prepare(self, record):
+        return record
+
+
 class LogUtils():
+    # Handlers shared by every logger, made by the first get_logger() call, and the loggers using them
+    log_lock = threading.Lock()
+    console_handler = None
+    file_handlers = []
+    queue_handler = None
+    queue_listener = None
+    loggers = {}
+
     # Give colored print statements
     @staticmethod
     def log_bright(log_color, log_string):
@@ -148,24 +314,15 @@ class LogUtils():
 
     @staticmethod
     def get_console_log_level():
-        cur_dir_path = os.getcwd()
-        with open(cur_dir_path + "/config.yml") as file:
-            console_log_level = yaml.load(file, Loader=yaml.FullLoader)['console_log_level']
-        return console_log_level
+        return ReadUtils.get_config().console_log_level
 
     @staticmethod
     def get_console_log_normal():
-        cur_dir_path = os.getcwd()
-        with open(cur_dir_path + "/config.yml") as file:
-            console_log_normal = yaml.load(file, Loader=yaml.FullLoader)['console_log_normal']
-        return console_log_normal
+        return ReadUtils.get_config().console_log_normal
 
     @staticmethod
     def get_file_log_level():
-        cur_dir_path = os.getcwd()
-        with open(cur_dir_path + "/config.yml") as file:
-            file_log_level = yaml.load(file, Loader=yaml.FullLoader)['file_log_level']
-        return file_log_level
+        return ReadUtils.get_config().file_log_level
 
     @staticmethod
     def resolve_log_level(log_level):
@@ -183,35 +340,11 @@ class LogUtils():
         else:
             return logging.INFO
 
+    # Make the log handlers shared by every logger, once
+    # Records are written to the log files by a background thread (QueueListener), so logging never waits on file I/O
+    # The console handler writes on the calling thread, to keep the console output in order with prints and prompts
     @staticmethod
-    def get_logger(logger_name, console_log_level, console_log_normal, file_log_level):
-        def add_code_location_processor(logger, _, event_dict):
-            # Mostly copy/pasta from:
-            #   https://stackoverflow.com/questions/54872447/how-to-add-code-line-number-using-structlog
-            # If by any chance the record already contains a `modline` key,
-            # (very rare) move that into a 'modline_original' key
-            if 'modline' in event_dict:
-                event_dict['modline_original'] = event_dict['modline']
-            f, name = _find_first_app_frame_and_name(additional_ignores=[
-                "logging",
-                __name__,
-            ])
-            if not f:
-                return event_dict
-            frameinfo = inspect.getframeinfo(f)
-            if not frameinfo:
-                return event_dict
-            module = inspect.getmodule(f)
-            if not module:
-                return event_dict
-            if frameinfo and module:
-                event_dict['loc'] = '{}:{}'.format(
-                    os.path.basename(frameinfo.filename),
-                    # module.__name__,  ## If you want to add a module name, uncomment this and modify the format above
-                    frameinfo.lineno,
-                )
-            return event_dict
-
+    def start_logging():
         structlog.configure(
             processors=[
                 structlog.stdlib.filter_by_level,
@@ -221,7 +354,6 @@ class LogUtils():
                 structlog.processors.StackInfoRenderer(),
                 structlog.processors.format_exc_info,
                 structlog.processors.UnicodeDecoder(),
-                add_code_location_processor,
                 structlog.stdlib.render_to_log_kwargs,
             ],
             context_class=dict,
@@ -230,42 +362,65 @@ class LogUtils():
             cache_logger_on_first_use=True,
         )
 
-        log_formatter = logging.Formatter("%(asctime)s [%(levelname)s] [%(name)s] - %(funcName)s: %(message)s")
-        json_formatter = CustomJsonFormatter('(timestamp) (level) (loc) (message)')
-
-        cur_dir_path = os.getcwd()
-        if (not os.path.isdir(cur_dir_path + "/logs")):
-            os.mkdir("logs")
-
+        os.makedirs("logs", exist_ok=True)
         file_handler = logging.FileHandler("logs/migration.log")
-        file_handler.setFormatter(log_formatter)
-        file_handler.setLevel(LogUtils.resolve_log_level(file_log_level))
+        file_handler.setFormatter(LOG_FORMATTER)
 
         json_file_handler = logging.FileHandler("logs/migration-json.log")
-        json_file_handler.setFormatter(json_formatter)
-        json_file_handler.setLevel(LogUtils.resolve_log_level(file_log_level))
+        json_file_handler.setFormatter(JSON_FORMATTER)
 
         error_file_handler = logging.FileHandler("logs/migration-error.log")
-        error_file_handler.setFormatter(log_formatter)
+        error_file_handler.setFormatter(LOG_FORMATTER)
         error_file_handler.setLevel(logging.ERROR)
 
         error_json_file_handler = logging.FileHandler("logs/migration-error-json.log")
-        error_json_file_handler.setFormatter(json_formatter)
+        error_json_file_handler.setFormatter(JSON_FORMATTER)
         error_json_file_handler.setLevel(logging.ERROR)
 
-        console_handler = logging.StreamHandler()
-        if (console_log_normal):
-            console_handler.setFormatter(log_formatter)
-        else:
-            console_handler.setFormatter(json_formatter)
-        console_handler.setLevel(LogUtils.resolve_log_level(console_log_level))
-
-        logger = structlog.get_logger(logger_name)
-        logger.addHandler(file_handler)
-        logger.addHandler(json_file_handler)
-        logger.addHandler(error_file_handler)
-        logger.addHandler(error_json_file_handler)
-        logger.addHandler(console_handler)
-
-        logger.setLevel(logging.DEBUG)
-        return logger
+        LogUtils.file_handlers = [file_handler, json_file_handler]
+        LogUtils.console_handler = logging.StreamHandler()
+        LogUtils.queue_handler = DeferredQueueHandler(queue.SimpleQueue())
+        LogUtils.queue_listener = logging.handlers.QueueListener(LogUtils.queue_handler.queue,
+                                                                 file_handler,
+                                                                 json_file_handler,
+                                                                 error_file_handler,
+                                                                 error_json_file_handler,
+                                                                 respect_handler_level=True)
+        LogUtils.queue_listener.start()
+        # Write the records left in the queue when the command exits
+        atexit.register(LogUtils.stop_logging)
+
+    @staticmethod
+    def stop_logging():
+        with LogUtils.log_lock:
+            if (LogUtils.queue_listener is not None):
+                LogUtils.queue_listener.stop()
+                LogUtils.queue_listener = None
+
+    # Set the levels of the shared handlers and loggers
+    # Loggers drop the records below every handler's level before structlog processes them
+    @staticmethod
+    def set_log_levels(console_log_level, console_log_normal, file_log_level):
+        LogUtils.console_handler.setFormatter(LOG_FORMATTER if (console_log_normal) else JSON_FORMATTER)
+        LogUtils.console_handler.setLevel(LogUtils.resolve_log_level(console_log_level))
+        for file_handler in LogUtils.file_handlers:
+            file_handler.setLevel(LogUtils.resolve_log_level(file_log_level))
+        logger_level = min(LogUtils.resolve_log_level(console_log_level), LogUtils.resolve_log_level(file_log_level),
+                           logging.ERROR)
+        for logger in LogUtils.loggers.values():
+            logger.setLevel(logger_level)
+
+    # Return the structlog logger logger_name, logging to the console and the files in logs/
+    # The handlers are made by the first call and shared, later calls only update the log levels
+    @staticmethod
+    def get_logger(logger_name, console_log_level, console_log_normal, file_log_level):
+        with LogUtils.log_lock:
+            if (LogUtils.queue_listener is None):
+                LogUtils.start_logging()
+            if (logger_name not in LogUtils.loggers):
+                logger = logging.getLogger(logger_name)
+                logger.addHandler(LogUtils.queue_handler)
+                logger.addHandler(LogUtils.console_handler)
+                LogUtils.loggers[logger_name] = logger
+            LogUtils.set_log_levels(console_log_level, console_log_normal, file_log_level)
+        return structlog.get_logger(logger_name)
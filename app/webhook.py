@@ -0,0 +1,153 @@
+# Library imports
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Custom imports
+from app import utils
+
+# Largest webhook payload accepted, in bytes
+MAX_PAYLOAD_SIZE = 1024 * 1024
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    # Handles the webhook requests of BitBucket Server, events are passed on to server.webhook_listener
+    def do_POST(self):  # noqa: N802
+        listener = self.server.webhook_listener
+        content_length = int(self.headers.get("Content-Length") or 0)
+        if (content_length > MAX_PAYLOAD_SIZE):
+            self.send_status(413)
+            return
+        payload = self.rfile.read(content_length)
+        if (not listener.is_signature_valid(payload, self.headers.get("X-Hub-Signature"))):
+            listener.log.warning("Rejected webhook request with invalid signature", client=self.client_address[0])
+            self.send_status(401)
+            return
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            self.send_status(400)
+            return
+        if (not isinstance(event, dict)):
+            self.send_status(400)
+            return
+        event_key = self.headers.get("X-Event-Key") or event.get("eventKey")
+        self.send_status(listener.add_event(event_key, event))
+
+    def send_status(self, status_code):
+        self.send_response(status_code)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    # Requests are logged by the listener instead of being printed to stderr
+    def log_message(self, format, *args):
+        pass
+
+
+class WebhookListener:
+    # HTTP listener for the `repo:refs_changed` webhook events of BitBucket Server
+    # Events for the same repository are coalesced: an event is due `debounce` seconds after the last event of a burst,
+    # and at most 5 * `debounce` seconds after the first one. The refs changed by all events of a burst are synced once
+    # With a secret, requests must be signed with it (X-Hub-Signature: sha256=<HMAC of the payload>)
+    def __init__(self,
+                 host,
+                 port,
+                 secret,
+                 debounce,
+                 console_log_level,
+                 console_log_normal,
+                 file_log_level,
+                 on_event=None):
+        self.host = host
+        self.port = port
+        self.secret = secret
+        self.debounce = debounce
+        # Called (from the listener's threads) whenever an event is queued
+        self.on_event = on_event
+        self.log = utils.LogUtils.get_logger(os.path.basename(__file__), console_log_level, console_log_normal,
+                                             file_log_level)
+        # Pending events by (project key, repository name), with the changed refs and when the event is due
+        # Changed refs map each ref to whether it was added/updated (True) or deleted (False)
+        self.pending_events = {}
+        self.lock = threading.Lock()
+        self.server = None
+
+    def start(self):
+        self.server = ThreadingHTTPServer((self.host, self.port), WebhookHandler)
+        self.server.daemon_threads = True
+        self.server.webhook_listener = self
+        threading.Thread(target=self.server.serve_forever, name="webhook-listener", daemon=True).start()
+        self.log.info("Listening for webhook events", host=self.host, port=self.server.server_address[1])
+
+    def stop(self):
+        if (self.server is not None):
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def is_signature_valid(self, payload, signature):
+        if (not self.secret):
+            return True
+        if (not signature or not signature.startswith("sha256=")):
+            return False
+        expected_signature = hmac.new(self.secret.encode("utf-8"), payload, hashlib.sha256).hexdigest()
+        return hmac.compare_digest(signature[len("sha256="):], expected_signature)
+
+    # Queues a webhook event and returns the HTTP status code of the response
+    def add_event(self, event_key, event):
+        if (event_key == "diagnostics:ping"):
+            return 200
+        if (event_key != "repo:refs_changed"):
+            self.log.debug("Ignoring webhook event", event_key=event_key)
+            return 200
+
+        try:
+            project_key = event["repository"]["project"]["key"]
+            repo_name = event["repository"]["name"]
+            changed_refs = {}
+            for change in event.get("changes", []):
+                ref = change.get("refId") or change["ref"]["id"]
+                if (ref.startswith("refs/heads/") or ref.startswith("refs/tags/")):
+                    changed_refs[ref] = change.get("type") != "DELETE"
+        except (KeyError, TypeError, AttributeError):
+            self.log.warning("Invalid repo:refs_changed webhook event", result="FAILED")
+            return 400
+
+        now = time.monotonic()
+        with self.lock:
+            pending_event = self.pending_events.setdefault((project_key, repo_name), {
+                "changed_refs": {},
+                "first_event": now
+            })
+            pending_event["changed_refs"].update(changed_refs)
+            pending_event["due"] = min(now + self.debounce, pending_event["first_event"] + 5 * self.debounce)
+        self.log.info("Received webhook event",
+                      project_key=project_key,
+                      repo_name=repo_name,
+                      changed_refs=list(changed_refs))
+        if (self.on_event):
+            self.on_event()
+        return 202
+
+    # Removes and returns the events that are due, as (project key, repository name, added/updated refs) tuples
+    def pop_due_events(self):
+        now = time.monotonic()
+        due_events = []
+        with self.lock:
+            for event_key, pending_event in list(self.pending_events.items()):
+                if (pending_event["due"] <= now):
+                    del self.pending_events[event_key]
+                    changed_refs = [ref for ref, updated in pending_event["changed_refs"].items() if (updated)]
+                    due_events.append((event_key[0], event_key[1], changed_refs))
+        return due_events
+
+    # Time (time.monotonic) the next pending event is due, None if there are no pending events
+    def get_next_due(self):
+        with self.lock:
+            if (not self.pending_events):
+                return None
+            return min(pending_event["due"] for pending_event in self.pending_events.values())
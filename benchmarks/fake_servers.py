@@ -0,0 +1,279 @@
+# Local stand-ins for the BitBucket Server and GitHub Enterprise APIs used by RepoOps and CredOps, and for their git
+# remotes, so the sync can be benchmarked without network access
+#
+# The repositories are bare repositories on disk:
+# - <root>/bb/<project key>/<repository>.git for BitBucket
+# - <root>/gh/<repository>.git for GitHub
+# Git is served over smart HTTP by `git http-backend`, new GitHub repositories are made on disk by the API
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+BITBUCKET_API_PATH = "/bitbucket/rest/api/1.0"
+GITHUB_API_PATH = "/api/v3"
+GIT_PATH = "/git"
+# Parts of the API paths that name a collection or an action, the other parts are names or IDs
+ENDPOINT_PARTS = {"projects", "repos", "orgs", "teams", "users", "user", "members"}
+
+# Resolved once, so git processes of the server are not counted by a git wrapper put on the PATH later
+GIT_EXECUTABLE = shutil.which("git")
+
+
+class FakeRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):  # noqa: N802
+        self.handle_request()
+
+    def do_POST(self):  # noqa: N802
+        self.handle_request()
+
+    def do_PUT(self):  # noqa: N802
+        self.handle_request()
+
+    def handle_request(self):
+        url_parts = urlsplit(self.path)
+        content_length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(content_length) if (content_length) else b""
+        if (url_parts.path.startswith(GIT_PATH + "/")):
+            self.server.fake_server.count("git " + parse_qs(url_parts.query).get("service", ["data"])[0])
+            self.send_git(url_parts, body)
+            return
+        status_code, response_body, headers = self.server.fake_server.handle_api(self.command, url_parts, body)
+        self.server.fake_server.count(f"{self.command} {get_endpoint(url_parts.path)}")
+        self.send_json(status_code, response_body, headers)
+
+    # Sends a JSON response, GET responses have an ETag and are answered with 304 when it matches If-None-Match
+    def send_json(self, status_code, response_body=None, headers=()):
+        data = b"" if (response_body is None) else json.dumps(response_body).encode("utf-8")
+        headers = list(headers)
+        if (self.command == "GET" and status_code == 200):
+            etag = '"' + hashlib.md5(data).hexdigest() + '"'
+            headers.append(("ETag", etag))
+            if (self.headers.get("If-None-Match") == etag):
+                status_code, data = 304, b""
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        for header, value in headers:
+            self.send_header(header, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    # Passes a git smart HTTP request on to `git http-backend`
+    def send_git(self, url_parts, body):
+        env = dict(os.environ,
+                   GIT_PROJECT_ROOT=self.server.fake_server.root,
+                   GIT_HTTP_EXPORT_ALL="1",
+                   PATH_INFO=url_parts.path[len(GIT_PATH):],
+                   QUERY_STRING=url_parts.query,
+                   REQUEST_METHOD=self.command,
+                   CONTENT_TYPE=self.headers.get("Content-Type", ""),
+                   CONTENT_LENGTH=str(len(body)),
+                   HTTP_CONTENT_ENCODING=self.headers.get("Content-Encoding", ""),
+                   GIT_PROTOCOL=self.headers.get("Git-Protocol", ""),
+                   REMOTE_USER="benchmark",
+                   REMOTE_ADDR="127.0.0.1")
+        result = subprocess.run([GIT_EXECUTABLE, "-c", "http.receivepack=true", "http-backend"],
+                                input=body,
+                                env=env,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL)
+        head, _, data = result.stdout.partition(b"\r\n\r\n")
+        status_code = 200
+        headers = []
+        for line in head.decode("utf-8").split("\r\n"):
+            header, _, value = line.partition(":")
+            if (header.lower() == "status"):
+                status_code = int(value.split()[0])
+            elif (header):
+                headers.append((header, value.strip()))
+        self.send_response(status_code)
+        for header, value in headers:
+            self.send_header(header, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Endpoint of an API path with the names and IDs in it replaced by *, to count requests by endpoint
+def get_endpoint(path):
+    for api_path in [BITBUCKET_API_PATH, GITHUB_API_PATH]:
+        if (path.startswith(api_path)):
+            parts = path[len(api_path):].strip("/").split("/")
+            return api_path + "/" + "/".join(part if (part in ENDPOINT_PARTS) else "*" for part in parts)
+    return path
+
+
+class FakeServer():
+    # Serves the fake BitBucket and GitHub APIs and git remotes from the repositories under root
+    # teams is a list of team slugs that exist on the GitHub org
+    def __init__(self, root, org="org-name", teams=(), host="127.0.0.1", port=0):
+        self.root = root
+        self.org = org
+        self.teams = [{"id": 100 + index, "slug": slug, "name": slug} for index, slug in enumerate(teams)]
+        self.team_repos = {}
+        self.counts = {}
+        self.lock = threading.Lock()
+        self.http_server = ThreadingHTTPServer((host, port), FakeRequestHandler)
+        self.http_server.daemon_threads = True
+        self.http_server.fake_server = self
+        self.base_url = f"http://{host}:{self.http_server.server_address[1]}"
+        self.bitbucket_api = self.base_url + BITBUCKET_API_PATH
+        self.github_api = self.base_url + GITHUB_API_PATH
+        os.makedirs(os.path.join(root, "bb"), exist_ok=True)
+        os.makedirs(os.path.join(root, "gh"), exist_ok=True)
+
+    def start(self):
+        threading.Thread(target=self.http_server.serve_forever, name="fake-server", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.http_server.shutdown()
+        self.http_server.server_close()
+
+    def count(self, key):
+        with self.lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    # Returns the request counts by endpoint (and git service) since the last call
+    def pop_counts(self):
+        with self.lock:
+            counts = self.counts
+            self.counts = {}
+        return counts
+
+    def list_repos(self, *path):
+        repos_path = os.path.join(self.root, *path)
+        if (not os.path.isdir(repos_path)):
+            return None
+        return sorted(name[:-len(".git")] for name in os.listdir(repos_path) if (name.endswith(".git")))
+
+    def bitbucket_repo(self, project_key, repo_name):
+        return {
+            "name": repo_name,
+            "slug": repo_name.lower(),
+            "description": f"Benchmark repository {repo_name}",
+            "project": {
+                "key": project_key
+            },
+            "links": {
+                "clone": [{
+                    "name": "ssh",
+                    "href": f"ssh://git@127.0.0.1/{project_key}/{repo_name}.git"
+                }, {
+                    "name": "http",
+                    "href": f"{self.base_url}{GIT_PATH}/bb/{project_key}/{repo_name}.git"
+                }]
+            }
+        }
+
+    def github_repo(self, repo_name, admin=False):
+        github_repo = {"name": repo_name, "clone_url": f"{self.base_url}{GIT_PATH}/gh/{repo_name}.git"}
+        if (admin):
+            github_repo["permissions"] = {"admin": True}
+        return github_repo
+
+    # A page of BitBucket's start/limit pagination
+    @staticmethod
+    def bitbucket_page(items, query):
+        start = int(query.get("start", ["0"])[0])
+        limit = int(query.get("limit", ["25"])[0])
+        values = items[start:start + limit]
+        page = {"values": values, "size": len(values), "start": start, "isLastPage": start + limit >= len(items)}
+        if (not page["isLastPage"]):
+            page["nextPageStart"] = start + limit
+        return page
+
+    # A page of GitHub's per_page/page pagination, with the Link header to the next page
+    def github_page(self, items, query, path):
+        per_page = int(query.get("per_page", ["30"])[0])
+        page = int(query.get("page", ["1"])[0])
+        headers = []
+        if (page * per_page < len(items)):
+            headers.append(("Link", f'<{self.base_url}{path}?per_page={per_page}&page={page + 1}>; rel="next"'))
+        return items[(page - 1) * per_page:page * per_page], headers
+
+    # Returns the status code, body and headers of the response to an API request
+    def handle_api(self, method, url_parts, body):
+        query = parse_qs(url_parts.query)
+        path = url_parts.path.rstrip("/")
+        if (method == "GET" and path.startswith(BITBUCKET_API_PATH)):
+            return self.handle_bitbucket(path[len(BITBUCKET_API_PATH):], query)
+        if (path.startswith(GITHUB_API_PATH)):
+            return self.handle_github(method, path[len(GITHUB_API_PATH):], query, body, url_parts.path)
+        return 404, {}, []
+
+    def handle_bitbucket(self, path, query):
+        if (path == "/projects"):
+            projects = [{"key": key, "name": key.title()} for key in sorted(os.listdir(os.path.join(self.root, "bb")))]
+            return 200, FakeServer.bitbucket_page(projects, query), []
+        match = re.fullmatch(r"/projects/([^/]+)(/repos)?(/([^/]+))?", path)
+        if (match is None):
+            return 404, {}, []
+        project_key = match.group(1)
+        repo_names = self.list_repos("bb", project_key)
+        if (repo_names is None):
+            return 404, {"errors": [{"message": f"Project {project_key} does not exist."}]}, []
+        if (match.group(2) is None):
+            return 200, {"key": project_key, "name": project_key.title()}, []
+        if (match.group(4) is None):
+            repos = [self.bitbucket_repo(project_key, repo_name) for repo_name in repo_names]
+            return 200, FakeServer.bitbucket_page(repos, query), []
+        repo_names = {repo_name.lower(): repo_name for repo_name in repo_names}
+        if (match.group(4).lower() not in repo_names):
+            return 404, {}, []
+        return 200, self.bitbucket_repo(project_key, repo_names[match.group(4).lower()]), []
+
+    def handle_github(self, method, path, query, body, full_path):
+        if (method == "POST" and path in ("/user/repos", f"/orgs/{self.org}/repos")):
+            repo_name = re.sub(r"[^A-Za-z0-9_.-]+", "-", json.loads(body)["name"])
+            repo_path = os.path.join(self.root, "gh", repo_name + ".git")
+            if (os.path.isdir(repo_path)):
+                return 422, {"message": "Repository creation failed."}, []
+            subprocess.run([GIT_EXECUTABLE, "init", "-q", "--bare", repo_path], check=True)
+            return 201, self.github_repo(repo_name), []
+        match = re.fullmatch(rf"/teams/(\d+)/repos/{re.escape(self.org)}/([^/]+)", path)
+        if (method == "PUT" and match):
+            with self.lock:
+                self.team_repos.setdefault(int(match.group(1)), set()).add(match.group(2))
+            return 204, None, []
+        if (method != "GET"):
+            return 404, {}, []
+
+        if (path in ("/user/repos", f"/orgs/{self.org}/repos") or re.fullmatch(r"/users/[^/]+/repos", path)):
+            repos = [self.github_repo(repo_name) for repo_name in self.list_repos("gh")]
+            items, headers = self.github_page(repos, query, full_path)
+            return 200, items, headers
+        if (re.fullmatch(rf"/orgs/{re.escape(self.org)}/members/[^/]+", path)):
+            return 204, None, []
+        match = re.fullmatch(r"/repos/([^/]+)/([^/]+)", path)
+        if (match):
+            repo_names = {repo_name.lower(): repo_name for repo_name in self.list_repos("gh")}
+            if (match.group(2).lower() not in repo_names):
+                return 404, {}, []
+            return 200, self.github_repo(repo_names[match.group(2).lower()]), []
+        if (path == f"/orgs/{self.org}/teams"):
+            items, headers = self.github_page(self.teams, query, full_path)
+            return 200, items, headers
+        match = re.fullmatch(rf"/orgs/{re.escape(self.org)}/teams/([^/]+)", path)
+        if (match):
+            teams = [team for team in self.teams if (team["slug"] == match.group(1))]
+            return (200, teams[0], []) if (teams) else (404, {}, [])
+        match = re.fullmatch(r"/teams/(\d+)/repos", path)
+        if (match):
+            with self.lock:
+                repo_names = sorted(self.team_repos.get(int(match.group(1)), ()))
+            items, headers = self.github_page([self.github_repo(repo_name, admin=True) for repo_name in repo_names],
+                                              query, full_path)
+            return 200, items, headers
+        return 404, {}, []
@@ -0,0 +1,91 @@
+# Generates the BitBucket repositories served by benchmarks/fake_servers.py: `projects` projects (BENCH0, BENCH1...)
+# with `repos` bare repositories each, every repository has `branches` branches besides master and `tags` tags on a
+# history of `depth` commits
+#
+# Usage: python benchmarks/generate_repos.py ROOT [--projects N] [--repos N] [--branches N] [--tags N] [--depth N]
+import argparse
+import os
+import shutil
+import subprocess
+import time
+
+GIT_EXECUTABLE = shutil.which("git")
+
+# Fixed author and dates, so every generated repository has the same commits
+COMMITTER = "Benchmark <benchmark@example.com> 1600000000 +0000"
+
+
+# Returns the fast-import command for inline data, the line feed added after it is optional in the stream
+def data(content):
+    return f"data {len(content.encode('utf-8'))}\n{content}"
+
+
+# Returns the git fast-import stream of a history with the given number of commits on master, branches starting
+# from the commits of master and tags on the commits of master
+def get_fast_import_stream(branches, tags, depth):
+    commands = []
+    for commit_index in range(depth):
+        commands += ["commit refs/heads/master", f"mark :{commit_index + 1}", f"committer {COMMITTER}", data("Commit")]
+        if (commit_index > 0):
+            commands.append(f"from :{commit_index}")
+        commands += [f"M 644 inline file{commit_index % 10}.txt", data(f"commit {commit_index}\n")]
+    for branch_index in range(branches):
+        commands += [f"commit refs/heads/branch-{branch_index}", f"committer {COMMITTER}", data("Branch")]
+        commands += [
+            f"from :{depth - branch_index % depth}", "M 644 inline branch.txt",
+            data(f"branch {branch_index}\n")
+        ]
+    for tag_index in range(tags):
+        commands += [f"reset refs/tags/v{tag_index}", f"from :{depth - tag_index % depth}", ""]
+    return ("\n".join(commands) + "\n").encode("utf-8")
+
+
+# Makes a bare repository with the generated history at path
+def make_template_repo(path, branches, tags, depth):
+    subprocess.run([GIT_EXECUTABLE, "init", "-q", "--bare", path], check=True)
+    subprocess.run([GIT_EXECUTABLE, "fast-import", "--quiet"],
+                   input=get_fast_import_stream(branches, tags, max(depth, 1)),
+                   cwd=path,
+                   check=True)
+
+
+# Generates the repositories under root/bb and returns a mapping of the project keys to their repository names
+def generate_repos(root, projects=1, repos=10, branches=5, tags=5, depth=20):
+    template_path = os.path.join(root, "template.git")
+    if (os.path.isdir(template_path)):
+        shutil.rmtree(template_path)
+    make_template_repo(template_path, branches, tags, depth)
+
+    project_repos = {}
+    for project_index in range(projects):
+        project_key = f"BENCH{project_index}"
+        project_path = os.path.join(root, "bb", project_key)
+        os.makedirs(project_path, exist_ok=True)
+        project_repos[project_key] = []
+        for repo_index in range(repos):
+            repo_name = f"repo-{project_index}-{repo_index}"
+            repo_path = os.path.join(project_path, repo_name + ".git")
+            # Local clones hardlink the objects of the template, so even large scales are generated quickly
+            subprocess.run([GIT_EXECUTABLE, "clone", "-q", "--bare", "--local", template_path, repo_path], check=True)
+            project_repos[project_key].append(repo_name)
+    return project_repos
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate BitBucket repositories for the sync benchmark")
+    parser.add_argument("root", help="Directory to generate the repositories in (ROOT/bb/<project>/<repo>.git)")
+    parser.add_argument("--projects", type=int, default=1, help="Number of projects")
+    parser.add_argument("--repos", type=int, default=10, help="Number of repositories per project")
+    parser.add_argument("--branches", type=int, default=5, help="Number of branches per repository, besides master")
+    parser.add_argument("--tags", type=int, default=5, help="Number of tags per repository")
+    parser.add_argument("--depth", type=int, default=20, help="Number of commits on master")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    project_repos = generate_repos(args.root, args.projects, args.repos, args.branches, args.tags, args.depth)
+    print(f"Generated {sum(len(repos) for repos in project_repos.values())} repositories in "
+          f"{time.perf_counter() - start:.1f}s under {os.path.join(args.root, 'bb')}")
+
+
+if __name__ == "__main__":
+    main()
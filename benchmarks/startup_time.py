@@ -0,0 +1,87 @@
+# Measures how long the CLI takes to start and checks that commands which do not need them
+# do not import the heavy dependencies
+#
+# Usage: python benchmarks/startup_time.py [--runs N] [--max-ms MS]
+# Run from the repository root (or any directory with a config.yml), exits with 1 if a check fails
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that are only needed to actually sync repositories
+HEAVY_MODULES = ["questionary", "structlog", "pythonjsonlogger", "sh", "requests"]
+
+# Command line arguments to time, and the modules they must not import on top of HEAVY_MODULES
+COMMANDS = [
+    (["--help"], ["yaml"]),
+    (["sync", "--help"], []),
+    (["sync", "auto", "--help"], []),
+    (["sync", "interactive", "--help"], []),
+    (["sync", "daemon", "--help"], []),
+]
+
+# Runs the CLI with the given arguments and prints the names of the imported modules to stderr
+CHILD_CODE = """
+import json, sys
+from app.cli import app
+try:
+    app(sys.argv[1:], prog_name="git-migration")
+except SystemExit:
+    pass
+sys.stderr.write(json.dumps(sorted(sys.modules)))
+"""
+
+
+# Runs the code in a new interpreter, returns the wall time in milliseconds and the stderr output
+def run_python(code, args):
+    env = dict(os.environ, PYTHONPATH=REPO_DIR + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", code] + args,
+                            stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE,
+                            env=env,
+                            check=True)
+    return (time.perf_counter() - start) * 1000, result.stderr.decode("utf-8")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the startup time of the git-migration CLI")
+    parser.add_argument("--runs", type=int, default=10, help="Number of runs of each command")
+    parser.add_argument("--max-ms",
+                        type=float,
+                        default=250,
+                        help="Maximum median startup time in milliseconds, on top of the interpreter startup")
+    args = parser.parse_args()
+
+    interpreter_ms = statistics.median(run_python("pass", [])[0] for _ in range(args.runs))
+    print(f"{'python -c pass':40} {interpreter_ms:8.1f} ms")
+
+    failed = False
+    for command_args, extra_modules in COMMANDS:
+        timings = []
+        for _ in range(args.runs):
+            elapsed_ms, stderr = run_python(CHILD_CODE, command_args)
+            timings.append(elapsed_ms)
+        command_ms = statistics.median(timings) - interpreter_ms
+        imported_modules = set(json.loads(stderr.strip().splitlines()[-1]))
+        unexpected_modules = [module for module in HEAVY_MODULES + extra_modules if (module in imported_modules)]
+
+        command = "git-migration " + " ".join(command_args)
+        print(f"{command:40} {command_ms:8.1f} ms")
+        if (unexpected_modules):
+            print(f"  FAILED: imports {', '.join(unexpected_modules)}")
+            failed = True
+        if (command_ms > args.max_ms):
+            print(f"  FAILED: slower than {args.max_ms} ms")
+            failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
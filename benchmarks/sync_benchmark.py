@@ -0,0 +1,256 @@
+# Benchmarks the sync against local stand-ins of BitBucket and GitHub (benchmarks/fake_servers.py), without network
+# Generates the BitBucket repositories, then reports the wall time, API calls and git processes of each phase:
+# - discovery: credentials check, repository listing and include/exclude matching of every project
+# - process_repos: metadata and GitHub lookups of the selected repositories
+# - sync_repos: migration of all repositories to the (empty) GitHub
+# - resync: process_repos and sync_repos again, with every repository up-to-date
+# - auto, auto resync: `sync auto` (AutoSync.run_once) on an empty GitHub and again with every repository up-to-date
+#
+# Usage: python benchmarks/sync_benchmark.py [--projects N] [--repos N] [--branches N] [--tags N] [--depth N]
+#                                            [--workers N] [--output FILE] [--compare FILE]
+# With --compare, exits with 1 if a phase makes more API calls or git processes than in the results saved by --output,
+# or takes more than --max-slowdown times as long
+import argparse
+import json
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCHMARKS_DIR)
+
+import fake_servers  # noqa: E402
+import generate_repos  # noqa: E402
+
+ORG = "org-name"
+# Teams on the fake GitHub org, more than one page of the teams list
+TEAMS = ["team-alpha", "team-beta"] + [f"team-{index}" for index in range(120)]
+
+# Wrapper put first on the PATH, to count the git processes run by the sync
+GIT_WRAPPER = """#!/bin/sh
+echo "$1" >> "$GIT_PROCESS_LOG"
+exec "{git}" "$@"
+"""
+
+
+# Config file of the benchmark: every repository is synced, half of them are assigned to team-alpha
+def write_config(path, project_keys):
+    include_config = {project_key: [".*[02468]$", {"team-alpha": [".*[13579]$"]}] for project_key in project_keys}
+    config = {
+        "target_org": ORG,
+        "prefix": "",
+        "master_branch_prefix": "bb-",
+        "console_log_level": "error",
+        "console_log_normal": True,
+        "file_log_level": "error",
+        "sync_config": {
+            "include": {
+                "regex": True,
+                "repo_config": include_config
+            }
+        }
+    }
+    with open(path, "w") as config_file:
+        json.dump(config, config_file, indent=2)
+
+
+def install_git_wrapper(work_dir):
+    wrapper_dir = os.path.join(work_dir, "bin")
+    os.makedirs(wrapper_dir)
+    wrapper_path = os.path.join(wrapper_dir, "git")
+    with open(wrapper_path, "w") as wrapper_file:
+        wrapper_file.write(GIT_WRAPPER.format(git=fake_servers.GIT_EXECUTABLE))
+    os.chmod(wrapper_path, os.stat(wrapper_path).st_mode | stat.S_IEXEC)
+    os.environ["PATH"] = wrapper_dir + os.pathsep + os.environ["PATH"]
+    os.environ["GIT_PROCESS_LOG"] = os.path.join(work_dir, "git_processes.log")
+    open(os.environ["GIT_PROCESS_LOG"], "w").close()
+
+
+class PhaseTimer():
+    # Measures the phases of the benchmark
+    def __init__(self, fake_server):
+        self.fake_server = fake_server
+        self.results = {}
+        self.git_log_offset = 0
+
+    # Returns the git processes run since the last call, by git command
+    def pop_git_processes(self):
+        with open(os.environ["GIT_PROCESS_LOG"]) as git_log:
+            git_log.seek(self.git_log_offset)
+            commands = git_log.read().split()
+            self.git_log_offset = git_log.tell()
+        git_processes = {}
+        for command in commands:
+            git_processes[command] = git_processes.get(command, 0) + 1
+        return git_processes
+
+    def run(self, phase, function, *args):
+        self.fake_server.pop_counts()
+        self.pop_git_processes()
+        start = time.perf_counter()
+        result = function(*args)
+        wall_time = time.perf_counter() - start
+        requests = self.fake_server.pop_counts()
+        api_calls = {endpoint: count for endpoint, count in requests.items() if (not endpoint.startswith("git "))}
+        git_processes = self.pop_git_processes()
+        self.results[phase] = {
+            "wall_time": round(wall_time, 3),
+            "api_calls": sum(api_calls.values()),
+            "git_processes": sum(git_processes.values()),
+            "git_http_requests": sum(count for endpoint, count in requests.items() if (endpoint.startswith("git "))),
+            "api_calls_by_endpoint": dict(sorted(api_calls.items())),
+            "git_processes_by_command": dict(sorted(git_processes.items()))
+        }
+        return result
+
+
+def print_results(results, verbose):
+    print(f"{'phase':<16}{'wall time (s)':>15}{'API calls':>12}{'git processes':>16}{'git HTTP requests':>20}")
+    for phase, result in results.items():
+        print(f"{phase:<16}{result['wall_time']:>15.3f}{result['api_calls']:>12}{result['git_processes']:>16}"
+              f"{result['git_http_requests']:>20}")
+        if (verbose):
+            for endpoint, count in result["api_calls_by_endpoint"].items():
+                print(f"    {count:>6}  {endpoint}")
+            for command, count in result["git_processes_by_command"].items():
+                print(f"    {count:>6}  git {command}")
+
+
+# Returns the regressions of the results compared with the baseline results
+def compare_results(results, baseline, max_slowdown):
+    regressions = []
+    for phase, result in results.items():
+        if (phase not in baseline):
+            continue
+        for key in ["api_calls", "git_processes"]:
+            if (result[key] > baseline[phase][key]):
+                regressions.append(f"{phase}: {key} {baseline[phase][key]} -> {result[key]}")
+        if (result["wall_time"] > baseline[phase]["wall_time"] * max_slowdown):
+            regressions.append(f"{phase}: wall time {baseline[phase]['wall_time']}s -> {result['wall_time']}s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the sync against local BitBucket and GitHub stand-ins")
+    parser.add_argument("--projects", type=int, default=2, help="Number of BitBucket projects")
+    parser.add_argument("--repos", type=int, default=20, help="Number of repositories per project")
+    parser.add_argument("--branches", type=int, default=5, help="Number of branches per repository, besides master")
+    parser.add_argument("--tags", type=int, default=5, help="Number of tags per repository")
+    parser.add_argument("--depth", type=int, default=20, help="Number of commits on master")
+    parser.add_argument("--workers", type=int, default=4, help="Number of repositories to sync in parallel")
+    parser.add_argument("--api-concurrency", type=int, default=8, help="Number of parallel repository lookups")
+    parser.add_argument("--project-concurrency", type=int, default=4, help="Number of projects synced in parallel")
+    parser.add_argument("--push-batch-size", type=int, default=0, help="Number of refs pushed with a single git push")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--compare", help="Compare the results with the JSON results of an earlier run")
+    parser.add_argument("--max-slowdown",
+                        type=float,
+                        default=1.5,
+                        help="With --compare, how many times slower than the earlier run a phase may be")
+    parser.add_argument("--keep", action="store_true", help="Keep the generated repositories and working directory")
+    parser.add_argument("--verbose", action="store_true", help="Show the API calls and git processes of each phase")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="git-migration-benchmark-")
+    server_root = os.path.join(work_dir, "remotes")
+    os.makedirs(server_root)
+    try:
+        start = time.perf_counter()
+        project_repos = generate_repos.generate_repos(server_root, args.projects, args.repos, args.branches, args.tags,
+                                                      args.depth)
+        print(f"Generated {args.projects * args.repos} repositories in {time.perf_counter() - start:.1f}s")
+
+        # The sync runs in the working directory with its own config file and without the user's git config
+        os.chdir(work_dir)
+        os.environ.update({"HOME": work_dir, "GIT_CONFIG_NOSYSTEM": "1", "GIT_TERMINAL_PROMPT": "0"})
+        write_config(os.path.join(work_dir, "config.yml"), list(project_repos))
+        install_git_wrapper(work_dir)
+
+        # Imported only now, so sh finds the git wrapper
+        from app import api_client, auto_sync, cred_operations, repo_operations, utils
+
+        fake_server = fake_servers.FakeServer(server_root, ORG, TEAMS).start()
+        log_levels = ("error", True, "error")
+        account_id, access_token = "benchmark", "benchmark-token"
+        timer = PhaseTimer(fake_server)
+
+        def make_ops():
+            client = api_client.ApiClient(pool_size=max(args.api_concurrency, args.workers))
+            cred_ops = cred_operations.CredOps(fake_server.bitbucket_api, fake_server.github_api, *log_levels, client)
+            repo_ops = repo_operations.RepoOps(fake_server.bitbucket_api, fake_server.github_api, "", "bb-",
+                                               *log_levels, args.push_batch_size, client)
+            return cred_ops, repo_ops
+
+        def discover(cred_ops, repo_ops):
+            to_include, to_exclude = utils.ReadUtils.get_sync_config()
+            project_repositories = {}
+            for project_key in project_repos:
+                cred_ops.check_bitbucket_pull_creds(project_key, access_token)
+                repo_names = repo_ops.get_bitbucket_repos(project_key, access_token)
+                project_repositories[project_key] = repo_ops.populate_team_info(project_key, repo_names, to_include,
+                                                                                to_exclude, access_token)
+            return project_repositories
+
+        def process(repo_ops, project_repositories):
+            processed_repos = []
+            for project_key, repositories in project_repositories.items():
+                processed_repos += repo_ops.process_repos(project_key, repositories, True, access_token, account_id,
+                                                          access_token, args.api_concurrency)[0]
+            return processed_repos
+
+        def sync(repo_ops, processed_repos):
+            return repo_ops.sync_repos(True, processed_repos, account_id, access_token, account_id, access_token,
+                                       args.workers)
+
+        def resync(repo_ops, project_repositories):
+            repo_ops.reset_github_repo_index()
+            return sync(repo_ops, process(repo_ops, project_repositories))
+
+        cred_ops, repo_ops = make_ops()
+        project_repositories = timer.run("discovery", discover, cred_ops, repo_ops)
+        processed_repos = timer.run("process_repos", process, repo_ops, project_repositories)
+        sync_results = timer.run("sync_repos", sync, repo_ops, processed_repos)
+        timer.run("resync", resync, repo_ops, project_repositories)
+        failed_repos = [sync_result["name"] for sync_result in sync_results if (sync_result["result"] != "SUCCESS")]
+
+        # `sync auto` on an empty GitHub
+        shutil.rmtree(os.path.join(server_root, "gh"))
+        os.makedirs(os.path.join(server_root, "gh"))
+        shutil.rmtree(os.path.join(work_dir, "syncDirectory"))
+        fake_server.team_repos = {}
+        cred_ops, repo_ops = make_ops()
+        sync = auto_sync.AutoSync(repo_ops, cred_ops, True, account_id, access_token, account_id, access_token,
+                                  *log_levels, False, args.workers, args.api_concurrency, args.project_concurrency)
+        auto_success = timer.run("auto", sync.run_once)
+        timer.run("auto resync", sync.run_once)
+        fake_server.stop()
+
+        print_results(timer.results, args.verbose)
+        if (failed_repos or not auto_success):
+            print(f"Sync failed: {failed_repos or 'sync auto'}", file=sys.stderr)
+            sys.exit(1)
+        if (args.output):
+            with open(args.output, "w") as output_file:
+                json.dump(timer.results, output_file, indent=2)
+        if (args.compare):
+            with open(args.compare) as baseline_file:
+                regressions = compare_results(timer.results, json.load(baseline_file), args.max_slowdown)
+            for regression in regressions:
+                print(f"Regression: {regression}", file=sys.stderr)
+            if (regressions):
+                sys.exit(1)
+    finally:
+        os.chdir(REPO_DIR)
+        if (args.keep):
+            print(f"Kept {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
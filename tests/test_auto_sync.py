@@ -0,0 +1,86 @@
+# Tests of the stages of the sync auto pipeline of auto_sync.AutoSync
+import threading
+import time
+from types import SimpleNamespace
+
+from app import auto_sync
+from app.auto_sync import AutoSync
+
+
+def make_auto_sync(repo_ops):
+    sync = AutoSync.__new__(AutoSync)
+    sync.repo_ops = repo_ops
+    sync.push_to_org = True
+    sync.github_access_token = "token"
+    sync.api_concurrency = 4
+    sync.team_batch = []
+    sync.team_batch_lock = threading.Lock()
+    sync.done = []
+    sync.add_sync_result = lambda item: sync.done.append(item["repo"]["name"])
+    return sync
+
+
+def make_item(repo_name, teams=None):
+    repo = {"name": repo_name, "github_link": f"https://github.example.com/org/{repo_name}.git"}
+    if (teams):
+        repo["teams"] = teams
+    return {"project_key": "ABC", "repo": repo, "sync_result": {"name": repo_name, "teams": {}}}
+
+
+def test_repositories_are_assigned_to_their_teams_in_batches(monkeypatch):
+    monkeypatch.setattr(auto_sync, "TEAM_BATCH_SIZE", 3)
+    batches = []
+
+    def assign_teams(repositories, sync_results, github_access_token, concurrency):
+        batches.append(([repo["name"] for repo in repositories], concurrency))
+
+    sync = make_auto_sync(SimpleNamespace(assign_teams=assign_teams))
+
+    sync.teams_stage(make_item("no-team"), None)
+    assert sync.done == ["no-team"]
+    for repo_name in ["a", "b", "c", "d"]:
+        sync.teams_stage(make_item(repo_name, ["team-a"]), None)
+    assert batches == [(["a", "b", "c"], 4)]
+    assert sync.done == ["no-team", "a", "b", "c"]
+    # run_once() assigns the rest when the pipeline is done
+    assert [item["repo"]["name"] for item in sync.team_batch] == ["d"]
+
+
+def test_failed_team_assignment_still_finishes_the_repositories():
+    def assign_teams(repositories, sync_results, github_access_token, concurrency):
+        raise RuntimeError("teams unavailable")
+
+    sync = make_auto_sync(SimpleNamespace(assign_teams=assign_teams))
+    sync.log = SimpleNamespace(error=lambda *args, **kwargs: None)
+    sync.assign_teams([make_item("a", ["team-a"]), make_item("b", ["team-b"])])
+    assert sync.done == ["a", "b"]
+
+
+def test_fetches_and_pushes_share_the_workers():
+    running = []
+    most_running = []
+    lock = threading.Lock()
+
+    def run_git(*args):
+        with lock:
+            running.append(True)
+            most_running.append(len(running))
+        time.sleep(0.02)
+        with lock:
+            running.pop()
+        return True
+
+    sync = make_auto_sync(SimpleNamespace(fetch_repo=run_git, push_repo=run_git))
+    sync.git_slots = threading.BoundedSemaphore(2)
+    sync.sync_dir_path = sync.bitbucket_account_id = sync.bitbucket_access_token = sync.github_account_id = None
+    threads = []
+    for index in range(6):
+        fetched_item = dict(make_item(f"fetched-{index}"), needs_push=True)
+        threads.append(threading.Thread(target=sync.fetch_stage, args=(make_item(f"repo-{index}"), lambda item: None)))
+        threads.append(threading.Thread(target=sync.push_stage, args=(fetched_item, lambda item: None)))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(most_running) == 12
+    assert max(most_running) == 2
@@ -0,0 +1,57 @@
+# Tests of the bare repositories of RepoOps under syncDirectory/<project>/<repo>.git
+import os
+import threading
+from types import SimpleNamespace
+
+from sh.contrib import git
+
+from app.api_client import ApiClient
+from app.repo_operations import RepoOps
+
+NO_LOG = SimpleNamespace(debug=lambda *args, **kwargs: None,
+                         info=lambda *args, **kwargs: None,
+                         warning=lambda *args, **kwargs: None,
+                         error=lambda *args, **kwargs: None)
+
+
+def make_repo_ops():
+    repo_ops = RepoOps.__new__(RepoOps)
+    repo_ops.tracer = ApiClient().tracer
+    repo_ops.log = NO_LOG
+    repo_ops.local_repo_lock = threading.Lock()
+    return repo_ops
+
+
+def prepare(repo_ops, sync_dir_path, project_key, repo_name):
+    repo = {
+        "name": repo_name,
+        "project_key": project_key,
+        "bitbucket_link": f"https://bitbucket.example.com/scm/{project_key}/{repo_name}.git"
+    }
+    repo["local_path"] = RepoOps.get_local_repo_path(repo, sync_dir_path)
+    assert repo_ops.prepare_local_repo(repo, sync_dir_path)
+    return git.bake(_cwd=repo["local_path"])
+
+
+def test_repositories_with_the_same_name_in_two_projects_have_their_own_bare_repository(tmp_path):
+    repo_ops = make_repo_ops()
+    abc_git = prepare(repo_ops, str(tmp_path), "ABC", "api")
+    def_git = prepare(repo_ops, str(tmp_path), "DEF", "api")
+    assert os.path.isdir(tmp_path / "ABC" / "api.git") and os.path.isdir(tmp_path / "DEF" / "api.git")
+    assert str(abc_git.remote("get-url", "origin")).strip() == "https://bitbucket.example.com/scm/ABC/api.git"
+    assert str(def_git.remote("get-url", "origin")).strip() == "https://bitbucket.example.com/scm/DEF/api.git"
+
+
+def test_repositories_of_earlier_versions_are_moved_to_the_project_directory(tmp_path):
+    git.init("--bare", str(tmp_path / "api.git"))
+    git.init(str(tmp_path / "web"))
+    repo_ops = make_repo_ops()
+
+    api_git = prepare(repo_ops, str(tmp_path), "ABC", "api")
+    web_git = prepare(repo_ops, str(tmp_path), "ABC", "web")
+    assert sorted(os.listdir(tmp_path)) == ["ABC"]
+    assert sorted(os.listdir(tmp_path / "ABC")) == ["api.git", "web.git"]
+    for repo_git, repo_name in [(api_git, "api"), (web_git, "web")]:
+        assert str(repo_git.config("core.bare")).strip() == "true"
+        assert str(repo_git.remote("get-url",
+                                   "origin")).strip() == f"https://bitbucket.example.com/scm/ABC/{repo_name}.git"
@@ -0,0 +1,89 @@
+# Tests of the stage threads, the shutdown and the error handling of pipeline.Pipeline
+import threading
+
+from app.pipeline import Pipeline
+
+
+# Runs the pipeline on another thread so a pipeline that does not shut down fails the test instead of hanging it
+def run_pipeline(pipeline, items, timeout=5):
+    thread = threading.Thread(target=pipeline.run, args=(items, ), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    return not thread.is_alive()
+
+
+def test_items_pass_through_every_stage():
+    results = []
+    lock = threading.Lock()
+
+    def collect(item, emit):
+        with lock:
+            results.append(item)
+
+    pipeline = Pipeline(queue_size=2)
+    pipeline.add_stage("double", lambda item, emit: emit(item * 2), workers=3)
+    pipeline.add_stage("split", lambda item, emit: [emit(item), emit(item + 1)], workers=2)
+    pipeline.add_stage("collect", collect, workers=4)
+    assert run_pipeline(pipeline, range(100))
+    assert sorted(results) == sorted([i * 2 for i in range(100)] + [i * 2 + 1 for i in range(100)])
+
+
+def test_returns_without_items():
+    pipeline = Pipeline()
+    pipeline.add_stage("first", lambda item, emit: emit(item), workers=2)
+    pipeline.add_stage("second", lambda item, emit: None, workers=3)
+    assert run_pipeline(pipeline, [])
+    assert pipeline.get_queue_sizes() == [("first", 0), ("second", 0)]
+
+
+def test_stage_errors_are_passed_to_on_error_and_other_items_go_on():
+    errors = []
+    results = []
+
+    def fail_on_odd(item, emit):
+        if (item % 2):
+            raise ValueError(item)
+        emit(item)
+
+    pipeline = Pipeline(on_error=lambda stage_name, item, e: errors.append((stage_name, item, type(e))))
+    pipeline.add_stage("check", fail_on_odd, workers=2)
+    pipeline.add_stage("collect", lambda item, emit: results.append(item))
+    assert run_pipeline(pipeline, range(10))
+    assert sorted(errors) == [("check", item, ValueError) for item in [1, 3, 5, 7, 9]]
+    assert sorted(results) == [0, 2, 4, 6, 8]
+
+
+def test_shuts_down_when_on_error_raises():
+    results = []
+
+    def fail_on_odd(item, emit):
+        if (item % 2):
+            raise ValueError(item)
+        emit(item)
+
+    def on_error(stage_name, item, e):
+        raise RuntimeError("on_error failed")
+
+    pipeline = Pipeline(queue_size=1, on_error=on_error)
+    pipeline.add_stage("check", fail_on_odd, workers=2)
+    pipeline.add_stage("collect", lambda item, emit: results.append(item))
+    assert run_pipeline(pipeline, range(10))
+    assert sorted(results) == [0, 2, 4, 6, 8]
+
+
+def test_reports_the_items_waiting_for_each_stage():
+    release = threading.Event()
+    pipeline = Pipeline(queue_size=10)
+    pipeline.add_stage("first", lambda item, emit: emit(item))
+    pipeline.add_stage("blocked", lambda item, emit: release.wait(5))
+    thread = threading.Thread(target=pipeline.run, args=(range(4), ), daemon=True)
+    thread.start()
+    # The blocked stage holds one item, the other 3 and the end of the items wait in its queue
+    for _ in range(100):
+        if (pipeline.get_queue_sizes() == [("first", 0), ("blocked", 4)]):
+            break
+        release.wait(0.01)
+    assert pipeline.get_queue_sizes() == [("first", 0), ("blocked", 4)]
+    release.set()
+    thread.join(5)
+    assert not thread.is_alive()
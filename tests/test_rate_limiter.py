@@ -0,0 +1,120 @@
+# Tests of the per-host request scheduling of rate_limiter.RateLimiter
+import email.utils
+import threading
+import time
+from types import SimpleNamespace
+
+from app.rate_limiter import RateLimiter
+
+
+def make_response(status_code=200, headers=None, text=""):
+    return SimpleNamespace(status_code=status_code, headers=headers or {}, text=text)
+
+
+def test_detects_rate_limited_responses():
+    assert RateLimiter.is_rate_limited(make_response(429))
+    assert RateLimiter.is_rate_limited(make_response(403, {"X-RateLimit-Remaining": "0"}))
+    assert RateLimiter.is_rate_limited(make_response(403, text="API rate limit exceeded for user"))
+    assert RateLimiter.is_rate_limited(make_response(503, {"Retry-After": "5"}))
+    # GitHub also answers 403 for missing permissions
+    assert not RateLimiter.is_rate_limited(make_response(403, {"X-RateLimit-Remaining": "10"},
+                                                         "Must have admin rights"))
+    assert not RateLimiter.is_rate_limited(make_response(503))
+    assert not RateLimiter.is_rate_limited(make_response(200, {"X-RateLimit-Remaining": "0"}))
+
+
+def test_reads_retry_after_in_seconds_or_as_a_date():
+    assert RateLimiter.get_retry_after(make_response(429, {"Retry-After": "12"})) == 12
+    retry_date = email.utils.formatdate(time.time() + 30, usegmt=True)
+    assert 28 <= RateLimiter.get_retry_after(make_response(429, {"Retry-After": retry_date})) <= 31
+    assert RateLimiter.get_retry_after(make_response(429, {"Retry-After": "soon"})) is None
+    assert RateLimiter.get_retry_after(make_response(429)) is None
+
+
+def test_rate_limited_response_pauses_and_halves_concurrency():
+    rate_limiter = RateLimiter(8)
+    assert rate_limiter.update(make_response(429, {"Retry-After": "0.2"})) == 0.2
+    assert rate_limiter.concurrency_limit == 4
+    # Responses to requests sent before the pause do not halve the limit again
+    rate_limiter.update(make_response(429, {"Retry-After": "0.2"}))
+    assert rate_limiter.concurrency_limit == 4
+
+    start = time.monotonic()
+    rate_limiter.acquire()
+    assert time.monotonic() - start >= 0.15
+    rate_limiter.release()
+
+
+def test_waits_until_the_rate_limit_resets_without_retry_after():
+    rate_limiter = RateLimiter(4)
+    reset = str(int(time.time()) + 20)
+    wait = rate_limiter.update(make_response(403, {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": reset}))
+    assert 19 <= wait <= 22
+    # Secondary rate limits without any header back off for a minute, then twice as long
+    rate_limiter = RateLimiter(4, max_wait=3600)
+    assert rate_limiter.update(make_response(403, text="secondary rate limit")) == 60
+    assert rate_limiter.update(make_response(403, text="secondary rate limit")) == 120
+    assert RateLimiter(4, max_wait=30).update(make_response(429)) == 30
+
+
+def test_concurrency_grows_back_after_successful_requests():
+    rate_limiter = RateLimiter(4)
+    rate_limiter.update(make_response(429, {"Retry-After": "0"}))
+    assert rate_limiter.concurrency_limit == 2
+    for _ in range(2):
+        assert rate_limiter.update(make_response(200)) is None
+    assert rate_limiter.concurrency_limit == 3
+    for _ in range(3):
+        rate_limiter.update(make_response(200))
+    assert rate_limiter.concurrency_limit == 4
+    for _ in range(10):
+        rate_limiter.update(make_response(200))
+    assert rate_limiter.concurrency_limit == 4
+
+
+def test_limits_concurrent_requests():
+    rate_limiter = RateLimiter(1)
+    rate_limiter.acquire()
+    acquired = threading.Event()
+
+    def acquire():
+        rate_limiter.acquire()
+        acquired.set()
+
+    threading.Thread(target=acquire, daemon=True).start()
+    assert not acquired.wait(0.1)
+    rate_limiter.release()
+    assert acquired.wait(1)
+    rate_limiter.release()
+
+
+def test_limits_requests_per_second():
+    rate_limiter = RateLimiter(10, requests_per_second=20)
+    start = time.monotonic()
+    for _ in range(5):
+        rate_limiter.acquire()
+        rate_limiter.release()
+    # The first request uses the initial token, the next 4 wait for 1/20 s each
+    assert time.monotonic() - start >= 0.18
+
+
+def test_spreads_the_remaining_requests_when_the_limit_runs_low():
+    rate_limiter = RateLimiter(4)
+    reset = str(int(time.time()) + 100)
+    rate_limiter.update(
+        make_response(200, {
+            "X-RateLimit-Limit": "5000",
+            "X-RateLimit-Remaining": "4000",
+            "X-RateLimit-Reset": reset
+        }))
+    assert rate_limiter.get_rate() is None
+    rate_limiter.update(
+        make_response(200, {
+            "X-RateLimit-Limit": "5000",
+            "X-RateLimit-Remaining": "200",
+            "X-RateLimit-Reset": reset
+        }))
+    assert 1.9 <= rate_limiter.get_rate() <= 2.1
+    # The configured rate applies when it is lower
+    rate_limiter.requests_per_second = 1
+    assert rate_limiter.get_rate() == 1
@@ -0,0 +1,233 @@
+# Tests of utils.RepoMatcher against the include/exclude semantics of the old populate_team_info()
+import random
+from collections.abc import Mapping
+
+from app import utils
+from app.repo_operations import RepoOps
+
+PROJECT_KEY = "ABC"
+REPO_NAMES = ["api", "api-v2", "web", "web-ui", "core", "core-lib", "tools", "docs", "app1", "app2", "app10"]
+EXACT_NAMES = REPO_NAMES + ["missing"]
+PATTERNS = ["api.*", "web", "core-.*", ".*-v2", "app[0-9]", "app\\d+$", "d", "t.*s", "(api|web)$", "nothing"]
+# Teams on the org, "ghost" is mentioned in configs but does not exist
+TEAM_IDS = {"team-a": 1, "team-b": 2}
+TEAMS = ["team-a", "team-b", "ghost"]
+
+
+# The include/exclude matching of populate_team_info() before RepoMatcher, without the logging and the API calls
+def old_select_repos(project_key, bitbucket_repo_names, to_include, to_exclude, teams_list):
+    repositories = []
+    repository_team_mapping = {}
+    if to_include is None:
+        return repositories
+    include_regex = to_include["regex"] if ("regex" in to_include) else False
+    include_config = to_include["repo_config"] if ("repo_config" in to_include) else to_include
+    project_include_config = include_config[project_key] if (project_key in include_config) else []
+    if not project_include_config:
+        return repositories
+    project_regex = project_include_config["regex"] if ("regex" in project_include_config) else include_regex
+    project_include_config = project_include_config["repo_config"] if (
+        "repo_config" in project_include_config) else project_include_config
+    for repo_or_team in project_include_config:
+        if isinstance(repo_or_team, str):
+            if (not project_regex):
+                filtered_repo_list = utils.RegexUtils.filter_repos(bitbucket_repo_names, [f"^{repo_or_team}$"])
+                if (filtered_repo_list and (repo_or_team not in repository_team_mapping)):
+                    repository_team_mapping[repo_or_team] = []
+            else:
+                for repo_name in utils.RegexUtils.filter_repos(bitbucket_repo_names, [repo_or_team]):
+                    if (repo_name not in repository_team_mapping):
+                        repository_team_mapping[repo_name] = []
+        elif isinstance(repo_or_team, Mapping):
+            for team_name, team_config in repo_or_team.items():
+                team_regex = team_config["regex"] if ("regex" in team_config) else project_regex
+                repo_names = team_config["repo_config"] if ("repo_config" in team_config) else team_config
+                team_found = team_name in teams_list
+                if (not team_regex):
+                    for repo_name in repo_names:
+                        filtered_repo_list = utils.RegexUtils.filter_repos(bitbucket_repo_names, [f"^{repo_name}$"])
+                        if (filtered_repo_list and (repo_name not in repository_team_mapping)):
+                            repository_team_mapping[repo_name] = [team_name] if team_found else []
+                        elif (filtered_repo_list):
+                            repository_team_mapping[repo_name] += [team_name] if team_found else []
+                else:
+                    for repo_name in utils.RegexUtils.filter_repos(bitbucket_repo_names, repo_names):
+                        if (repo_name not in repository_team_mapping):
+                            repository_team_mapping[repo_name] = [team_name] if team_found else []
+                        else:
+                            repository_team_mapping[repo_name] += [team_name] if team_found else []
+    for repo_name, team_names in repository_team_mapping.items():
+        if (team_names):
+            repositories.append({"name": repo_name, "teams": team_names})
+        else:
+            repositories.append({"name": repo_name})
+
+    if (to_exclude is None):
+        return repositories
+    exclude_regex = to_exclude["regex"] if ("regex" in to_exclude) else False
+    exclude_config = to_exclude["repo_config"] if ("repo_config" in to_exclude) else to_exclude
+    project_exclude_config = exclude_config[project_key] if (project_key in exclude_config) else []
+    if not project_exclude_config:
+        return repositories
+    project_exclude_regex = project_exclude_config["regex"] if ("regex" in project_exclude_config) else exclude_regex
+    project_exclude_config = project_exclude_config["repo_config"] if (
+        "repo_config" in project_exclude_config) else project_exclude_config
+    if (not project_exclude_regex):
+        project_exclude_config = [f"^{repo_name}$" for repo_name in project_exclude_config]
+    return utils.RegexUtils.filter_repo_dicts(repositories, project_exclude_config, exclude_matches=True)
+
+
+def new_select_repos(project_key, repo_names, to_include, to_exclude):
+    repo_matcher = utils.RepoMatcher(project_key, to_include, to_exclude)
+    # select_repos() does not use the RepoOps object
+    return RepoOps.select_repos(None, repo_matcher, repo_names, TEAM_IDS)[0]
+
+
+def random_names(rng, regex, count):
+    return [rng.choice(PATTERNS if (regex) else EXACT_NAMES) for _ in range(count)]
+
+
+# Returns a level of the config (a list, or a list wrapped in "repo_config" with or without its own "regex") and
+# whether its names are regexes. make_list(regex) makes the list of the level
+def random_level(rng, parent_regex, make_list):
+    form = rng.randrange(3)
+    if (form == 0):
+        return make_list(parent_regex), parent_regex
+    if (form == 1):
+        return {"repo_config": make_list(parent_regex)}, parent_regex
+    regex = rng.random() < 0.5
+    return {"regex": regex, "repo_config": make_list(regex)}, regex
+
+
+def random_project_include(rng, project_regex):
+    project_config = []
+    for _ in range(rng.randint(0, 5)):
+        if (rng.random() < 0.6):
+            project_config += random_names(rng, project_regex, 1)
+            continue
+        team_config = {}
+        for team_name in rng.sample(TEAMS, rng.randint(1, 2)):
+            # Empty regex lists of teams are covered by test_empty_regex_team_list_matches_nothing()
+            team_config[team_name] = random_level(rng, project_regex,
+                                                  lambda regex: random_names(rng, regex, rng.randint(1, 3)))[0]
+        project_config.append(team_config)
+    return project_config
+
+
+# Returns random include and exclude configs, the old implementation only excluded anything with a single exclude
+# entry, so there is at most one
+def random_config(rng):
+    include_regex = rng.random() < 0.5
+    project_include = random_level(rng, include_regex, lambda regex: random_project_include(rng, regex))[0]
+    to_include = {"regex": include_regex, "repo_config": {PROJECT_KEY: project_include}}
+    if (not include_regex and rng.random() < 0.5):
+        to_include = {PROJECT_KEY: project_include}
+
+    to_exclude = None
+    if (rng.random() < 0.6):
+        exclude_regex = rng.random() < 0.5
+        project_exclude = random_level(rng, exclude_regex, lambda regex: random_names(rng, regex, rng.randint(0, 1)))[0]
+        to_exclude = {"regex": exclude_regex, "repo_config": {PROJECT_KEY: project_exclude}}
+        if (not exclude_regex and rng.random() < 0.5):
+            to_exclude = {PROJECT_KEY: project_exclude}
+    return to_include, to_exclude
+
+
+def test_matches_old_implementation_on_random_configs():
+    rng = random.Random(13)
+    for _ in range(2000):
+        to_include, to_exclude = random_config(rng)
+        repo_names = rng.sample(REPO_NAMES, rng.randint(0, len(REPO_NAMES)))
+        assert new_select_repos(PROJECT_KEY, repo_names, to_include,
+                                to_exclude) == old_select_repos(PROJECT_KEY, repo_names, to_include, to_exclude,
+                                                                list(TEAM_IDS)), (to_include, to_exclude, repo_names)
+
+
+def test_keeps_config_order_and_sorts_names_matched_by_a_pattern():
+    to_include = {"regex": True, "repo_config": {PROJECT_KEY: ["web", "app.*", {"team-a": ["api", "core"]}]}}
+    repositories = new_select_repos(PROJECT_KEY, ["core", "app2", "api", "app1", "web"], to_include, None)
+    assert repositories == [{
+        "name": "web"
+    }, {
+        "name": "app1"
+    }, {
+        "name": "app2"
+    }, {
+        "name": "api",
+        "teams": ["team-a"]
+    }, {
+        "name": "core",
+        "teams": ["team-a"]
+    }]
+
+
+def test_combines_patterns_that_can_not_be_combined_separately():
+    to_include = {"regex": True, "repo_config": {PROJECT_KEY: [r"(a)\1", "(?i)WEB", "core"]}}
+    repositories = new_select_repos(PROJECT_KEY, ["aa", "ab", "web", "core"], to_include, None)
+    assert [repo["name"] for repo in repositories] == ["aa", "web", "core"]
+
+
+def test_patterns_with_the_same_group_name_are_matched_separately():
+    to_include = {"regex": True, "repo_config": {PROJECT_KEY: ["(?P<kind>api)-.*", "(?P<kind>web)-.*", "core"]}}
+    to_exclude = {"regex": True, "repo_config": {PROJECT_KEY: ["(?P<old>.*)-v1", "(?P<old>.*)-legacy"]}}
+    repo_names = ["api-v1", "api-v2", "web-legacy", "web-ui", "core", "docs"]
+    repositories = new_select_repos(PROJECT_KEY, repo_names, to_include, to_exclude)
+    assert [repo["name"] for repo in repositories] == ["api-v2", "web-ui", "core"]
+
+
+def test_reports_exact_names_not_found():
+    to_include = {PROJECT_KEY: ["api", "missing", {"team-a": ["gone"]}]}
+    repo_matcher = utils.RepoMatcher(PROJECT_KEY, to_include, None)
+    repository_team_mapping, not_found = repo_matcher.match(["api", "web"])
+    assert list(repository_team_mapping) == ["api"]
+    assert [rule["name"] for rule in not_found] == ["missing", "gone"]
+
+
+# Behaviour changes from the old implementation
+
+
+def test_exact_names_only_match_themselves():
+    to_include = {PROJECT_KEY: ["a.b", "c+"]}
+    assert new_select_repos(PROJECT_KEY, ["a.b", "axb", "c+"], to_include, None) == [{"name": "a.b"}, {"name": "c+"}]
+    assert new_select_repos(PROJECT_KEY, ["axb", "cc"], to_include, None) == []
+    # The old implementation used the names as regexes, "c+" did not match itself and names that are not on
+    # BitBucket were selected when another name matched
+    assert old_select_repos(PROJECT_KEY, ["a.b", "axb", "c+"], to_include, None, []) == [{"name": "a.b"}]
+    assert old_select_repos(PROJECT_KEY, ["axb", "cc"], to_include, None, []) == [{"name": "a.b"}, {"name": "c+"}]
+
+
+def test_repository_matching_any_exclude_entry_is_excluded():
+    to_include = {"regex": True, "repo_config": {PROJECT_KEY: [".*"]}}
+    for to_exclude in [{PROJECT_KEY: ["api", "web"]}, {"regex": True, "repo_config": {PROJECT_KEY: ["api.*", "web"]}}]:
+        repositories = new_select_repos(PROJECT_KEY, ["api", "core", "web"], to_include, to_exclude)
+        assert repositories == [{"name": "core"}]
+        # With two or more exclude entries, the old implementation excluded nothing
+        assert len(old_select_repos(PROJECT_KEY, ["api", "core", "web"], to_include, to_exclude, [])) == 3
+
+
+def test_teams_are_only_fetched_when_the_project_assigns_teams():
+    fetched = []
+    repo_ops = RepoOps.__new__(RepoOps)
+    repo_ops.log = None
+    repo_ops.get_team_ids = lambda github_access_token: fetched.append(github_access_token) or dict(TEAM_IDS)
+
+    repo_matcher = utils.RepoMatcher(PROJECT_KEY, {PROJECT_KEY: ["api"]}, None)
+    assert repo_ops.get_config_team_ids(PROJECT_KEY, repo_matcher, "token") == {}
+    assert fetched == []
+
+    repo_matcher = utils.RepoMatcher(PROJECT_KEY, {PROJECT_KEY: [{"team-a": ["api"]}]}, None)
+    assert repo_ops.get_config_team_ids(PROJECT_KEY, repo_matcher, "token") == TEAM_IDS
+    assert fetched == ["token"]
+
+
+def test_empty_regex_team_list_matches_nothing():
+    to_include = {"regex": True, "repo_config": {PROJECT_KEY: ["api", {"team-a": []}]}}
+    assert new_select_repos(PROJECT_KEY, ["api", "web"], to_include, None) == [{"name": "api"}]
+    # The old implementation assigned every repository of the project to the team
+    assert old_select_repos(PROJECT_KEY, ["api", "web"], to_include, None, list(TEAM_IDS)) == [{
+        "name": "api",
+        "teams": ["team-a"]
+    }, {
+        "name": "web",
+        "teams": ["team-a"]
+    }]
@@ -0,0 +1,197 @@
+# Tests of the retry policy and circuit breakers of retry.py, and of their use by the git commands of RepoOps
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+import requests
+import sh
+
+from app.api_client import ApiClient
+from app.rate_limiter import RateLimiter
+from app.repo_operations import RepoOps
+from app.retry import CircuitBreaker, CircuitBreakers, CircuitOpenError, RetryPolicy
+
+NO_LOG = SimpleNamespace(debug=lambda *args, **kwargs: None,
+                         info=lambda *args, **kwargs: None,
+                         warning=lambda *args, **kwargs: None,
+                         error=lambda *args, **kwargs: None)
+
+
+def git_error(stderr):
+    return sh.ErrorReturnCode_128("git push", b"", stderr.encode("utf-8"))
+
+
+def test_backoff_delay_is_capped_with_full_jitter():
+    retry_policy = RetryPolicy(max_retries=5, base_delay=1.0, max_delay=4.0)
+    for attempt in range(6):
+        delays = [retry_policy.get_delay(attempt) for _ in range(200)]
+        assert 0 <= min(delays) and max(delays) <= min(4.0, 2**attempt)
+
+
+def test_retries_errors_only_when_sending_again_is_safe():
+    assert RetryPolicy.is_retryable_error("POST", requests.exceptions.ConnectTimeout())
+    assert RetryPolicy.is_retryable_error("GET", requests.exceptions.ReadTimeout())
+    assert RetryPolicy.is_retryable_error("PUT", requests.exceptions.ConnectionError("reset"))
+    # The request may have reached the server
+    assert not RetryPolicy.is_retryable_error("POST", requests.exceptions.ReadTimeout())
+    assert not RetryPolicy.is_retryable_error("GET", CircuitOpenError("open"))
+    assert not RetryPolicy.is_retryable_error("GET", ValueError())
+
+
+def test_retries_server_errors_of_idempotent_requests():
+    assert RetryPolicy.is_retryable_response("GET", SimpleNamespace(status_code=503))
+    assert not RetryPolicy.is_retryable_response("POST", SimpleNamespace(status_code=503))
+    assert not RetryPolicy.is_retryable_response("GET", SimpleNamespace(status_code=404))
+
+
+def test_detects_transient_git_errors():
+    assert RetryPolicy.is_transient_git_error(git_error("fatal: unable to access: Failed to connect to host"))
+    assert RetryPolicy.is_transient_git_error(git_error("error: RPC failed; HTTP 502 curl 22"))
+    assert not RetryPolicy.is_transient_git_error(git_error("! [rejected] master -> master (non-fast-forward)"))
+    assert not RetryPolicy.is_transient_git_error(git_error("fatal: Authentication failed"))
+
+
+def test_circuit_opens_after_consecutive_failures():
+    circuit_breaker = CircuitBreaker("host", failure_threshold=3, reset_timeout=60, max_wait=0)
+    for _ in range(2):
+        circuit_breaker.record_failure()
+    circuit_breaker.record_success()
+    for _ in range(2):
+        circuit_breaker.record_failure()
+    circuit_breaker.before_request()
+    circuit_breaker.record_failure()
+    assert circuit_breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        circuit_breaker.before_request()
+
+
+def test_half_open_circuit_lets_one_probe_through():
+    circuit_breaker = CircuitBreaker("host", failure_threshold=1, reset_timeout=0.1, max_timeout=10, max_wait=5)
+    circuit_breaker.record_failure()
+    start = time.monotonic()
+    circuit_breaker.before_request()
+    assert time.monotonic() - start >= 0.09
+    assert circuit_breaker.state == "half-open"
+
+    # Other requests wait for the probe
+    probed = threading.Event()
+
+    def request():
+        circuit_breaker.before_request()
+        probed.set()
+
+    threading.Thread(target=request, daemon=True).start()
+    assert not probed.wait(0.2)
+    circuit_breaker.record_success()
+    assert probed.wait(1)
+    assert circuit_breaker.state == "closed"
+
+
+def test_failed_probe_opens_the_circuit_for_longer():
+    circuit_breaker = CircuitBreaker("host", failure_threshold=1, reset_timeout=0.05, max_timeout=0.15, max_wait=5)
+    circuit_breaker.record_failure()
+    for open_timeout in [0.1, 0.15, 0.15]:
+        circuit_breaker.before_request()
+        circuit_breaker.record_failure()
+        assert circuit_breaker.state == "open"
+        assert circuit_breaker.open_timeout == open_timeout
+
+
+def test_circuit_breaker_is_disabled_without_threshold():
+    circuit_breaker = CircuitBreaker("host", failure_threshold=0)
+    for _ in range(10):
+        circuit_breaker.record_failure()
+    circuit_breaker.before_request()
+    assert circuit_breaker.state == "closed"
+
+
+def test_probe_that_raises_an_unexpected_error_reopens_the_circuit():
+    api_client = ApiClient(circuit_breakers=CircuitBreakers(failure_threshold=1, reset_timeout=0.05))
+    circuit_breaker = api_client.circuit_breakers.get("github.example.com")
+    circuit_breaker.record_failure()
+    requests_sent = []
+
+    def request(method, url, **kwargs):
+        requests_sent.append(url)
+        if (len(requests_sent) == 1):
+            raise ValueError("unexpected")
+        return SimpleNamespace(status_code=200, headers={}, text="")
+
+    api_client.get_session = lambda url: (SimpleNamespace(request=request), RateLimiter(1))
+    with pytest.raises(ValueError):
+        api_client.send_request("GET", "https://github.example.com/api/v3/user")
+    assert circuit_breaker.state == "open" and not circuit_breaker.probing
+    # The next request probes the host once the circuit is half-open again, instead of waiting for the first probe
+    assert api_client.send_request("GET", "https://github.example.com/api/v3/user").status_code == 200
+    assert circuit_breaker.state == "closed"
+
+
+def make_repo_ops(push_batch_size=0):
+    repo_ops = RepoOps.__new__(RepoOps)
+    repo_ops.api_client = ApiClient(retry_policy=RetryPolicy(max_retries=2, base_delay=0.01, max_delay=0.01))
+    repo_ops.tracer = repo_ops.api_client.tracer
+    repo_ops.metrics = repo_ops.api_client.metrics
+    repo_ops.log = NO_LOG
+    repo_ops.push_batch_size = push_batch_size
+    return repo_ops
+
+
+def test_git_commands_are_retried_on_transient_errors():
+    repo_ops = make_repo_ops()
+    attempts = []
+
+    def git_command(*args):
+        attempts.append(args)
+        if (len(attempts) < 3):
+            raise git_error("fatal: unable to access: Could not resolve host: github.example.com")
+        return SimpleNamespace(stderr=b"")
+
+    repo_ops.run_remote_git("ls-remote", "https://github.example.com/org/repo.git", git_command, "ls-remote")
+    assert len(attempts) == 3
+
+
+def test_git_commands_are_not_retried_when_the_host_answered():
+    repo_ops = make_repo_ops()
+    attempts = []
+
+    def git_command(*args):
+        attempts.append(args)
+        raise git_error("! [rejected] master -> master (non-fast-forward)")
+
+    with pytest.raises(sh.ErrorReturnCode):
+        repo_ops.run_remote_git("push", "https://github.example.com/org/repo.git", git_command, "--progress")
+    assert len(attempts) == 1
+
+
+def test_git_probe_that_raises_an_unexpected_error_reopens_the_circuit():
+    repo_ops = make_repo_ops()
+    circuit_breaker = repo_ops.api_client.circuit_breakers.get("github.example.com")
+    circuit_breaker.reset_timeout = circuit_breaker.open_timeout = 0.05
+    for _ in range(circuit_breaker.failure_threshold):
+        circuit_breaker.record_failure()
+
+    def git_command(*args):
+        raise OSError("no such directory")
+
+    with pytest.raises(OSError):
+        repo_ops.run_remote_git("push", "https://github.example.com/org/repo.git", git_command, "--progress")
+    assert circuit_breaker.state == "open" and not circuit_breaker.probing
+    repo_ops.run_remote_git("ls-remote", "https://github.example.com/org/repo.git", lambda *args: None)
+    assert circuit_breaker.state == "closed"
+
+
+def test_refs_fail_without_being_pushed_while_the_circuit_is_open():
+    repo_ops = make_repo_ops(push_batch_size=2)
+    circuit_breaker = repo_ops.api_client.circuit_breakers.get("github.example.com")
+    circuit_breaker.max_wait = 0
+    for _ in range(circuit_breaker.failure_threshold):
+        circuit_breaker.record_failure()
+    pushes = []
+    repo_git = SimpleNamespace(push=lambda *args: pushes.append(args))
+
+    push_errors = repo_ops.push_refspecs(repo_git, "https://github.example.com/org/repo.git", ["a:a", "b:b", "c:c"])
+    assert pushes == []
+    assert list(push_errors) == ["a:a", "b:b", "c:c"]
+    assert all(isinstance(error, CircuitOpenError) for error in push_errors.values())
+    assert RepoOps.get_git_error_details(push_errors["a:a"]) == {"error": str(push_errors["a:a"])}
@@ -0,0 +1,112 @@
+# Tests of the event debouncing and the HTTP handling of webhook.WebhookListener
+import hashlib
+import hmac
+import json
+import time
+
+import pytest
+import requests
+
+from app.webhook import WebhookListener
+
+DEBOUNCE = 0.1
+
+
+@pytest.fixture
+def listener(tmp_path, monkeypatch):
+    # The logger writes its log file to logs/ in the working directory
+    monkeypatch.chdir(tmp_path)
+    return WebhookListener("127.0.0.1", 0, "secret", DEBOUNCE, "error", True, "error")
+
+
+def make_event(repo_name, *changes):
+    return {
+        "eventKey": "repo:refs_changed",
+        "repository": {
+            "name": repo_name,
+            "project": {
+                "key": "ABC"
+            }
+        },
+        "changes": [{
+            "ref": {
+                "id": ref
+            },
+            "refId": ref,
+            "type": change_type
+        } for ref, change_type in changes]
+    }
+
+
+def wait_for_due_events(listener, timeout=2):
+    deadline = time.monotonic() + timeout
+    while (time.monotonic() < deadline):
+        due_events = listener.pop_due_events()
+        if (due_events):
+            return due_events
+        time.sleep(0.01)
+    return []
+
+
+def test_events_of_a_repository_are_coalesced_until_the_burst_ends(listener):
+    woken = []
+    listener.on_event = lambda: woken.append(True)
+    assert listener.add_event("repo:refs_changed", make_event("api", ("refs/heads/master", "UPDATE"))) == 202
+    assert listener.add_event("repo:refs_changed",
+                              make_event("api", ("refs/tags/v1", "ADD"), ("refs/heads/old", "DELETE"))) == 202
+    assert listener.add_event("repo:refs_changed", make_event("web", ("refs/heads/dev", "ADD"))) == 202
+    assert len(woken) == 3
+    assert listener.pop_due_events() == []
+    assert listener.get_next_due() > time.monotonic()
+
+    due_events = sorted(wait_for_due_events(listener) + wait_for_due_events(listener, DEBOUNCE))
+    # Deleted refs are not synced
+    assert [(project_key, repo_name, sorted(changed_refs)) for project_key, repo_name, changed_refs in due_events
+            ] == [("ABC", "api", ["refs/heads/master", "refs/tags/v1"]), ("ABC", "web", ["refs/heads/dev"])]
+    assert listener.get_next_due() is None
+
+
+def test_ref_deleted_then_recreated_is_synced(listener):
+    listener.add_event("repo:refs_changed", make_event("api", ("refs/heads/dev", "DELETE")))
+    listener.add_event("repo:refs_changed", make_event("api", ("refs/heads/dev", "ADD")))
+    assert wait_for_due_events(listener) == [("ABC", "api", ["refs/heads/dev"])]
+
+
+def test_events_are_due_at_most_5_debounces_after_the_first_one(listener):
+    listener.add_event("repo:refs_changed", make_event("api", ("refs/heads/master", "UPDATE")))
+    first_due = listener.get_next_due()
+    start = time.monotonic()
+    while (time.monotonic() - start < 7 * DEBOUNCE):
+        listener.add_event("repo:refs_changed", make_event("api", ("refs/heads/master", "UPDATE")))
+        time.sleep(DEBOUNCE / 4)
+    # A continuous burst of events would otherwise never be due
+    assert listener.get_next_due() <= first_due + 4 * DEBOUNCE + 0.01
+    assert listener.pop_due_events() == [("ABC", "api", ["refs/heads/master"])]
+
+
+def test_ignores_other_events_and_rejects_invalid_ones(listener):
+    assert listener.add_event("diagnostics:ping", {}) == 200
+    assert listener.add_event("repo:modified", make_event("api")) == 200
+    assert listener.add_event("repo:refs_changed", {"repository": {"name": "api"}}) == 400
+    assert listener.add_event("repo:refs_changed", make_event("api", ("refs/pull-requests/1/from", "UPDATE"))) == 202
+    assert wait_for_due_events(listener) == [("ABC", "api", [])]
+
+
+def test_checks_the_signature_of_requests(listener):
+    listener.start()
+    try:
+        url = f"http://127.0.0.1:{listener.server.server_address[1]}/"
+        payload = json.dumps(make_event("api", ("refs/heads/master", "UPDATE"))).encode("utf-8")
+        signature = "sha256=" + hmac.new(b"secret", payload, hashlib.sha256).hexdigest()
+
+        assert requests.post(url, data=payload).status_code == 401
+        assert requests.post(url, data=payload, headers={"X-Hub-Signature": "sha256=0"}).status_code == 401
+        assert requests.post(url, data=payload, headers={"X-Hub-Signature": signature}).status_code == 202
+        invalid_payload = b"not json"
+        invalid_signature = "sha256=" + hmac.new(b"secret", invalid_payload, hashlib.sha256).hexdigest()
+        assert requests.post(url, data=invalid_payload, headers={
+            "X-Hub-Signature": invalid_signature
+        }).status_code == 400
+    finally:
+        listener.stop()
+    assert wait_for_due_events(listener) == [("ABC", "api", ["refs/heads/master"])]